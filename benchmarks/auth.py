@@ -0,0 +1,75 @@
+"""
+Benchmark the cost of authenticating one request.
+
+Tokens are ES256 like the Privy ones, signed with a key generated for the run.
+The previous path is compared with the current one: `jwt.decode` with the
+PEM string against the pre-parsed key, a cold and a warm verified-token cache
+in `verify_authorization_header`, and the API key list against the digest set.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/auth.py [iterations]
+"""
+import sys
+import time
+from unittest.mock import patch
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from starlette.requests import Request
+
+from app.api.helper import auth
+from app.config import get_settings
+
+APP_ID = "benchmark-app"
+N_API_KEYS = 50
+
+def timed(label: str, iterations: int, fn):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{label:<40} {elapsed * 1e6:10.1f} us/request")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    token = jwt.encode(
+        {"sub": "did:privy:benchmark", "iss": "privy.io", "aud": APP_ID, "exp": int(time.time()) + 3600},
+        private_key,
+        algorithm="ES256",
+    )
+    api_keys = [f"api-key-{i:04d}-" + "x" * 40 for i in range(N_API_KEYS)]
+    request = Request(scope={"type": "http", "method": "GET", "path": "/", "headers": [], "client": ("127.0.0.1", 0)})
+    decode_args = dict(issuer="privy.io", audience=APP_ID, algorithms=["ES256"], options={"verify_exp": True})
+
+    settings = get_settings()
+    with patch.object(settings, "JWT_PUB_KEY", public_pem), \
+         patch.object(settings, "JWT_ALGORITHM", "ES256"), \
+         patch.object(settings, "APP_ID", APP_ID), \
+         patch.object(settings, "API_KEYS", api_keys):
+        print(f"{iterations} iterations, ES256 tokens, {N_API_KEYS} API keys\n")
+
+        timed("jwt.decode with PEM (previous)", iterations, lambda: jwt.decode(token, public_pem, **decode_args))
+        parsed_key = auth._load_jwt_key(public_pem, "ES256")
+        timed("jwt.decode with parsed key", iterations, lambda: jwt.decode(token, parsed_key, **decode_args))
+
+        def cold():
+            auth._verified_token_cache_instance = auth.VerifiedTokenCache(maxsize=0)
+            auth.verify_authorization_header(request, f"Bearer {token}")
+
+        timed("verify_authorization_header, no cache", iterations, cold)
+        auth._verified_token_cache_instance = auth.VerifiedTokenCache(maxsize=1000)
+        timed("verify_authorization_header, cached", iterations, lambda: auth.verify_authorization_header(request, f"Bearer {token}"))
+
+        last_key = api_keys[-1]
+        timed("API key in list (previous)", iterations, lambda: last_key in api_keys)
+        timed("verify_authorization_header, API key", iterations, lambda: auth.verify_authorization_header(request, f"Bearer {last_key}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark SSE streaming throughput through the identity-proof middleware.
+
+A streaming endpoint sends many small SSE events, and the app is called
+directly over ASGI, so the numbers show only the middleware overhead. Three
+stacks are compared: no middleware, the previous `prove_server_identity`
+function on Starlette's BaseHTTPMiddleware, and the pure ASGI
+ProveServerIdentityMiddleware. Each request carries a challenge, so every
+response is signed with a key generated for the run.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/identity_middleware.py [events] [requests]
+"""
+import asyncio
+import secrets
+import sys
+import time
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app import middleware
+
+EVENT = "data: " + "{\"choices\": [{\"delta\": {\"content\": \"token\"}}]}" + "\n\n"
+
+async def previous_prove_server_identity(request: Request, call_next):
+    """`prove_server_identity` as it was registered with `app.middleware("http")`."""
+    resp = await call_next(request)
+    if middleware.private_key is None:
+        return resp
+
+    resp.headers[middleware.PUBLIC_KEY_HEADER] = middleware.hex_public_key
+    challenge = request.headers.get(middleware.CHALLENGE_HEADER) or request.headers.get(middleware.AUTH_HEADER)
+    if not challenge:
+        return resp
+
+    server_random = secrets.token_hex(32)
+    ts = str(int(time.time()))
+    proof = f"{middleware.PROOF_PREFIX}|{ts}|{server_random}|{challenge}"
+    resp.headers[middleware.SERVER_RANDOM_HEADER] = server_random
+    resp.headers[middleware.TS_HEADER] = ts
+    resp.headers[middleware.SIGNATURE_HEADER] = middleware.private_key.sign(
+        proof.encode("utf-8"), ec.ECDSA(hashes.SHA256())
+    ).hex()
+    return resp
+
+def build_app(stack: str, n_events: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for _ in range(n_events):
+                yield EVENT
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    if stack == "base_http_middleware":
+        app.middleware("http")(previous_prove_server_identity)
+    elif stack == "pure_asgi":
+        app.add_middleware(middleware.ProveServerIdentityMiddleware)
+    return app
+
+async def run_request(app: FastAPI) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/stream",
+        "raw_path": b"/stream",
+        "query_string": b"",
+        "headers": [(middleware.CHALLENGE_HEADER.lower().encode(), b"benchmark-challenge")],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    received = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return received
+
+async def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    hex_public_key = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.X962, format=serialization.PublicFormat.UncompressedPoint
+    ).hex()
+
+    print(f"{n_requests} requests of {n_events} SSE events each\n")
+    print(f"{'stack':<24} {'events/s':>12} {'MB/s':>8} {'ms/request':>11}")
+    with patch.object(middleware, "private_key", private_key), \
+         patch.object(middleware, "hex_public_key", hex_public_key):
+        for stack in ("none", "base_http_middleware", "pure_asgi"):
+            app = build_app(stack, n_events)
+            await run_request(app)
+            start = time.perf_counter()
+            total_bytes = 0
+            for _ in range(n_requests):
+                total_bytes += await run_request(app)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{stack:<24} {n_events * n_requests / elapsed:12.0f} "
+                f"{total_bytes / elapsed / 1e6:8.1f} {elapsed / n_requests * 1000:11.1f}"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Benchmark PDF parsing throughput in pages per second.
+
+Compares the former chunked path (nested thread pool, every chunk re-serialized
+into a new PDF) with the process-pool engine that opens the source once per
+worker from shared memory.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/pdf_parse_throughput.py [pages]
+"""
+import asyncio
+import concurrent.futures
+import sys
+import time
+from typing import List
+
+import fitz
+from langchain_core.documents import Document
+
+from app.actions.pdf.engine import PdfParsingEngine
+from app.actions.pdf.utils import parse_text_from_pdf
+from app.config import get_settings
+from app.rag.pdf_parser import ocr_engines_per_worker
+
+PARAGRAPH = (
+    "Quarterly revenue grew across every region while operating costs stayed flat. "
+    "The board approved a new research budget and a revised hiring plan for engineering. "
+)
+
+def build_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 780), f"Page {n}. " + PARAGRAPH * 12, fontsize=9)
+    pdf_bytes = doc.write()
+    doc.close()
+    return pdf_bytes
+
+def legacy_chunked_parse(pdf_bytes: bytes, chunk_size: int, workers: int) -> List[Document]:
+    """The previous chunked path, kept here for comparison."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_doc:
+        total_pages = pdf_doc.page_count
+
+    def process_chunk(start_page: int, end_page: int) -> List[Document]:
+        chunk_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        new_doc = fitz.open()
+        for page_num in range(start_page, min(end_page, total_pages)):
+            new_doc.insert_pdf(chunk_doc, from_page=page_num, to_page=page_num)
+        chunk_bytes = new_doc.write()
+        chunk_doc.close()
+        new_doc.close()
+        return parse_text_from_pdf(chunk_bytes)
+
+    docs: List[Document] = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(process_chunk, start, min(start + chunk_size, total_pages))
+            for start in range(0, total_pages, chunk_size)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            docs.extend(future.result())
+    return docs
+
+async def main(pages: int) -> None:
+    settings = get_settings()
+    pdf_bytes = build_pdf(pages)
+    workers = ocr_engines_per_worker()
+
+    started = time.perf_counter()
+    legacy_docs = legacy_chunked_parse(pdf_bytes, settings.PDF_CHUNK_SIZE, workers)
+    legacy_seconds = time.perf_counter() - started
+
+    engine = PdfParsingEngine(workers=workers, chunk_size=settings.PDF_CHUNK_SIZE)
+    await engine.warm()
+    started = time.perf_counter()
+    engine_docs = await engine.parse(pdf_bytes)
+    engine_seconds = time.perf_counter() - started
+    engine.shutdown()
+
+    in_order = [doc.metadata["page"] for doc in engine_docs] == list(range(pages))
+    print(f"pages={pages} workers={workers} chunk_size={settings.PDF_CHUNK_SIZE}")
+    print(f"legacy_chunked  {len(legacy_docs) / legacy_seconds:>8.1f} pages/s")
+    print(f"process_pool    {len(engine_docs) / engine_seconds:>8.1f} pages/s  in_order={in_order}")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,105 @@
+"""
+Measure time-to-first-token of a PDF chat request against a running proxy.
+
+Sends a generated text PDF of the given size to `/v1/chat/completions` with
+`use_pdf` set and reports, per run, when the first page-progress event, the
+"Reading documents" event and the first content token arrived. Run it once
+against a deployment of the previous version and once against this one to
+compare; every run uses a fresh PDF so the parse and summary caches miss.
+
+Usage (from the repository root):
+
+    PYTHONPATH=src python benchmarks/pdf_ttft.py <base_url> <token> [pages] [runs]
+"""
+import asyncio
+import base64
+import json
+import statistics
+import sys
+import time
+import uuid
+
+import fitz
+import httpx
+
+PARAGRAPH = (
+    "Quarterly revenue grew across every region while operating costs stayed flat. "
+    "The board approved a new research budget and a revised hiring plan for engineering. "
+)
+
+def build_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    # A unique marker per run keeps the content hash, and so the caches, cold
+    marker = uuid.uuid4().hex
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 780), f"{marker} page {n}. " + PARAGRAPH * 14, fontsize=8)
+    pdf_bytes = doc.write()
+    doc.close()
+    return pdf_bytes
+
+async def run_once(client: httpx.AsyncClient, base_url: str, token: str, pages: int) -> dict:
+    pdf_b64 = base64.b64encode(build_pdf(pages)).decode()
+    body = {
+        "model": "default",
+        "stream": True,
+        "use_pdf": True,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "What are the key points of this document?"},
+                {"type": "pdf_url", "pdf_url": {"url": f"data:application/pdf;base64,{pdf_b64}"}},
+            ],
+        }],
+    }
+
+    timings = {"first_progress_s": None, "reading_s": None, "ttft_s": None}
+    started = time.perf_counter()
+    async with client.stream(
+        "POST", f"{base_url}/v1/chat/completions", json=body,
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data.startswith("["):
+                continue
+            event = json.loads(data)
+            elapsed = time.perf_counter() - started
+            if event.get("object") == "process.event":
+                if "pages" in event.get("data", {}) and timings["first_progress_s"] is None:
+                    timings["first_progress_s"] = elapsed
+                if event.get("message") == "Reading documents":
+                    timings["reading_s"] = elapsed
+            elif event.get("choices") and event["choices"][0].get("delta", {}).get("content"):
+                timings["ttft_s"] = elapsed
+                break
+    return timings
+
+def _fmt(values) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return "n/a"
+    return f"median {statistics.median(values):.2f}s, max {max(values):.2f}s"
+
+async def main():
+    base_url = sys.argv[1].rstrip("/")
+    token = sys.argv[2]
+    pages = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    runs = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+
+    results = []
+    async with httpx.AsyncClient(timeout=900) as client:
+        for n in range(runs):
+            timings = await run_once(client, base_url, token, pages)
+            print(f"run {n+1}: {timings}")
+            results.append(timings)
+
+    print(f"\n{pages} pages, {runs} runs against {base_url}")
+    for key in ("first_progress_s", "reading_s", "ttft_s"):
+        print(f"  {key:<18} {_fmt([r[key] for r in results])}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Measure the peak RSS of receiving a large PDF inline as base64-in-JSON versus
+streaming it through the upload store.
+
+Each mode runs in a fresh process. The inline mode repeats what a chat
+request goes through (raw body, JSON parse, pydantic model, base64 decode).
+The upload mode streams the file to disk in 64 KB chunks and then opens it
+by path, as the PDF action does for `upload://` references.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/pdf_upload_memory.py [size_mb]
+"""
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+CHUNK_SIZE = 64 * 1024
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def build_pdf(path: str, size_mb: int) -> None:
+    """Write a PDF of roughly `size_mb` made of incompressible image data."""
+    doc = fitz.open()
+    per_page = 4 * 1024 * 1024
+    for _ in range(max(1, size_mb * 1024 * 1024 // per_page)):
+        page = doc.new_page()
+        side = int((per_page / 3) ** 0.5)
+        samples = os.urandom(side * side * 3)
+        pix = fitz.Pixmap(fitz.csRGB, side, side, samples, False)
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path, deflate=False)
+    doc.close()
+
+def run_inline(pdf_path: str, result: "multiprocessing.Queue") -> None:
+    from app.api.v1.schemas import LLMRequest
+    from app.actions.pdf.utils import get_multiple_pdfs_from_last_message
+
+    baseline = _peak_rss_mb()
+    with open(pdf_path, "rb") as f:
+        data_uri = "data:application/pdf;base64," + base64.b64encode(f.read()).decode()
+    body = json.dumps({
+        "messages": [{"role": "user", "content": [{"type": "pdf_url", "pdf_url": {"url": data_uri}}]}],
+        "use_pdf": True,
+    }).encode()
+    del data_uri
+
+    payload = LLMRequest.model_validate(json.loads(body))
+    dumped = payload.model_dump(exclude_none=True)
+    pdfs = get_multiple_pdfs_from_last_message(payload.messages[-1], "bench-user")
+    with fitz.open(stream=pdfs[0], filetype="pdf") as doc:
+        doc.page_count
+    result.put(_peak_rss_mb() - baseline)
+    del dumped
+
+def run_upload(pdf_path: str, result: "multiprocessing.Queue") -> None:
+    from app.api.helper.uploads import UploadStore
+
+    baseline = _peak_rss_mb()
+
+    async def chunks():
+        with open(pdf_path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+    with tempfile.TemporaryDirectory() as root:
+        store = UploadStore(root=root, ttl_seconds=3600, max_bytes=1024 * 1024 * 1024)
+        content_hash, _ = asyncio.run(store.save_stream("bench-user", chunks()))
+        with fitz.open(store.path_for("bench-user", content_hash), filetype="pdf") as doc:
+            doc.page_count
+    result.put(_peak_rss_mb() - baseline)
+
+def measure(target, pdf_path: str) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    result = ctx.Queue()
+    process = ctx.Process(target=target, args=(pdf_path, result))
+    process.start()
+    value = result.get()
+    process.join()
+    return value
+
+def main(size_mb: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = str(Path(tmp) / "large.pdf")
+        build_pdf(pdf_path, size_mb)
+        actual_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+
+        inline_mb = measure(run_inline, pdf_path)
+        upload_mb = measure(run_upload, pdf_path)
+
+    print(f"pdf_size={actual_mb:.1f}MB")
+    print(f"inline_base64_json  peak_rss_increase={inline_mb:>8.1f}MB")
+    print(f"streamed_upload     peak_rss_increase={upload_mb:>8.1f}MB")
+    print(f"reduction           {inline_mb - upload_mb:>8.1f}MB")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,95 @@
+"""
+Compare LLM calls and latency of summarization strategies per input size.
+
+"single_condense" is the previous strategy: map every chunk, join, and run at
+most one condense pass, calling the LLM even for short inputs. "tree" is
+`call_summarization_llm`: passthrough or extractive for inputs near the
+target, otherwise map and tree-reduce with SUMMARIZATION_REDUCE_FAN_IN.
+
+The summarization backend is simulated: each call takes a fixed overhead
+plus time per input token, and answers with VERBOSITY times the requested
+number of words, like a model that overshoots its length budget. The final
+length is reported so the strategies can be compared on fit as well as cost.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/summarization_tree.py [target_words]
+"""
+import asyncio
+import sys
+import time
+from unittest.mock import AsyncMock, patch
+
+from app.api.helper import request_summary
+from app.api.helper.summary_cache import SummaryCache
+from app.rag.summarizing_llm import SummarizingLLM
+
+CALL_OVERHEAD_S = 0.05
+SECONDS_PER_1K_INPUT_TOKENS = 0.01
+VERBOSITY = 1.3
+INPUT_WORDS = [300, 600, 5_000, 50_000, 200_000, 1_000_000]
+
+SENTENCE = "The committee reviewed the quarterly figures and agreed on a revised budget for next year. "
+
+async def fake_ainvoke(self, input, **kwargs):
+    input_tokens = len(input) / 4
+    await asyncio.sleep(CALL_OVERHEAD_S + input_tokens / 1000 * SECONDS_PER_1K_INPUT_TOKENS)
+    return (SENTENCE * int(self.max_tokens * VERBOSITY / 16 + 1))
+
+async def fake_prompt(text_to_summarize: str, target_word_count: int) -> str:
+    return text_to_summarize
+
+async def single_condense(text: str, target: int, run) -> str:
+    """The strategy `call_summarization_llm` used before the tree reduce."""
+    splitter = request_summary.get_token_counter(request_summary.SUMMARIZATION_MODEL).text_splitter(
+        request_summary.MAX_TEXT_TOKENS_FOR_LLM, request_summary.CHUNK_OVERLAP_TOKENS
+    )
+    chunks = splitter.split_text(text)
+    if len(chunks) == 1:
+        return await request_summary._summarize_single_chunk(chunks[0], target, run)
+    words = max(50, target // len(chunks))
+    summaries = await asyncio.gather(*[request_summary._summarize_single_chunk(c, words, run) for c in chunks])
+    combined = "\n\n---\n\n".join(summaries)
+    if len(combined.split()) > target * 1.2:
+        return await request_summary._summarize_single_chunk(combined, target, run)
+    return combined
+
+async def measure_tree(text: str, target: int):
+    counted = []
+    original = request_summary._SummaryRun.record
+
+    def record(self, path, input_tokens):
+        counted.append((path, self.llm_calls))
+        original(self, path, input_tokens)
+
+    with patch.object(request_summary._SummaryRun, "record", record):
+        start = time.perf_counter()
+        summary = await request_summary.call_summarization_llm(text, target)
+        elapsed = time.perf_counter() - start
+    path, calls = counted[-1]
+    return path, calls, elapsed, len(summary.split())
+
+async def measure_single(text: str, target: int):
+    run = request_summary._SummaryRun()
+    start = time.perf_counter()
+    summary = await single_condense(text, target, run)
+    return "llm", run.llm_calls, time.perf_counter() - start, len(summary.split())
+
+async def main():
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"target {target} words, chunks of {request_summary.MAX_TEXT_TOKENS_FOR_LLM} tokens\n")
+    print(f"{'input words':>12} {'strategy':<16} {'path':<12} {'llm calls':>9} {'latency':>9} {'words out':>10}")
+
+    # Both strategies summarize the same chunks, so the summary cache is off
+    with patch.object(SummarizingLLM, "ainvoke", fake_ainvoke), \
+         patch.object(request_summary, "generate_request_prompt", fake_prompt), \
+         patch.object(request_summary, "summary_prompt_version", AsyncMock(return_value="bench")), \
+         patch.object(request_summary, "get_summary_cache", return_value=SummaryCache(max_chars=0, ttl_seconds=1)):
+        for n_words in INPUT_WORDS:
+            text = SENTENCE * (n_words // 16)
+            for name, measure in (("single_condense", measure_single), ("tree", measure_tree)):
+                path, calls, elapsed, words_out = await measure(text, target)
+                print(f"{n_words:>12} {name:<16} {path:<12} {calls:>9} {elapsed:>8.2f}s {words_out:>10}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
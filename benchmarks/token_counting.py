@@ -0,0 +1,69 @@
+"""
+Benchmark token counting throughput of the local tokenizer service.
+
+Reports characters per second for single counts, cached repeat counts,
+batched counts and token-aware splitting, next to the `len / 3` heuristic it
+replaces, and how far the heuristic is off for the given text.
+
+Usage (from the repository root, with the app's environment configured):
+
+    PYTHONPATH=src python benchmarks/token_counting.py [model_or_tokenizer_path] [size_kb]
+"""
+import sys
+import time
+
+# app.rag imports the API helpers, whose routers import app.rag back; loading
+# the API package first lets the import cycle settle
+import app.api  # noqa: F401
+from app.config import get_settings
+from app.rag.tokenizer import TokenCounter, load_tokenizer
+
+PARAGRAPH = (
+    "Quarterly revenue grew across every region while operating costs stayed flat. "
+    "The board approved a new research budget and a revised hiring plan for engineering. "
+    "Das Unternehmen meldete außerdem 12,5 % mehr Umsatz im Vergleich zum Vorjahr. "
+    "def handler(request): return {\"status\": 200, \"items\": [1, 2, 3]}\n\n"
+)
+
+def timed(label: str, chars: int, fn, repeat: int = 5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<28} {elapsed * 1000:9.2f} ms  {chars / elapsed / 1e6:8.2f} M chars/s")
+    return result
+
+def main():
+    tokenizer_name = sys.argv[1] if len(sys.argv) > 1 else get_settings().MODEL_NAME
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    tokenizer = load_tokenizer(tokenizer_name)
+    if tokenizer is None:
+        sys.exit(f"Could not load tokenizer {tokenizer_name}")
+
+    # Numbered so that no two paragraphs share a cached count
+    paragraphs = (f"{n}. {PARAGRAPH}" for n in range(size_kb * 1024 // len(PARAGRAPH) + 1))
+    text = "".join(paragraphs)[:size_kb * 1024]
+    pieces = [text[i:i + 4000] for i in range(0, len(text), 4000)]
+    print(f"tokenizer {tokenizer_name}, {len(text)} chars in {len(pieces)} pieces\n")
+
+    timed("heuristic len/3", len(text), lambda: len(text) // 3)
+
+    n_tokens = timed("count (uncached)", len(text), lambda: TokenCounter(tokenizer_name, tokenizer).count(text))
+    counter = TokenCounter(tokenizer_name, tokenizer)
+    counter.count(text)
+    timed("count (cached)", len(text), lambda: counter.count(text))
+    timed("count_batch of pieces", len(text), lambda: TokenCounter(tokenizer_name, tokenizer).count_batch(pieces))
+    chunks = timed(
+        "split into 8k-token chunks",
+        len(text),
+        lambda: TokenCounter(tokenizer_name, tokenizer).text_splitter(8000, 20).split_text(text),
+        repeat=1,
+    )
+
+    heuristic = len(text) // 3
+    print(f"\nexact tokens {n_tokens}, heuristic {heuristic} ({(heuristic - n_tokens) / n_tokens:+.1%})")
+    print(f"{len(chunks)} chunks, largest {max(counter.count(c) for c in chunks)} tokens")
+
+if __name__ == "__main__":
+    main()
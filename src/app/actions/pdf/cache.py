@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from cachetools import TTLCache
+from langchain_core.documents import Document
+
+from ...config import get_settings
+from ...logger import log
+from ...milvus import EMBEDDING_METADATA_KEY
+
+# Bump when the parsing pipeline changes so stale parses are not reused.
+PDF_PARSER_VERSION = 2
+
+@dataclass
+class PdfCacheEntry:
+    """Everything derived from one PDF that is worth keeping across requests."""
+    docs: List[Document]
+    created_at: float = field(default_factory=time.time)
+    # user collection name -> time the pages were ingested into it
+    ingested_collections: Dict[str, float] = field(default_factory=dict)
+
+    def copy_docs(self) -> List[Document]:
+        """Copies of the cached pages that callers are free to mutate."""
+        return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in self.docs]
+
+    def to_json(self) -> dict:
+        return {
+            "docs": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in self.docs],
+            "created_at": self.created_at,
+            "ingested_collections": self.ingested_collections,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "PdfCacheEntry":
+        return cls(
+            docs=[Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in data["docs"]],
+            created_at=data["created_at"],
+            ingested_collections=data["ingested_collections"],
+        )
+
+def _entry_size(entry: PdfCacheEntry) -> int:
+    return sum(len(doc.page_content) for doc in entry.docs) + 1024
+
+def pdf_cache_key(pdf: Union[bytes, Path]) -> str:
+    """
+    SHA-256 of the PDF bytes together with the settings that affect parsing.
+    Uploaded files are already named after the SHA-256 of their content.
+    """
+    settings = get_settings()
+    parse_settings = json.dumps({
+        "version": PDF_PARSER_VERSION,
+        "max_pages": settings.PDF_MAX_PAGES,
+        "chunk_size": settings.PDF_CHUNK_SIZE,
+        "ocr_max_text_chars": settings.PDF_OCR_MAX_TEXT_CHARS,
+        "ocr_min_image_coverage": settings.PDF_OCR_MIN_IMAGE_COVERAGE,
+        "ocr_image_dominant_coverage": settings.PDF_OCR_IMAGE_DOMINANT_COVERAGE,
+        "ocr_min_text_coverage": settings.PDF_OCR_MIN_TEXT_COVERAGE,
+    }, sort_keys=True)
+    content_digest = pdf.stem if isinstance(pdf, Path) else hashlib.sha256(pdf).hexdigest()
+    h = hashlib.sha256(content_digest.encode())
+    h.update(parse_settings.encode())
+    return h.hexdigest()
+
+def summary_cache_key(doc_keys: List[str], target_word_count: int) -> str:
+    """Key for the summary of a set of PDFs summarized together."""
+    return hashlib.sha256(f"{'|'.join(doc_keys)}|{target_word_count}".encode()).hexdigest()
+
+class PdfCache:
+    """
+    Content-addressed cache of parsed PDF pages and their summaries.
+    The in-memory tier is bounded by the total size of the cached text; the
+    optional disk tier under `PDF_CACHE_DIR` is shared by all workers and
+    holds plain JSON, so a file written there can never run code when loaded.
+    Entries expire well before the 24h Milvus TTL so an "ingested" flag never
+    outlives the data it refers to.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: int,
+        disk_dir: Optional[str] = None,
+        disk_max_files: int = 512,
+        disk_prune_every: int = 32,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self._entries: TTLCache = TTLCache(maxsize=max_bytes, ttl=ttl_seconds, getsizeof=_entry_size)
+        self._summaries: TTLCache = TTLCache(maxsize=1024, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_files = disk_max_files
+        # Pruning lists the whole directory, so it runs every few writes
+        # and the directory may go over `disk_max_files` in between
+        self.disk_prune_every = disk_prune_every
+        self._disk_writes = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[PdfCacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._read_disk(f"{key}.pdf.json", PdfCacheEntry.from_json)
+            if entry is not None:
+                self._store(key, entry)
+        return entry
+
+    def put(self, key: str, docs: List[Document]) -> PdfCacheEntry:
+        # Vectors are large compared to the page text, keep only the text
+        stripped = [
+            Document(
+                page_content=doc.page_content,
+                metadata={k: v for k, v in doc.metadata.items() if k != EMBEDDING_METADATA_KEY},
+            )
+            for doc in docs
+        ]
+        entry = PdfCacheEntry(docs=stripped)
+        self._store(key, entry)
+        self._write_disk(f"{key}.pdf.json", entry.to_json())
+        return entry
+
+    def is_ingested(self, key: str, collection_name: str) -> bool:
+        entry = self.get(key)
+        if entry is None:
+            return False
+        ingested_at = entry.ingested_collections.get(collection_name)
+        return ingested_at is not None and time.time() - ingested_at < self.ttl_seconds
+
+    def mark_ingested(self, key: str, collection_name: str) -> None:
+        entry = self.get(key)
+        if entry is None:
+            return
+        entry.ingested_collections[collection_name] = time.time()
+        self._write_disk(f"{key}.pdf.json", entry.to_json())
+
+    def get_summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._read_disk(f"{key}.summary.json", lambda data: data["summary"])
+            if summary is not None:
+                with self._lock:
+                    self._summaries[key] = summary
+        return summary
+
+    def put_summary(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+        self._write_disk(f"{key}.summary.json", {"summary": summary})
+
+    def _store(self, key: str, entry: PdfCacheEntry) -> None:
+        with self._lock:
+            try:
+                self._entries[key] = entry
+            except ValueError:
+                log.info(f"Parsed PDF too large for the in-memory cache, skipping")
+
+    def _read_disk(self, filename: str, parse: Callable[[dict], Any]):
+        if self.disk_dir is None:
+            return None
+        path = self.disk_dir / filename
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return parse(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Failed to read PDF cache file {filename}: {e}")
+            return None
+
+    def _write_disk(self, filename: str, value: dict) -> None:
+        if self.disk_dir is None:
+            return
+        path = self.disk_dir / filename
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            log.warning(f"Failed to write PDF cache file {filename}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            should_prune = self._disk_writes % self.disk_prune_every == 0
+        if should_prune:
+            try:
+                self._prune_disk()
+            except OSError as e:
+                log.warning(f"Failed to prune the PDF cache directory: {e}")
+
+    def _prune_disk(self) -> None:
+        files = []
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.disk_max_files)]:
+            path.unlink(missing_ok=True)
+
+_pdf_cache_instance: PdfCache | None = None
+
+def get_pdf_cache() -> PdfCache:
+    global _pdf_cache_instance
+    if _pdf_cache_instance is None:
+        settings = get_settings()
+        _pdf_cache_instance = PdfCache(
+            max_bytes=int(settings.PDF_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=settings.PDF_CACHE_TTL_SECONDS,
+            disk_dir=settings.PDF_CACHE_DIR,
+            disk_max_files=settings.PDF_CACHE_DISK_MAX_FILES,
+        )
+    return _pdf_cache_instance
@@ -0,0 +1,198 @@
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Union
+
+import fitz
+from langchain_core.documents import Document
+
+from ...config import get_settings
+from ...logger import log
+from ...rag.pdf_parser import get_ocr_engine_pool, ocr_engines_per_worker
+from .utils import open_pdf, parse_pdf_page_range
+
+# Per-worker cache of open source documents, keyed by shared memory name or
+# file path, so a worker opens each PDF once no matter how many page ranges it
+# is given.
+_WORKER_OPEN_DOCS_MAX = 2
+_worker_open_docs: "OrderedDict[str, fitz.Document]" = OrderedDict()
+
+def _warm_worker() -> None:
+    """
+    Runs once in every pool process so the first real task pays no import or
+    model load cost. A worker parses one range at a time, so one OCR engine is enough.
+    """
+    get_settings()
+    get_ocr_engine_pool(size=1)
+
+def _open_source_pdf(source: str, size: int | None) -> fitz.Document:
+    """Open a shared memory segment (`size` given) or a file path (`size` is None)."""
+    pdf_doc = _worker_open_docs.get(source)
+    if pdf_doc is not None:
+        _worker_open_docs.move_to_end(source)
+        return pdf_doc
+
+    if size is None:
+        pdf_doc = open_pdf(Path(source))
+    else:
+        # Spawned workers report to the parent's resource tracker, so attaching
+        # here adds nothing to release: the parent creates and unlinks the segment
+        shm = shared_memory.SharedMemory(name=source)
+        try:
+            pdf_bytes = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+        pdf_doc = open_pdf(pdf_bytes)
+
+    _worker_open_docs[source] = pdf_doc
+    while len(_worker_open_docs) > _WORKER_OPEN_DOCS_MAX:
+        _, old_doc = _worker_open_docs.popitem(last=False)
+        old_doc.close()
+    return pdf_doc
+
+def _pages_to_parse(pdf_doc: fitz.Document, max_pages: Optional[int]) -> int:
+    return min(pdf_doc.page_count, max_pages) if max_pages else pdf_doc.page_count
+
+def _count_source_pages(source: str, size: int | None, max_pages: Optional[int]) -> int:
+    # The worker keeps the document open for the ranges it parses next
+    return _pages_to_parse(_open_source_pdf(source, size), max_pages)
+
+def _parse_source_range(source: str, size: int | None, start_page: int, end_page: int, enable_ocr: bool) -> List[Document]:
+    pdf_doc = _open_source_pdf(source, size)
+    return parse_pdf_page_range(pdf_doc, start_page, end_page, enable_ocr)
+
+def _count_pages_locally(pdf: Union[bytes, Path], max_pages: Optional[int]) -> int:
+    """Fallback used in a thread of this process when the pool is broken."""
+    with open_pdf(pdf) as pdf_doc:
+        return _pages_to_parse(pdf_doc, max_pages)
+
+def _parse_range_locally(pdf: Union[bytes, Path], start_page: int, end_page: int, enable_ocr: bool) -> List[Document]:
+    """Fallback used in a thread of this process when the pool is broken."""
+    with open_pdf(pdf) as pdf_doc:
+        return parse_pdf_page_range(pdf_doc, start_page, end_page, enable_ocr)
+
+@dataclass
+class ParsedRange:
+    """Parsed pages of a PDF, and how many of its pages are parsed in all."""
+    docs: List[Document]
+    page_count: int
+
+class PdfParsingEngine:
+    """
+    Parses PDFs on a warmed process pool. The PDF bytes are placed in shared
+    memory once (uploaded files are opened by path instead), every worker
+    opens the source once and parses page ranges from it, and pages come back
+    in document order.
+    """
+
+    def __init__(self, workers: int, chunk_size: int):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the parent already runs torch / tokenizer threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return self._pool
+
+    async def warm(self) -> None:
+        """Start every worker process ahead of the first request."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*[loop.run_in_executor(pool, _warm_worker) for _ in range(self.workers)])
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def parse_ranges(self, pdf: Union[bytes, Path], enable_ocr: bool = True, max_pages: Optional[int] = None) -> AsyncIterator[ParsedRange]:
+        """
+        Parse up to `max_pages` pages of the PDF. Page ranges are yielded in
+        document order as soon as they and every range before them are done,
+        while the pool keeps working on the rest. The PDF is only opened on
+        the pool, where its pages are counted first.
+        """
+        loop = asyncio.get_running_loop()
+        shm = None
+        futures: List[Optional[asyncio.Future]] = []
+        try:
+            if isinstance(pdf, Path):
+                source, size = str(pdf), None
+            else:
+                shm = shared_memory.SharedMemory(create=True, size=len(pdf))
+                shm.buf[:len(pdf)] = pdf
+                source, size = shm.name, len(pdf)
+
+            try:
+                page_count = await loop.run_in_executor(self._get_pool(), _count_source_pages, source, size, max_pages)
+            except BrokenProcessPool as e:
+                log.error(f"PDF process pool broke, counting pages in a thread instead: {e}")
+                self._pool = None
+                page_count = await loop.run_in_executor(None, _count_pages_locally, pdf, max_pages)
+            if page_count == 0:
+                return
+
+            ranges = [
+                (start, min(start + self.chunk_size, page_count))
+                for start in range(0, page_count, self.chunk_size)
+            ]
+            try:
+                pool = self._get_pool()
+                futures = [
+                    loop.run_in_executor(pool, _parse_source_range, source, size, start, end, enable_ocr)
+                    for start, end in ranges
+                ]
+            except BrokenProcessPool as e:
+                log.error(f"PDF process pool broke, parsing in a thread instead: {e}", exc_info=True)
+                self._pool = None
+                futures = [None] * len(ranges)
+
+            for (start, end), future in zip(ranges, futures):
+                try:
+                    if future is None:
+                        raise BrokenProcessPool("PDF process pool unavailable")
+                    range_docs = await future
+                except BrokenProcessPool as e:
+                    log.error(f"PDF process pool broke, parsing pages {start}-{end} in a thread instead: {e}")
+                    self._pool = None
+                    range_docs = await loop.run_in_executor(None, _parse_range_locally, pdf, start, end, enable_ocr)
+                yield ParsedRange(docs=range_docs, page_count=page_count)
+        finally:
+            # The caller may stop early; don't leave ranges queued on the pool
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    async def parse(self, pdf: Union[bytes, Path], enable_ocr: bool = True, max_pages: Optional[int] = None) -> List[Document]:
+        """Parse up to `max_pages` pages of the PDF, returned in page order."""
+        docs: List[Document] = []
+        async for parsed in self.parse_ranges(pdf, enable_ocr=enable_ocr, max_pages=max_pages):
+            docs.extend(parsed.docs)
+        return docs
+
+_pdf_engine_instance: PdfParsingEngine | None = None
+
+def get_pdf_engine() -> PdfParsingEngine:
+    global _pdf_engine_instance
+    if _pdf_engine_instance is None:
+        settings = get_settings()
+        # One OCR engine per process; the engines are for the whole container
+        _pdf_engine_instance = PdfParsingEngine(
+            workers=ocr_engines_per_worker(),
+            chunk_size=settings.PDF_CHUNK_SIZE,
+        )
+    return _pdf_engine_instance
@@ -1,23 +1,25 @@
-import base64
 import json
 import asyncio
+import time
 from fastapi.responses import StreamingResponse, JSONResponse
-import fitz
 from typing import AsyncGenerator
+from langchain_core.documents import Document
 
 from ...api.helper.request_llm import arequest_llm, get_user_collection_name
-from ...api.helper.request_summary import call_summarization_llm
+from ...api.helper.request_summary import ProgressiveSummarizer
 from ...api.helper.format_sse import format_sse_message, create_random_event_id
+from ...api.helper.streaming import DisconnectAwareStreamingResponse, close_upstream
 from ...logger import log
 from ...api.v1.schemas import LLMRequest
 from ...actions.pdf.utils import (
-    get_multiple_pdf_base64_from_last_message,
-    parse_text_from_pdf,
-    parse_text_from_pdf_chunked,
+    get_multiple_pdfs_from_last_message,
     clean_message_of_pdf_urls,
     augment_messages_with_pdf,
 )
 from ...dependencies import get_milvus_wrapper
+from ...milvus import DOC_TYPE_PDF
+from .cache import get_pdf_cache, pdf_cache_key, summary_cache_key
+from .engine import get_pdf_engine
 from ...config import get_settings
 
 async def pdf_handler(payload: LLMRequest, user_id: str) -> StreamingResponse:
@@ -26,7 +28,7 @@ async def pdf_handler(payload: LLMRequest, user_id: str) -> StreamingResponse:
     Extracts text for RAG or converts to images.
     Processes only the single most recent PDF found in the latest N messages.
     """
-    return StreamingResponse(pdf_stream(payload, user_id), media_type="text/event-stream")
+    return DisconnectAwareStreamingResponse(pdf_stream(payload, user_id), media_type="text/event-stream")
     
 async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, None]:
     """
@@ -35,13 +37,16 @@ async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, N
     Processes only the single most recent PDF found in the latest N messages.
     """
     log.info("Processing PDF request with LLMRequest payload.")
+    started_at = time.monotonic()
 
-    pdf_base64_list = get_multiple_pdf_base64_from_last_message(payload.messages[-1])
-    log.info(f"Found {len(pdf_base64_list)} PDF(s) in the last message.")
-    if len(pdf_base64_list) == 0:
+    pdf_list = get_multiple_pdfs_from_last_message(payload.messages[-1], user_id)
+    log.info(f"Found {len(pdf_list)} PDF(s) in the last message.")
+    if len(pdf_list) == 0:
         log.warning("No PDF found in the last message.")
         raise ValueError("No PDF found in the last message.")
 
+    summarizer = None
+    llm_response = None
     try:
         # Exclude the PDF from the messages
         payload.messages[-1] = clean_message_of_pdf_urls(payload.messages[-1])
@@ -56,82 +61,127 @@ async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, N
             },
         )
 
-        async def parse_single_pdf(i: int, pdf_base64_string: str):
-            # Parse the PDF using PyMuPDF and RapidOCR in executor
-            pdf_bytes = base64.b64decode(pdf_base64_string)
+        # Look up previously parsed copies of the same documents
+        pdf_cache = get_pdf_cache()
+        pdf_keys = [pdf_cache_key(pdf) for pdf in pdf_list]
+        cached_entries = [pdf_cache.get(key) for key in pdf_keys]
+        cache_hits = sum(entry is not None for entry in cached_entries)
+        log.info(f"PDF cache lookup", extra={"user_id": user_id, "pdf_cache_hits": cache_hits, "pdf_count": len(pdf_keys)})
+        if cache_hits:
+            yield format_sse_message(
+                data={
+                    "object": "process.event",
+                    "id": create_random_event_id(),
+                    "type": "pdf",
+                    "message": "Reusing previously parsed documents",
+                    "data": {
+                        "cache": {"parsed": cache_hits, "total": len(pdf_keys)},
+                    },
+                },
+            )
 
-            pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            page_count = max(pdf_doc.page_count, 1)
-            avg_page_size_kb = (len(pdf_bytes) / page_count) / 1024
-            pdf_doc.close()
+        settings = get_settings()
+        engine = get_pdf_engine()
+        user_collection_name = get_user_collection_name(user_id)
+        milvus_instance = get_milvus_wrapper()
+        loop = asyncio.get_running_loop()
 
-            settings = get_settings()
-            needs_ocr = avg_page_size_kb > settings.PDF_PAGE_OCR_THRESHOLD_KB
+        # Summarize the PDF, unless the same documents were summarized recently
+        summary_key = summary_cache_key(pdf_keys, 500)
+        cached_summary = pdf_cache.get_summary(summary_key)
+        summarizer = ProgressiveSummarizer(500, user_id=user_id, extractive_fast_path=True) if cached_summary is None else None
 
-            log.info(
-                f"PDF {i+1}: avg_page_size={avg_page_size_kb:.1f}KB – needs_ocr={needs_ocr}"
-            )
+        # Pages of the parsed PDFs are counted on the pool, and known with their first range
+        page_totals = [len(entry.docs) if entry is not None else None for entry in cached_entries]
+        pages_done = pages_total = 0
 
-            loop = asyncio.get_running_loop()
+        async def produce_pages(i: int, queue: asyncio.Queue):
+            # Parse the PDF with PyMuPDF on the process pool; pages that need it are OCR'd with RapidOCR
+            try:
+                async for parsed in engine.parse_ranges(pdf_list[i], max_pages=settings.PDF_MAX_PAGES):
+                    page_totals[i] = parsed.page_count
+                    await queue.put(parsed.docs)
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(None)
 
-            # Decide parsing approach based on *document* size to optimise
-            # performance, but OCR decision is driven by `needs_ocr`.
-            pdf_size_mb = len(pdf_bytes) / (1024 * 1024)
+        # All PDFs parse in parallel, pages are consumed one PDF after the other
+        page_queues = {}
+        producer_tasks = []
+        for i, entry in enumerate(cached_entries):
+            if entry is None:
+                page_queues[i] = asyncio.Queue()
+                producer_tasks.append(asyncio.create_task(produce_pages(i, page_queues[i])))
 
-            if pdf_size_mb < settings.PDF_CHUNK_MODE_THRESHOLD_MB:
-                log.info(f"PDF {i+1}: Using standard parsing mode")
-                parse_func = lambda: parse_text_from_pdf(
-                    pdf_bytes,
-                    enable_ocr=needs_ocr,
-                    max_pages=settings.PDF_MAX_PAGES,
-                )
-                return await loop.run_in_executor(None, parse_func)
-            else:
-                log.info(
-                    f"PDF {i+1}: Using chunked parallel processing (chunk_size={settings.PDF_CHUNK_SIZE})"
-                )
-                parse_func = lambda: parse_text_from_pdf_chunked(
-                    pdf_bytes,
-                    chunk_size=settings.PDF_CHUNK_SIZE,
-                    enable_ocr=needs_ocr,
-                )
-                return await loop.run_in_executor(None, parse_func)
+        async def pages_of(i: int):
+            if cached_entries[i] is not None:
+                yield cached_entries[i].copy_docs()
+                return
+            while True:
+                item = await page_queues[i].get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
 
-        # Create tasks for all PDFs to process in parallel
-        pdf_tasks = [
-            parse_single_pdf(i, pdf_base64_string) 
-            for i, pdf_base64_string in enumerate(pdf_base64_list)
-        ]
-        
-        # Wait for all PDF parsing to complete in parallel
-        docs_list = await asyncio.gather(*pdf_tasks)
-        log.info(f"Completed parsing {len(docs_list)} PDFs in parallel.")
+        def ingest_range(docs):
+            milvus_instance.from_documents_for_user(user_collection_name, docs, DOC_TYPE_PDF)
 
-        # Save parsed results to vector DB
-        user_collection_name = get_user_collection_name(user_id)
-        from_doc_jobs = []
-        milvus_instance = get_milvus_wrapper()
-        for docs in docs_list:
-            loop = asyncio.get_running_loop()
-            from_doc_jobs.append(loop.run_in_executor(
-                None, 
-                milvus_instance.from_documents_for_user, 
-                user_collection_name, 
-                docs
-            ))
-        log.info(f"Started {len(from_doc_jobs)} jobs to save parsed PDF results to vector DB.")
-
-        # Create background task to handle vector DB completion
-        async def handle_vector_db_completion():
+        async def handle_vector_db_completion(i: int, key: str, jobs):
             try:
-                await asyncio.gather(*from_doc_jobs)
-                log.info(f"Successfully saved {len(docs_list)} PDF results to vector DB in background.")
+                await asyncio.gather(*jobs)
+                pdf_cache.mark_ingested(key, user_collection_name)
+                log.info(f"Successfully saved PDF {i+1} to vector DB in background.")
             except Exception as e:
                 log.error(f"Error saving PDF results to vector DB in background: {e}", exc_info=True)
 
-        # Start vector DB operations in background
-        asyncio.create_task(handle_vector_db_completion())
-        log.info(f"Vector DB operations started in background, continuing with LLM request.")
+        try:
+            for i, key in enumerate(pdf_keys):
+                # Skip documents already stored in the user's collection
+                ingest = not pdf_cache.is_ingested(key, user_collection_name)
+                ingest_jobs = []
+                docs = []
+                async for range_docs in pages_of(i):
+                    docs.extend(range_docs)
+                    pages_done += len(range_docs)
+                    pages_total = sum(total or 0 for total in page_totals)
+                    # Embed and store these pages while later ones are still parsing
+                    if ingest:
+                        # Ingestion adds vectors to the metadata, give it its own copies
+                        ingest_docs = [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in range_docs]
+                        ingest_jobs.append(loop.run_in_executor(None, ingest_range, ingest_docs))
+                    if summarizer is not None:
+                        await summarizer.add_text(
+                            "\n\n".join([doc.page_content for doc in range_docs]),
+                            progress=pages_done / pages_total if pages_total and None not in page_totals else None,
+                        )
+                    yield format_sse_message(
+                        data={
+                            "object": "process.event",
+                            "id": create_random_event_id(),
+                            "type": "pdf",
+                            "message": "",
+                            "data": {
+                                "pages": {"done": pages_done, "total": pages_total},
+                            },
+                        },
+                    )
+
+                if cached_entries[i] is None:
+                    ocr_pages = sum(1 for doc in docs if doc.metadata.get("ocr"))
+                    log.info(f"PDF {i+1}: parsed {len(docs)} pages, {ocr_pages} with OCR")
+                    pdf_cache.put(key, docs)
+                if ingest_jobs:
+                    asyncio.create_task(handle_vector_db_completion(i, key, ingest_jobs))
+        except BaseException:
+            for task in producer_tasks:
+                task.cancel()
+            if summarizer is not None:
+                summarizer.cancel()
+            raise
+        log.info(f"Completed parsing {len(pdf_list)} PDFs, vector DB operations continue in background.")
 
         yield format_sse_message(
             data={
@@ -143,12 +193,24 @@ async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, N
             },
         )
 
-        # Summarize the PDF
-        parse_results_str = ""
-        for docs in docs_list:
-            parse_results_str += "\n\n".join([doc.page_content for doc in docs])
-        parse_results_str = await call_summarization_llm(parse_results_str, 500)
-        log.info(f"Summarized PDF with LLM.")
+        if cached_summary is not None:
+            parse_results_str = cached_summary
+            log.info(f"Reusing cached PDF summary.")
+            yield format_sse_message(
+                data={
+                    "object": "process.event",
+                    "id": create_random_event_id(),
+                    "type": "pdf",
+                    "message": "",
+                    "data": {
+                        "cache": {"summary": True},
+                    },
+                },
+            )
+        else:
+            parse_results_str = await summarizer.finish()
+            pdf_cache.put_summary(summary_key, parse_results_str)
+            log.info(f"Summarized PDF with LLM.")
 
         yield format_sse_message(
             data="[RAG_DONE]"
@@ -172,7 +234,20 @@ async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, N
         if isinstance(llm_response, JSONResponse):
             raise ValueError("LLM response is not a StreamingResponse", llm_response)
         
+        first_chunk = True
         async for chunk in llm_response.aiter_text():
+            if first_chunk:
+                first_chunk = False
+                log.info(
+                    f"PDF request time to first token",
+                    extra={
+                        "metric": "pdf_time_to_first_token",
+                        "user_id": user_id,
+                        "pdf_count": len(pdf_list),
+                        "pages_total": pages_total,
+                        "ttft_s": round(time.monotonic() - started_at, 3),
+                    },
+                )
             yield chunk
     except Exception as e:
         log.error(f"An error occurred during PDF stream: {e}", exc_info=True)
@@ -189,3 +264,9 @@ async def pdf_stream(payload: LLMRequest, user_id: str) -> AsyncGenerator[str, N
         )
         # Terminate the stream
         return
+    finally:
+        # Parsing is stopped where it fails, or when the client leaves during it;
+        # the summaries and the generation may still be running here
+        if summarizer is not None:
+            summarizer.cancel()
+        await close_upstream(llm_response)
@@ -1,12 +1,13 @@
-import concurrent.futures
-from typing import List, Dict, Any, Optional
-from langchain_community.document_loaders.parsers import PyMuPDFParser
-from langchain_core.documents.base import Blob
+import base64
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Union
 from langchain_core.documents import Document
 import fitz
 
 from ...api.v1.schemas import ChatMessage, ContentPart, PdfContent, SenderTypeEnum
 from ...api.helper.get_system_prompt import get_system_prompt
+from ...api.helper.prompt_layout import add_context
+from ...api.helper.uploads import get_upload_store, UPLOAD_URL_PREFIX
 from ...config import get_settings
 from ...rag.pdf_parser import RapidOCRBlobParser
 
@@ -24,109 +25,153 @@ def clean_message_of_pdf_urls(chat_message: ChatMessage) -> ChatMessage:
     # Create a new ChatMessage with the cleaned content, preserving other fields
     return ChatMessage(role=chat_message.role, content=new_content_list)
 
-def get_multiple_pdf_base64_from_last_message(payload: ChatMessage) -> List[str]:
-    """Extracts base64 PDF data from the LATEST 'PdfContent' in the last message."""
+def get_multiple_pdfs_from_last_message(payload: ChatMessage, user_id: str) -> List[Union[bytes, Path]]:
+    """
+    Extracts the PDFs of every 'PdfContent' in the last message. Inline base64
+    data URIs are decoded to bytes; `upload://<hash>` references resolve to the
+    path of the user's uploaded file.
+    """
     if not payload.content:
         return []
     
-    url_list = []
+    pdf_list: List[Union[bytes, Path]] = []
     for content_item_obj in payload.content:
         if isinstance(content_item_obj, PdfContent):
             pdf_url_data = content_item_obj.pdf_url
-            url_string = pdf_url_data.url
-            if url_string and url_string.startswith("data:application/pdf;base64,"):
-                url_list.append(url_string.split(",", 1)[1])
-            # Error if the format is unexpected
-            else:
-                raise ValueError("Unexpected PDF URL format.")
-    return url_list
-
-def parse_text_from_pdf(pdf_bytes: bytes, enable_ocr: bool = True, max_pages: Optional[int] = None) -> List[Document]:
+            pdf_list.append(resolve_pdf_url(pdf_url_data.url, user_id))
+    return pdf_list
+
+def resolve_pdf_url(url_string: str, user_id: str) -> Union[bytes, Path]:
     """
-    Extracts text content from PDF bytes using PyMuPDF with optimized settings.
-    
-    Args:
-        pdf_bytes: PDF file bytes
-        enable_ocr: Whether to enable OCR for images (slower but more accurate)
-        max_pages: Maximum number of pages to process (None for all pages)
+    Bytes of an inline base64 data URI, or the path of the user's uploaded
+    file for an `upload://<hash>` reference.
     """
-    images_parser = RapidOCRBlobParser(intra_op_num_threads=get_settings().PDF_CHUNK_CONCURRENCY_LIMIT) if enable_ocr else None
-    
-    parser = PyMuPDFParser(
-        mode="page",
-        pages_delimiter="\n\f",
-        images_parser=images_parser,
-        extract_tables="markdown" if enable_ocr else None,
-        extract_images=enable_ocr
+    if url_string and url_string.startswith("data:application/pdf;base64,"):
+        return base64.b64decode(url_string.split(",", 1)[1])
+    if url_string and url_string.startswith(UPLOAD_URL_PREFIX):
+        upload_path = get_upload_store().path_for(user_id, url_string[len(UPLOAD_URL_PREFIX):])
+        if upload_path is None:
+            raise ValueError("Uploaded PDF not found or expired.")
+        return upload_path
+    # Error if the format is unexpected
+    raise ValueError("Unexpected PDF URL format.")
+
+def classify_page_needs_ocr(page: fitz.Page) -> bool:
+    """
+    Decide whether a single page needs OCR from its text layer and image area.
+    Pages with a real text layer are read directly even if they embed photos;
+    pages that are mostly image with little or no text (scans) go to OCR.
+    """
+    settings = get_settings()
+    page_area = abs(page.rect) or 1.0
+
+    image_area = 0.0
+    for image_info in page.get_image_info():
+        bbox = fitz.Rect(image_info["bbox"]) & page.rect
+        image_area += abs(bbox)
+    image_coverage = min(1.0, image_area / page_area)
+    if image_coverage < settings.PDF_OCR_MIN_IMAGE_COVERAGE:
+        return False
+
+    text_chars = 0
+    text_area = 0.0
+    for x0, y0, x1, y1, text, _block_no, block_type in page.get_text("blocks"):
+        if block_type == 0:
+            text_chars += len(text.strip())
+            text_area += abs(fitz.Rect(x0, y0, x1, y1) & page.rect)
+    text_coverage = min(1.0, text_area / page_area)
+
+    if text_chars < settings.PDF_OCR_MAX_TEXT_CHARS:
+        return True
+    return image_coverage >= settings.PDF_OCR_IMAGE_DOMINANT_COVERAGE and text_coverage < settings.PDF_OCR_MIN_TEXT_COVERAGE
+
+def _ocr_page_images(pdf_doc: fitz.Document, page: fitz.Page, ocr_parser: RapidOCRBlobParser) -> List[str]:
+    """Run OCR over the images embedded in a page."""
+    images = []
+    for image in page.get_images(full=True):
+        pix = fitz.Pixmap(pdf_doc, image[0])
+        if pix.n - pix.alpha >= 4:
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        images.append(pix.pil_image())
+    if not images:
+        return []
+    return [text for text in ocr_parser.analyze_images(images) if text]
+
+def _extract_page_tables(page: fitz.Page) -> List[str]:
+    """Extract the tables of a page as markdown."""
+    return [table.to_markdown() for table in page.find_tables().tables]
+
+def parse_pdf_page(
+    pdf_doc: fitz.Document,
+    page_number: int,
+    ocr_parser: Optional[RapidOCRBlobParser] = None,
+) -> Document:
+    """
+    Parse a single page of an open PDF. The page is routed to OCR only when
+    `ocr_parser` is given and `classify_page_needs_ocr` says it needs it.
+    """
+    page = pdf_doc[page_number]
+    needs_ocr = ocr_parser is not None and classify_page_needs_ocr(page)
+
+    parts = [page.get_text().strip()]
+    if needs_ocr:
+        parts.extend(_ocr_page_images(pdf_doc, page, ocr_parser))
+        parts.extend(_extract_page_tables(page))
+
+    return Document(
+        page_content="\n\n".join(part for part in parts if part),
+        metadata={
+            "page": page_number,
+            "total_pages": pdf_doc.page_count,
+            "ocr": needs_ocr,
+        },
     )
-    
-    pdf_blob = Blob.from_data(pdf_bytes)
-    
-    # Lazy parse the PDF blob for memory efficiency
-    docs_lazy = parser.lazy_parse(pdf_blob)
-    docs = []
-    
-    # Process pages with optional limit
-    for i, doc in enumerate(docs_lazy):
-        if max_pages and i >= max_pages:
-            break
-        docs.append(doc)
-    return docs
-
-def parse_text_from_pdf_chunked(pdf_bytes: bytes, *, chunk_size: int = 10, enable_ocr: bool = True) -> List[Document]:
+
+def parse_pdf_page_range(pdf_doc: fitz.Document, start_page: int, end_page: int, enable_ocr: bool = True) -> List[Document]:
     """
-    Parse PDF in chunks using parallel processing for large PDFs.
-    This variant allows selectively enabling or disabling OCR based on
-    heuristics computed outside of this function.
+    Parse pages [start_page, end_page) of an already open PDF, in page order.
 
     Args:
-        pdf_bytes: PDF file bytes
-        chunk_size: Number of pages to process per chunk
-        enable_ocr: Whether OCR should be enabled when parsing each chunk
+        pdf_doc: The open PDF document
+        start_page: First page to parse
+        end_page: Page after the last page to parse
+        enable_ocr: Whether pages classified as needing OCR are OCR'd
     """
-    pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    total_pages = pdf_doc.page_count
-    pdf_doc.close()
-    
-    if total_pages <= chunk_size:
-        return parse_text_from_pdf(pdf_bytes, enable_ocr=enable_ocr)
-    # Large PDF, process in parallel chunks
-    def process_chunk(start_page: int, end_page: int) -> List[Document]:
-        # Create a new PDF with only the chunk pages
-        chunk_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        new_doc = fitz.open()
-        
-        for page_num in range(start_page, min(end_page, total_pages)):
-            new_doc.insert_pdf(chunk_doc, from_page=page_num, to_page=page_num)
-        
-        chunk_bytes = new_doc.write()
-        chunk_doc.close()
-        new_doc.close()
-        
-        return parse_text_from_pdf(chunk_bytes, enable_ocr=enable_ocr)
-    
-    # Create chunks
-    chunks = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=get_settings().PDF_CHUNK_CONCURRENCY_LIMIT) as executor:
-        futures = []
-        for start in range(0, total_pages, chunk_size):
-            end = min(start + chunk_size, total_pages)
-            future = executor.submit(process_chunk, start, end)
-            futures.append(future)
-        
-        # Collect results
-        for future in concurrent.futures.as_completed(futures):
-            chunk_docs = future.result()
-            chunks.extend(chunk_docs)
+    ocr_parser = RapidOCRBlobParser() if enable_ocr else None
+    end_page = min(end_page, pdf_doc.page_count)
+    return [parse_pdf_page(pdf_doc, page_number, ocr_parser) for page_number in range(start_page, end_page)]
+
+def open_pdf(pdf: Union[bytes, Path]) -> fitz.Document:
+    """Open a PDF given as bytes or as a path to a file on disk."""
+    if isinstance(pdf, Path):
+        return fitz.open(pdf, filetype="pdf")
+    return fitz.open(stream=pdf, filetype="pdf")
+
+def parse_text_from_pdf(pdf_bytes: Union[bytes, Path], enable_ocr: bool = True, max_pages: Optional[int] = None) -> List[Document]:
+    """
+    Extracts text content from a PDF using PyMuPDF in the calling thread,
+    routing only the pages that need it to RapidOCR.
     
-    return chunks
+    Args:
+        pdf_bytes: PDF file bytes, or the path of a PDF file
+        enable_ocr: Whether pages classified as needing OCR are OCR'd
+        max_pages: Maximum number of pages to process (None for all pages)
+    """
+    pdf_doc = open_pdf(pdf_bytes)
+    try:
+        page_count = pdf_doc.page_count
+        if max_pages:
+            page_count = min(page_count, max_pages)
+        return parse_pdf_page_range(pdf_doc, 0, page_count, enable_ocr)
+    finally:
+        pdf_doc.close()
 
 async def augment_messages_with_pdf(
     original_messages: List[Dict[str, Any]], 
     pdf_text: str
 ) -> List[Dict[str, Any]]:
     """Prepares a JSON request string for the RAG model using LLMRequest.
-    The PDF text is injected as a system message before the target user message.
+    The PDF text is added for the target user message, laid out by `add_context`.
     All messages are cleaned of pdf_url content parts.
     """
     augmented_messages = original_messages
@@ -134,11 +179,6 @@ async def augment_messages_with_pdf(
     if pdf_prompt:
         system_command = pdf_prompt.format(pdf_text=pdf_text)
         system_prompt_message = ChatMessage(role=SenderTypeEnum.SYSTEM, content=system_command).model_dump()
-        last_msg_index = len(original_messages) - 1
-        augmented_messages = (
-            original_messages[:last_msg_index]
-            + [system_prompt_message]
-            + [original_messages[last_msg_index]]
-        )
+        augmented_messages = add_context(original_messages, [system_prompt_message])
 
     return augmented_messages
\ No newline at end of file
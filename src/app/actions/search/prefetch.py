@@ -0,0 +1,95 @@
+import asyncio
+import re
+from typing import List, Optional, Any
+
+from langchain_core.documents import Document
+
+from ...config import get_settings
+from ...logger import log
+from ...rag import PandaWebRetriever
+
+MAX_KEYWORD_PHRASES = 5
+
+def extract_search_keywords(text: str) -> str:
+    """
+    Cheap keyword extraction for a speculative search query using rake-nltk.
+    Falls back to the raw text when the NLTK data is not available.
+    """
+    try:
+        from rake_nltk import Rake
+
+        rake = Rake(max_length=3)
+        rake.extract_keywords_from_text(text)
+        phrases = rake.get_ranked_phrases()[:MAX_KEYWORD_PHRASES]
+        if phrases:
+            return " ".join(phrases)
+    except Exception as e:
+        log.warning(f"Keyword extraction failed, prefetching with the raw message: {e}")
+    return text.strip()
+
+def query_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the word sets of two queries."""
+    words_a = set(re.findall(r"\w+", a.lower()))
+    words_b = set(re.findall(r"\w+", b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+class SearchPrefetch:
+    """
+    Speculative web search started on the last user message while the
+    classifier decides whether a search is needed. The results are handed to
+    `search_stream` when the classifier's query is close enough, and dropped
+    otherwise.
+    """
+
+    def __init__(self, message_text: str, user_id: str, vector_store: Optional[Any] = None, latency_budget: Optional[Any] = None):
+        self.user_id = user_id
+        self.query = extract_search_keywords(message_text)
+        retriever = PandaWebRetriever(
+            num_search_results=2,
+            vector_store=vector_store,
+            latency_budget=latency_budget,
+        )
+        self.task = asyncio.create_task(retriever.ainvoke(self.query))
+        log.info(f"Started speculative search prefetch", extra={"user_id": user_id, "prefetch_query": self.query})
+
+    def _record(self, outcome: str, similarity: float | None = None) -> None:
+        log.info(
+            f"Search prefetch {outcome}",
+            extra={
+                "metric": "search_prefetch",
+                "outcome": outcome,
+                "user_id": self.user_id,
+                "similarity": None if similarity is None else round(similarity, 3),
+            },
+        )
+
+    def discard(self, reason: str) -> None:
+        """Cancel the prefetch if it is still running and record why it went unused."""
+        if not self.task.done():
+            self.task.cancel()
+        self._record(reason)
+
+    async def take(self, query: str) -> Optional[List[Document]]:
+        """
+        Return the prefetched documents if `query` matches the prefetch query
+        closely enough, otherwise discard them and return None.
+        """
+        similarity = query_similarity(self.query, query)
+        if similarity < get_settings().SEARCH_PREFETCH_MIN_SIMILARITY:
+            self.discard("mismatch")
+            return None
+
+        try:
+            docs = await self.task
+        except Exception as e:
+            log.error(f"Search prefetch failed: {e}", exc_info=True)
+            self._record("failed", similarity)
+            return None
+
+        if not docs:
+            self._record("empty", similarity)
+            return None
+        self._record("used", similarity)
+        return docs
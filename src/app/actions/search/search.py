@@ -7,30 +7,51 @@ from ...logger import log
 from ...api.helper.request_llm import arequest_llm, get_user_collection_name
 from ...api.helper.request_summary import call_summarization_llm
 from ...api.v1.schemas import LLMRequest
-from ...rag import PandaWebRetriever
+from ...rag import PandaWebRetriever, LatencyBudget, get_token_counter
+from ...rag.latency_budget import SKIP_RERANKING, SKIP_SUMMARIZATION
 from ...dependencies import get_milvus_wrapper
 from ...api.helper.format_sse import format_sse_message, create_random_event_id
-from .utils import augment_messages_with_search
+from ...api.helper.streaming import DisconnectAwareStreamingResponse, close_upstream
+from .utils import augment_messages_with_search, retrieve_stored_web_chunks
 from .models import SearchToolArgs
+from .prefetch import SearchPrefetch
 from ...config import get_settings
 
-async def search_handler(payload: LLMRequest, user_id: str, search_query_args: str) -> StreamingResponse:
+async def search_handler(
+    payload: LLMRequest,
+    user_id: str,
+    search_query_args: str,
+    latency_budget: LatencyBudget | None = None,
+    prefetch: SearchPrefetch | None = None,
+) -> StreamingResponse:
     """
     Handle search functionality by augmenting the request with search results.
     """
-    return StreamingResponse(search_stream(payload, user_id, search_query_args), media_type="text/event-stream")
+    return DisconnectAwareStreamingResponse(search_stream(payload, user_id, search_query_args, latency_budget, prefetch), media_type="text/event-stream")
 
-async def search_stream(payload: LLMRequest, user_id: str, search_query_args: str) -> AsyncGenerator[str, None]:
+async def search_stream(
+    payload: LLMRequest,
+    user_id: str,
+    search_query_args: str,
+    latency_budget: LatencyBudget | None = None,
+    prefetch: SearchPrefetch | None = None,
+) -> AsyncGenerator[str, None]:
     """
     Handle search functionality by augmenting the request with search results.
+    The stages before generation share `latency_budget` and degrade when it runs short.
+    Results of a speculative `prefetch` are reused when its query matches.
     """
-    
+    if latency_budget is None:
+        latency_budget = LatencyBudget(get_settings().SEARCH_LATENCY_BUDGET_SECONDS, user_id=user_id)
+
+
     try:
         decoded_search_query_args = SearchToolArgs.model_validate_json(search_query_args)
     except Exception as e:
         log.error(f"Error validating search query args: {e}", exc_info=True)
         decoded_search_query_args = SearchToolArgs(query=search_query_args)
-    
+
+    llm_response = None
     try:
         yield format_sse_message(
             data={
@@ -58,19 +79,87 @@ async def search_stream(payload: LLMRequest, user_id: str, search_query_args: st
             },
         )
         
-        retriever = PandaWebRetriever(num_search_results=num_search_results)
+        settings = get_settings()
+        user_collection_name = get_user_collection_name(user_id)
+        milvus_instance = get_milvus_wrapper()
+        loop = asyncio.get_running_loop()
+
+        # Check chunks stored by earlier searches before going to the web
+        stored_results = []
+        try:
+            stored_results = await asyncio.wait_for(
+                loop.run_in_executor(
+                    None,
+                    retrieve_stored_web_chunks,
+                    user_collection_name,
+                    actual_search_query
+                ),
+                timeout=latency_budget.stage_timeout("stored_chunks"),
+            )
+        except asyncio.TimeoutError:
+            latency_budget.record_timeout("stored_chunks")
+        except Exception as e:
+            log.error(f"Error looking up stored search results: {e}", exc_info=True)
+
+        if len(stored_results) >= settings.SEARCH_STORE_MIN_HITS:
+            store_status = "hit"
+        elif stored_results:
+            store_status = "partial"
+        else:
+            store_status = "miss"
+        log.info(f"Stored search results lookup", extra={"user_id": user_id, "store_status": store_status, "store_hits": len(stored_results)})
 
         yield format_sse_message(
             data={
                 "object": "process.event",
                 "id": create_random_event_id(),
                 "type": "search",
-                "message": "Searching through URLs",
-                "data": {}
+                "message": "Reusing recent search results" if store_status != "miss" else "",
+                "data": {
+                    "stored_results": {
+                        "status": store_status,
+                        "count": len(stored_results),
+                        "urls": list(set(result.metadata.get("source", "") for result in stored_results) - {""}),
+                    }
+                },
             },
         )
 
-        search_results = await retriever.ainvoke(actual_search_query)
+        live_results = []
+        prefetched_results = None
+        if prefetch is not None:
+            if store_status == "hit":
+                prefetch.discard("store_hit")
+            else:
+                prefetched_results = await prefetch.take(actual_search_query)
+
+        if prefetched_results is not None:
+            live_results = prefetched_results
+        elif store_status != "hit":
+            # Shrink the live search when part of the answer is already stored
+            retriever = PandaWebRetriever(
+                num_search_results=1 if store_status == "partial" else num_search_results,
+                max_urls_to_process=2 if store_status == "partial" else 5,
+                vector_store=milvus_instance,
+                latency_budget=latency_budget,
+            )
+
+            yield format_sse_message(
+                data={
+                    "object": "process.event",
+                    "id": create_random_event_id(),
+                    "type": "search",
+                    "message": "Searching through URLs",
+                    "data": {}
+                },
+            )
+
+            live_results = await retriever.ainvoke(actual_search_query)
+
+        stored_texts = {result.page_content for result in stored_results}
+        live_results = [result for result in live_results if result.page_content not in stored_texts]
+
+        search_results = stored_results + live_results
         if not search_results:
             yield format_sse_message(
                 data="[RAG_DONE]"
@@ -90,22 +179,28 @@ async def search_stream(payload: LLMRequest, user_id: str, search_query_args: st
                 "message": "",
                 "data": {
                     "urls": list(
-                        set(result.metadata["source"] for result in search_results)
+                        set(result.metadata.get("source", "") for result in search_results) - {""}
                     )
                 },
             },
         )
         
-        user_collection_name = get_user_collection_name(user_id)
-        milvus_instance = get_milvus_wrapper()
-        
-        # Run the milvus operation
-        loop = asyncio.get_running_loop()
+        # Rank the chunks against the query, reusing the embeddings computed by the
+        # retriever and those stored with the chunks found in Milvus
+        if not latency_budget.should_degrade(SKIP_RERANKING):
+            search_results = await loop.run_in_executor(
+                None,
+                milvus_instance.rank_documents,
+                actual_search_query,
+                search_results
+            )
+
+        # Run the milvus operation, storing only the newly fetched chunks
         from_doc_job = loop.run_in_executor(
             None,
             milvus_instance.from_documents_for_user, 
             user_collection_name, 
-            search_results
+            live_results
         )
 
         # Create background task to handle vector DB completion
@@ -132,9 +227,45 @@ async def search_stream(payload: LLMRequest, user_id: str, search_query_args: st
 
         # Summarize the search results with the LLM
         search_results_str = "\n\n".join([result.page_content for result in search_results])
-        if len(search_results_str) / 3 > get_settings().MAX_MODEL_LENGTH * 0.25:
-            log.info(f"Summarizing search results")
-            search_results_str = await call_summarization_llm(search_results_str, 500)
+        max_search_results_tokens = int(get_settings().MAX_MODEL_LENGTH * 0.25)
+        token_counter = get_token_counter()
+        if await loop.run_in_executor(None, token_counter.count, search_results_str) > max_search_results_tokens:
+            summarized = None
+            if not latency_budget.should_degrade(SKIP_SUMMARIZATION):
+                log.info(f"Summarizing search results")
+                try:
+                    summarized = await asyncio.wait_for(
+                        call_summarization_llm(search_results_str, 500, user_id=user_id, extractive_fast_path=True),
+                        timeout=latency_budget.stage_timeout("summarization"),
+                    )
+                except asyncio.TimeoutError:
+                    latency_budget.record_timeout("summarization")
+            # Without a summary, keep the most relevant chunks that fit
+            search_results_str = summarized or await loop.run_in_executor(
+                None, token_counter.truncate, search_results_str, max_search_results_tokens
+            )
+
+        if latency_budget.degradations:
+            yield format_sse_message(
+                data={
+                    "object": "process.event",
+                    "id": create_random_event_id(),
+                    "type": "search",
+                    "message": "",
+                    "data": {
+                        "degradations": latency_budget.degradations,
+                    },
+                },
+            )
+        log.info(
+            f"Search pipeline finished",
+            extra={
+                "metric": "search_pipeline_latency",
+                "user_id": user_id,
+                "elapsed_s": round(latency_budget.elapsed(), 3),
+                "degradations": ",".join(latency_budget.degradations),
+            },
+        )
 
         yield format_sse_message(
             data="[RAG_DONE]"
@@ -175,4 +306,10 @@ async def search_stream(payload: LLMRequest, user_id: str, search_query_args: st
         )
         # Terminate the stream
         return
-
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away, stop searching
+        if prefetch is not None and not prefetch.task.done():
+            prefetch.discard("disconnected")
+        raise
+    finally:
+        await close_upstream(llm_response)
@@ -1,10 +1,51 @@
 from typing import List, Dict, Any, Optional
+from langchain_core.documents import Document
 
 from ...config import get_settings
 from ...api.helper.get_system_prompt import get_system_prompt
+from ...api.helper.prompt_layout import add_context
+from ...dependencies import get_milvus_wrapper, get_reranker
+from ...milvus import DOC_TYPE_WEB
+from ...logger import log
 
 settings = get_settings()
 
+def retrieve_stored_web_chunks(user_collection_name: str, query: str) -> List[Document]:
+    """
+    Look up web chunks previously stored for the user that are recent and
+    relevant enough to answer the query without a new web search.
+    Returns the chunks scoring above `SEARCH_STORE_MIN_SCORE`, best first.
+    """
+    candidates = get_milvus_wrapper().similarity_search_for_user(
+        user_collection_name,
+        query,
+        k=settings.SEARCH_STORE_CANDIDATES,
+        doc_type=DOC_TYPE_WEB,
+        max_age_seconds=settings.SEARCH_STORE_MAX_AGE_SECONDS,
+        with_vectors=True,
+    )
+    if not candidates:
+        return []
+
+    reranked = get_reranker()(
+        query=query,
+        documents=[doc.page_content for doc in candidates],
+        top_k=len(candidates),
+    )
+
+    seen, picked = set(), []
+    for result in sorted(reranked, key=lambda r: -r.score):
+        if result.score < settings.SEARCH_STORE_MIN_SCORE:
+            break
+        doc_key = hash(result.text.strip())
+        if doc_key in seen:
+            continue
+        seen.add(doc_key)
+        picked.append(candidates[result.index])
+
+    log.info(f"Found {len(picked)}/{len(candidates)} stored web chunks above the relevance threshold")
+    return picked
+
 async def augment_messages_with_search(
     original_messages: List[Dict[str, Any]],
     search_results_str: Optional[str]
@@ -27,12 +68,4 @@ async def augment_messages_with_search(
             "content": search_result_prompt.format(search_results_str=search_results_str)
         }
 
-    last_msg_index = len(original_messages) - 1
-    augmented_messages = (
-        original_messages[:last_msg_index]
-        + [system_command or None]
-        + [system_information or None]
-        + [original_messages[last_msg_index]]
-    )
-
-    return augmented_messages
\ No newline at end of file
+    return add_context(original_messages, [system_command or None, system_information or None])
\ No newline at end of file
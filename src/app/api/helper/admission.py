@@ -0,0 +1,204 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from ...config import get_settings
+from ...logger import log
+from .streaming import DisconnectAwareStreamingResponse
+
+# Chat completions streamed from vLLM for logged-in users
+LANE_GENERATION = "generation"
+# The same for API-key traffic, so it cannot crowd out the app's users
+LANE_API_KEY = "api_key"
+# Searches and PDF chats, which parse, embed and summarize before generating
+LANE_HEAVY = "heavy"
+
+# Weight of the latest request in the average time a slot is held
+_HOLD_TIME_SMOOTHING = 0.1
+
+class AdmissionSlot:
+    """One admitted request. Released exactly once, however often `release` is called."""
+
+    def __init__(self, lane: "AdmissionLane"):
+        self._lane = lane
+        self._admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._lane._release(time.monotonic() - self._admitted_at)
+
+    def hold_until_sent(self, response: Response) -> Response:
+        """
+        Keeps the slot until a streaming response has been sent, or the client
+        went away; any other response releases it right away.
+        """
+        if not isinstance(response, StreamingResponse):
+            self.release()
+            return response
+        return AdmittedStreamingResponse(
+            response.body_iterator,
+            slot=self,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            background=response.background,
+        )
+
+class AdmittedStreamingResponse(DisconnectAwareStreamingResponse):
+    """StreamingResponse that releases its admission slot when sending ends, for any reason."""
+
+    def __init__(self, content, slot: AdmissionSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+class AdmissionLane:
+    """
+    At most `max_in_flight` requests at a time in this worker. Excess
+    requests wait in FIFO order, at most `max_queue` of them and each for at
+    most `max_wait_seconds`; beyond that they get a 429 with `Retry-After`.
+    `max_in_flight` of 0 or less admits everything.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, max_wait_seconds: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max(0, max_queue)
+        self.max_wait_seconds = max_wait_seconds
+        self._in_flight = 0
+        self._waiting: Deque[asyncio.Future] = deque()
+        self._avg_hold_seconds = 1.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    async def admit(self, user_id: Optional[str] = None) -> AdmissionSlot:
+        enqueued_at = time.monotonic()
+        if self.max_in_flight <= 0 or (self._in_flight < self.max_in_flight and not self._waiting):
+            self._in_flight += 1
+            self._log("admitted", user_id, enqueued_at)
+            return AdmissionSlot(self)
+
+        if len(self._waiting) >= self.max_queue:
+            self._reject("queue_full", user_id, enqueued_at)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended
+                if isinstance(e, asyncio.TimeoutError):
+                    self._log("admitted", user_id, enqueued_at)
+                    return AdmissionSlot(self)
+                self._release(None)
+                raise
+            waiter.cancel()
+            try:
+                self._waiting.remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("timeout", user_id, enqueued_at)
+
+        self._log("admitted", user_id, enqueued_at)
+        return AdmissionSlot(self)
+
+    def _release(self, held_seconds: Optional[float]) -> None:
+        if held_seconds is not None:
+            self._avg_hold_seconds += _HOLD_TIME_SMOOTHING * (held_seconds - self._avg_hold_seconds)
+        while self._waiting:
+            waiter = self._waiting.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next request in line
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def retry_after_seconds(self) -> int:
+        """Rough time until the queue has room again."""
+        slots = max(1, self.max_in_flight)
+        return max(1, math.ceil(self._avg_hold_seconds * (len(self._waiting) + 1) / slots))
+
+    def _reject(self, reason: str, user_id: Optional[str], enqueued_at: float) -> None:
+        self._log(f"rejected_{reason}", user_id, enqueued_at)
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy, please retry later",
+            headers={"Retry-After": str(self.retry_after_seconds())},
+        )
+
+    def _log(self, outcome: str, user_id: Optional[str], enqueued_at: float) -> None:
+        log.info(
+            f"Admission {outcome}",
+            extra={
+                "metric": "admission",
+                "lane": self.name,
+                "outcome": outcome,
+                "user_id": user_id,
+                "wait_s": round(time.monotonic() - enqueued_at, 3),
+                "in_flight": self._in_flight,
+                "queued": len(self._waiting),
+            },
+        )
+
+class AdmissionController:
+    """The admission lanes of this worker."""
+
+    def __init__(self, lanes: Dict[str, AdmissionLane]):
+        self.lanes = lanes
+
+    async def admit(self, lane: str, user_id: Optional[str] = None) -> AdmissionSlot:
+        return await self.lanes[lane].admit(user_id)
+
+    async def admit_response(self, lane: str, respond: Callable[[], Awaitable[Response]], user_id: Optional[str] = None) -> Response:
+        """Produces the response of `respond` inside a slot of `lane`, held until it is sent."""
+        slot = await self.admit(lane, user_id)
+        try:
+            response = await respond()
+        except BaseException:
+            slot.release()
+            raise
+        return slot.hold_until_sent(response)
+
+_admission_controller_instance: AdmissionController | None = None
+
+def get_admission_controller() -> AdmissionController:
+    global _admission_controller_instance
+    if _admission_controller_instance is None:
+        settings = get_settings()
+        lane_limits = {
+            LANE_GENERATION: settings.ADMISSION_MAX_GENERATIONS,
+            LANE_API_KEY: settings.ADMISSION_MAX_API_KEY_GENERATIONS,
+            LANE_HEAVY: settings.ADMISSION_MAX_HEAVY,
+        }
+        _admission_controller_instance = AdmissionController({
+            name: AdmissionLane(
+                name,
+                max_in_flight=max_in_flight,
+                max_queue=settings.ADMISSION_MAX_QUEUE,
+                max_wait_seconds=settings.ADMISSION_MAX_WAIT_SECONDS,
+            )
+            for name, max_in_flight in lane_limits.items()
+        })
+    return _admission_controller_instance
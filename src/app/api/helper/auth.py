@@ -1,20 +1,87 @@
 from dataclasses import dataclass
+import hashlib
+import hmac
+import threading
+import time
+from functools import lru_cache
+from typing import Tuple
 import jwt
+from cachetools import LRUCache
 from fastapi import HTTPException, Header, Request
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 
 from ...config import get_settings
 from ...logger import log
 
-limiter = Limiter(key_func=get_remote_address, storage_uri="memory://")
-
 @dataclass
 class AuthInfo:
     user_id: str
     is_api_key: bool = False
+    # SHA-256 of the whole API key, hex encoded; `user_id` only shows its start
+    api_key_hash: str | None = None
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+@lru_cache(maxsize=4)
+def _load_jwt_key(pem: str, algorithm: str):
+    """The public key parsed once, instead of from the PEM on every `jwt.decode`."""
+    return jwt.algorithms.get_default_algorithms()[algorithm].prepare_key(pem)
+
+@lru_cache(maxsize=4)
+def _api_key_digests(api_keys: Tuple[str, ...]) -> Tuple[bytes, ...]:
+    """SHA-256 digests of the API keys, computed once per set of keys."""
+    return tuple(_token_digest(api_key) for api_key in api_keys)
+
+def _is_api_key(digest: bytes, api_keys: Tuple[str, ...]) -> bool:
+    """
+    Whether `digest` is the digest of one of the API keys. Every key is
+    compared in constant time, and none is skipped on a match.
+    """
+    matched = False
+    for api_key_digest in _api_key_digests(api_keys):
+        matched |= hmac.compare_digest(digest, api_key_digest)
+    return matched
+
+class VerifiedTokenCache:
+    """
+    Claims of JWTs whose signature was already verified, by SHA-256 of the
+    token, so a token reused for its whole lifetime is verified once.
+    Entries are only returned before the token's `exp`.
+    """
+
+    def __init__(self, maxsize: int):
+        self.enabled = maxsize > 0
+        self._entries: LRUCache = LRUCache(maxsize=max(1, maxsize))
+        # Sync dependencies run in the thread pool
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> AuthInfo | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            auth_info, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[digest]
+                return None
+            return auth_info
+
+    def put(self, digest: bytes, auth_info: AuthInfo, expires_at: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[digest] = (auth_info, expires_at)
+
+_verified_token_cache_instance: VerifiedTokenCache | None = None
+
+def get_verified_token_cache() -> VerifiedTokenCache:
+    global _verified_token_cache_instance
+    if _verified_token_cache_instance is None:
+        _verified_token_cache_instance = VerifiedTokenCache(maxsize=get_settings().JWT_VERIFIED_CACHE_SIZE)
+    return _verified_token_cache_instance
 
-@limiter.limit("10/minute")
 def verify_authorization_header(request: Request, authorization: str = Header(None)) -> AuthInfo:
     """
     Verify the authorization header.
@@ -37,14 +104,20 @@ def verify_authorization_header(request: Request, authorization: str = Header(No
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     token = authorization.split("Bearer ")[1]
+    digest = _token_digest(token)
 
     # First check if it's a direct API key (no Bearer prefix)
-    if token in settings.API_KEYS:
-        return AuthInfo(user_id=f"api_key_{token[:8]}", is_api_key=True)
-    
+    if _is_api_key(digest, tuple(settings.API_KEYS)):
+        return AuthInfo(user_id=f"api_key_{token[:8]}", is_api_key=True, api_key_hash=digest.hex())
+
+    verified_tokens = get_verified_token_cache()
+    auth_info = verified_tokens.get(digest)
+    if auth_info is not None:
+        return auth_info
+
     # Verify as JWT
-    jwt_pub_key = settings.JWT_PUB_KEY
     jwt_algorithm = settings.JWT_ALGORITHM
+    jwt_pub_key = _load_jwt_key(settings.JWT_PUB_KEY, jwt_algorithm)
     app_id = settings.APP_ID
 
     try:
@@ -56,7 +129,11 @@ def verify_authorization_header(request: Request, authorization: str = Header(No
             algorithms=[jwt_algorithm],
             options={"verify_exp": True}
         )
-        return AuthInfo(user_id=payload["sub"])
+        auth_info = AuthInfo(user_id=payload["sub"])
+        # Tokens without an expiry are verified every time
+        if "exp" in payload:
+            verified_tokens.put(digest, auth_info, float(payload["exp"]))
+        return auth_info
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError as e:
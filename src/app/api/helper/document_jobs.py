@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional, Union
+
+from fastapi import HTTPException
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ...actions.pdf.cache import get_pdf_cache, pdf_cache_key
+from ...actions.pdf.engine import get_pdf_engine
+from ...config import get_settings
+from ...dependencies import get_milvus_wrapper
+from ...logger import log
+from ...milvus import DOC_TYPE_PDF, DOC_TYPE_TEXT
+from .request_llm import get_user_collection_name
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Same chunking as web pages, so text documents rank alongside them
+TEXT_CHUNK_SIZE = 1500
+TEXT_CHUNK_OVERLAP = 50
+TEXT_INGEST_BATCH = 64
+
+@dataclass
+class DocumentJob:
+    """Status of one background ingestion, as returned by the polling endpoint."""
+    id: str
+    owner: str
+    kind: str
+    status: str = JOB_QUEUED
+    done: int = 0
+    total: Optional[int] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+def _owner(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode()).hexdigest()
+
+class DocumentJobQueue:
+    """
+    Background ingestion of documents into a user's Milvus collection.
+    Jobs wait in a bounded queue and run on a fixed number of worker tasks;
+    parsing itself happens on the shared PDF process pool. Job status is kept
+    as small JSON files under `jobs_dir` so any worker process can answer a
+    status poll.
+    """
+
+    def __init__(self, workers: int, max_queued: int, jobs_dir: str, ttl_seconds: int):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.jobs_dir = Path(jobs_dir)
+        self.ttl_seconds = ttl_seconds
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def submit(self, user_id: str, kind: str, content: Union[bytes, Path, str], source: Optional[str] = None) -> DocumentJob:
+        """
+        Queue a document for ingestion and return its job.
+
+        Raises:
+            HTTPException: If the queue is full
+        """
+        self._start_workers()
+        job = DocumentJob(id=uuid.uuid4().hex, owner=_owner(user_id), kind=kind)
+        try:
+            self._queue.put_nowait((job, user_id, content, source))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=429, detail="Too many documents are being processed, try again later")
+        self._save(job)
+        log.info(f"Queued document job", extra={"user_id": user_id, "job_id": job.id, "job_kind": kind, "queued_jobs": self._queue.qsize()})
+        return job
+
+    def get(self, user_id: str, job_id: str) -> Optional[DocumentJob]:
+        """The user's job with the given id, or None if it is unknown or expired."""
+        if not job_id.isalnum():
+            return None
+        path = self.jobs_dir / f"{job_id}.json"
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path) as f:
+                job = DocumentJob(**json.load(f))
+        except FileNotFoundError:
+            return None
+        if job.owner != _owner(user_id):
+            return None
+        return job
+
+    def shutdown(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
+        self._queue = None
+
+    def _start_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        if not self._worker_tasks:
+            self._prune()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        queue = self._queue
+        while True:
+            job, user_id, content, source = await queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            self._save(job)
+            try:
+                if job.kind == DOC_TYPE_PDF:
+                    await self._ingest_pdf(job, user_id, content)
+                else:
+                    await self._ingest_text(job, user_id, content, source)
+                job.status = JOB_SUCCEEDED
+            except asyncio.CancelledError:
+                job.status = JOB_FAILED
+                job.error = "Server shutting down"
+                raise
+            except Exception as e:
+                log.error(f"Document job {job.id} failed: {e}", exc_info=True)
+                job.status = JOB_FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._save(job)
+                queue.task_done()
+            log.info(
+                f"Document job finished",
+                extra={
+                    "user_id": user_id,
+                    "job_id": job.id,
+                    "job_status": job.status,
+                    "job_kind": job.kind,
+                    "queue_wait_s": round(job.started_at - job.created_at, 3),
+                    "run_s": round(job.finished_at - job.started_at, 3),
+                },
+            )
+
+    async def _ingest_pdf(self, job: DocumentJob, user_id: str, pdf: Union[bytes, Path]) -> None:
+        settings = get_settings()
+        pdf_cache = get_pdf_cache()
+        key = pdf_cache_key(pdf)
+        collection_name = get_user_collection_name(user_id)
+        milvus_instance = get_milvus_wrapper()
+        loop = asyncio.get_running_loop()
+
+        entry = pdf_cache.get(key)
+        if entry is not None and pdf_cache.is_ingested(key, collection_name):
+            job.done = job.total = len(entry.docs)
+            return
+
+        if entry is not None:
+            docs = entry.copy_docs()
+            job.total = len(docs)
+            await loop.run_in_executor(None, milvus_instance.from_documents_for_user, collection_name, docs, DOC_TYPE_PDF)
+            job.done = len(docs)
+        else:
+            engine = get_pdf_engine()
+            docs = []
+            # Ranges keep parsing on the pool while earlier ones are embedded
+            async for parsed in engine.parse_ranges(pdf, max_pages=settings.PDF_MAX_PAGES):
+                job.total = parsed.page_count
+                docs.extend(parsed.docs)
+                ingest_docs = [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in parsed.docs]
+                await loop.run_in_executor(None, milvus_instance.from_documents_for_user, collection_name, ingest_docs, DOC_TYPE_PDF)
+                job.done += len(parsed.docs)
+                self._save(job)
+            pdf_cache.put(key, docs)
+        pdf_cache.mark_ingested(key, collection_name)
+
+    async def _ingest_text(self, job: DocumentJob, user_id: str, text: str, source: Optional[str]) -> None:
+        collection_name = get_user_collection_name(user_id)
+        milvus_instance = get_milvus_wrapper()
+        loop = asyncio.get_running_loop()
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=TEXT_CHUNK_SIZE, chunk_overlap=TEXT_CHUNK_OVERLAP)
+        docs = splitter.create_documents([text], metadatas=[{"source": source or ""}])
+        job.total = len(docs)
+        self._save(job)
+        for start in range(0, len(docs), TEXT_INGEST_BATCH):
+            batch = docs[start:start + TEXT_INGEST_BATCH]
+            await loop.run_in_executor(None, milvus_instance.from_documents_for_user, collection_name, batch, DOC_TYPE_TEXT)
+            job.done += len(batch)
+            self._save(job)
+
+    def _save(self, job: DocumentJob) -> None:
+        path = self.jobs_dir / f"{job.id}.json"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(asdict(job), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log.warning(f"Failed to write status of document job {job.id}: {e}")
+
+    def _prune(self) -> None:
+        now = time.time()
+        for path in self.jobs_dir.glob("*.json"):
+            try:
+                if now - path.stat().st_mtime > self.ttl_seconds:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                continue
+
+_document_jobs_instance: DocumentJobQueue | None = None
+
+def get_document_jobs() -> DocumentJobQueue:
+    global _document_jobs_instance
+    if _document_jobs_instance is None:
+        settings = get_settings()
+        _document_jobs_instance = DocumentJobQueue(
+            workers=settings.DOCUMENT_JOB_WORKERS,
+            max_queued=settings.DOCUMENT_JOB_QUEUE_SIZE,
+            jobs_dir=settings.DOCUMENT_JOB_DIR or os.path.join(tempfile.gettempdir(), "panda-document-jobs"),
+            ttl_seconds=settings.DOCUMENT_JOB_TTL_SECONDS,
+        )
+    return _document_jobs_instance
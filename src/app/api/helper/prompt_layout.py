@@ -0,0 +1,62 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ...config import get_settings
+from ...logger import log
+
+# Context is inserted as system messages before the last user message
+PROMPT_LAYOUT_INTERLEAVED = "interleaved"
+# Context goes after the last user message, so the earlier turns stay a cacheable prefix
+PROMPT_LAYOUT_PREFIX_CACHE = "prefix_cache"
+
+Message = Dict[str, Any]
+
+def current_date() -> str:
+    """
+    The date for the system prompt, only as precise as SYSTEM_PROMPT_DATE_FORMAT,
+    so the prompt's first message stays byte for byte the same meanwhile.
+    """
+    return datetime.now().strftime(get_settings().SYSTEM_PROMPT_DATE_FORMAT)
+
+def add_context(messages: List[Message], context: List[Optional[Message]]) -> List[Message]:
+    """
+    Adds retrieved context (search results, PDF text, documents) for the last
+    user message, laid out per PROMPT_LAYOUT.
+
+    Either way the context keeps its role. With the prefix cache layout, it
+    follows the last user message instead of preceding it. Clients do not
+    send the context back, so the next turn still shares everything up to
+    that message with this one. Chat templates that gather system messages
+    at the start of the prompt (like DeepSeek-R1's) defeat this layout.
+    """
+    context = [message for message in context if message is not None]
+    if not context or not messages:
+        return messages
+    if get_settings().PROMPT_LAYOUT == PROMPT_LAYOUT_PREFIX_CACHE:
+        return messages + context
+    return messages[:-1] + context + messages[-1:]
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+def log_prompt_hashes(messages: List[Message], user_id: Optional[str] = None) -> None:
+    """
+    Logs hashes of the system prompt, of the history before the last message
+    and of the whole prompt. Across the turns of a conversation, the system
+    and history hashes should recur, as prefixes vLLM can take from its cache.
+    """
+    system = messages[0] if messages and messages[0].get("role") == "system" else None
+    log.info(
+        f"Prompt hashes",
+        extra={
+            "metric": "prompt_hashes",
+            "user_id": user_id,
+            "layout": get_settings().PROMPT_LAYOUT,
+            "messages": len(messages),
+            "system_hash": _digest(system) if system is not None else None,
+            "history_hash": _digest(messages[:-1]),
+            "prompt_hash": _digest(messages),
+        },
+    )
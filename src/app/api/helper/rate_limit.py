@@ -0,0 +1,232 @@
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Protocol, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from ...config import get_settings
+from ...logger import log
+from .auth import verify_authorization_header, AuthInfo
+
+# Chat completions without actions
+RATE_LIMIT_CHAT = "chat"
+# Search, PDFs, document ingestion and summaries
+RATE_LIMIT_EXPENSIVE = "expensive"
+# Every request, per client address, checked before authentication
+RATE_LIMIT_ADDRESS = "address"
+
+_PERIOD_SECONDS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+# Buckets untouched for this long are full again and can be forgotten
+_STALE_SECONDS = 24 * 60 * 60
+_PRUNE_EVERY = 1000
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket holding `capacity` requests, refilled continuously."""
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        """Parses limits written like slowapi's, e.g. "10/minute" or "100 per hour"."""
+        match = re.fullmatch(r"\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*", spec)
+        if match is None:
+            raise ValueError(f"Invalid rate limit: {spec!r}")
+        count, period = int(match.group(1)), match.group(2)
+        return cls(capacity=float(count), refill_per_second=count / _PERIOD_SECONDS[period])
+
+class RateLimitStore(Protocol):
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        """
+        Takes one token from the bucket `key`. Returns 0 when it was taken,
+        otherwise the seconds until a token will be available.
+        """
+        ...
+
+def _refill(tokens: float, updated_at: float, limit: RateLimit, now: float) -> float:
+    return min(limit.capacity, tokens + max(0.0, now - updated_at) * limit.refill_per_second)
+
+def _take_from(tokens: float, limit: RateLimit) -> Tuple[float, float]:
+    """The tokens left, and the wait in seconds (0 when the token was taken)."""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.refill_per_second
+
+class MemoryRateLimitStore:
+    """Buckets in this process only; for a single worker and for tests."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.capacity, now))
+            tokens, wait = _take_from(_refill(tokens, updated_at, limit, now), limit)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+class SqliteRateLimitStore:
+    """
+    Buckets in an SQLite file that every gunicorn worker opens, by default
+    on the /dev/shm tmpfs so updates never touch the disk. Each take is one
+    short write transaction, so the workers see a single bucket per key.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row is not None else (limit.capacity, now)
+            tokens, wait = _take_from(_refill(tokens, updated_at, limit, now), limit)
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now)
+            )
+            self._takes += 1
+            if self._takes % _PRUNE_EVERY == 0:
+                connection.execute("DELETE FROM buckets WHERE updated_at < ?", (now - _STALE_SECONDS,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+def default_rate_limit_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "panda-vllm-proxy-rate-limits.sqlite")
+
+def _bucket_subject(auth_info: AuthInfo) -> str:
+    # API keys sharing their first characters, and so their user_id, get buckets of their own
+    if auth_info.api_key_hash is not None:
+        return f"api_key:{auth_info.api_key_hash}"
+    return auth_info.user_id
+
+class RateLimiter:
+    """
+    Token buckets per user or API key, with a separate limit for each kind of
+    request, and per client address for every request.
+    """
+
+    def __init__(self, store: RateLimitStore, limits: Dict[str, RateLimit]):
+        self.store = store
+        self.limits = limits
+
+    def _take(self, kind: str, subject: str) -> float:
+        try:
+            return self.store.take(f"{kind}:{subject}", self.limits[kind], time.time())
+        except sqlite3.Error as e:
+            # A broken store must not take the API down with it
+            log.error(f"Rate limit store failed, allowing the request: {e}")
+            return 0.0
+
+    def retry_after(self, auth_info: AuthInfo, kind: str) -> float:
+        """Takes a token for a `kind` request; returns 0, or the seconds to wait."""
+        return self._take(kind, _bucket_subject(auth_info))
+
+    def check(self, auth_info: AuthInfo, kind: str) -> None:
+        """Raises 429 with `Retry-After` when the user is over the limit for `kind`."""
+        wait = self.retry_after(auth_info, kind)
+        if wait > 0:
+            _reject(wait, kind, user_id=auth_info.user_id, is_api_key=auth_info.is_api_key)
+
+    def check_address(self, address: str) -> None:
+        """Raises 429 with `Retry-After` when the client address is over its limit."""
+        wait = self._take(RATE_LIMIT_ADDRESS, address)
+        if wait > 0:
+            _reject(wait, RATE_LIMIT_ADDRESS, client_address=address)
+
+def _reject(wait: float, kind: str, **context) -> None:
+    log.warning(
+        f"Rate limit exceeded",
+        extra={
+            "metric": "rate_limited",
+            **context,
+            "kind": kind,
+            "retry_after_s": round(wait, 3),
+        },
+    )
+    raise HTTPException(
+        status_code=429,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+_rate_limiter_instance: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter_instance
+    if _rate_limiter_instance is None:
+        settings = get_settings()
+        if settings.RATE_LIMIT_STORE == "memory":
+            store = MemoryRateLimitStore()
+        elif settings.RATE_LIMIT_STORE == "sqlite":
+            store = SqliteRateLimitStore(settings.RATE_LIMIT_DB_PATH or default_rate_limit_path())
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_STORE {settings.RATE_LIMIT_STORE!r}")
+        _rate_limiter_instance = RateLimiter(
+            store,
+            {
+                RATE_LIMIT_CHAT: RateLimit.parse(settings.RATE_LIMIT_CHAT),
+                RATE_LIMIT_EXPENSIVE: RateLimit.parse(settings.RATE_LIMIT_EXPENSIVE),
+                RATE_LIMIT_ADDRESS: RateLimit.parse(settings.RATE_LIMIT_PER_ADDRESS),
+            },
+        )
+    return _rate_limiter_instance
+
+def client_address(request: Request) -> str:
+    """The client's address, as forwarded by the reverse proxy in RATE_LIMIT_ADDRESS_HEADER."""
+    header = get_settings().RATE_LIMIT_ADDRESS_HEADER
+    forwarded = request.headers.get(header) if header else None
+    if forwarded:
+        return forwarded.strip()
+    return request.client.host if request.client is not None else "unknown"
+
+def limit_client_address(request: Request) -> None:
+    """
+    Dependency that takes a token from the client address's bucket, before
+    the request is authenticated, so floods of requests without a valid
+    token are limited too.
+    """
+    if get_settings().RATE_LIMIT_ENABLED:
+        get_rate_limiter().check_address(client_address(request))
+
+def rate_limited(kind: Optional[str] = None):
+    """
+    Dependency that limits the client address, then authenticates the request,
+    like `verify_authorization_header`, and takes a token from the user's
+    `kind` bucket (only the address is limited without a `kind`).
+    """
+    def dependency(
+        _: None = Depends(limit_client_address),
+        auth_info: AuthInfo = Depends(verify_authorization_header),
+    ) -> AuthInfo:
+        if kind is not None and get_settings().RATE_LIMIT_ENABLED:
+            get_rate_limiter().check(auth_info, kind)
+        return auth_info
+
+    return dependency
@@ -5,23 +5,24 @@ from fastapi.responses import JSONResponse
 
 from ...config import get_settings
 from ...api.helper.get_system_prompt import get_system_prompt
+from ...api.helper.upstream import get_upstream_pool, ROLE_SUMMARIZATION
 from ...api.v1.schemas import LLMRequest, ToolCall, ContentPart, TextContent
 from ...logger import log
 
 settings = get_settings()
 SUMMARIZATION_MODEL = settings.SUMMARIZATION_MODEL
-SUMMARIZATION_VLLM_URL = settings.SUMMARIZATION_VLLM_URL
 
 async def request_classification(
     content: Union[str, ContentPart, List[ContentPart]],
     prompt_key: str,
     tools: List[Dict],
     max_tokens: int = 50,
+    timeout: float = 60 * 10,
 ) -> tuple[bool, List[ToolCall]]:
     """
     Request classification for a given text.
     """
-    client = httpx.AsyncClient(timeout=httpx.Timeout(60 * 10))
+    client = httpx.AsyncClient(timeout=httpx.Timeout(timeout))
     response: Optional[httpx.Response] = None
 
     content_text = content
@@ -55,8 +56,9 @@ async def request_classification(
         }
 
         headers = { "Content-Type": "application/json" }
-        req = client.build_request("POST", SUMMARIZATION_VLLM_URL, content=json.dumps(request_body), headers=headers)
-        response = await client.send(req, stream=False)
+        with get_upstream_pool(ROLE_SUMMARIZATION).lease() as endpoint:
+            req = client.build_request("POST", endpoint.url, content=json.dumps(request_body), headers=headers)
+            response = await client.send(req, stream=False)
 
         if response.status_code != 200:
             error_content_bytes = await response.aread()
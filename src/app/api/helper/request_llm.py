@@ -1,8 +1,8 @@
+import anyio
 import httpx
 import json
 from fastapi.responses import JSONResponse
 from typing import Union, List, Dict, Optional, Any
-from datetime import datetime
 import hashlib
 import asyncio
 
@@ -10,6 +10,8 @@ from ...config import get_settings
 from ...logger import log
 from ...dependencies import get_milvus_wrapper, get_reranker
 from .get_system_prompt import get_system_prompt
+from .prompt_layout import add_context, current_date, log_prompt_hashes
+from .upstream import get_upstream_pool, hold_until_closed, ROLE_GENERATION
 
 LLMSuccessResponse = Union[Dict[str, Any], List[Any]]
 THRESHOLD = 0.6
@@ -17,13 +19,14 @@ THRESHOLD = 0.6
 async def arequest_llm(
     request_body: str,
     stream: bool = True,
-    vllm_url: str = get_settings().VLLM_URL,
+    vllm_url: str | None = None,
     user_id: str | None = None,
     is_api_key: bool = False,
-    use_vector_db: bool = False
+    use_vector_db: bool = False,
+    role: str = ROLE_GENERATION,
 ) -> Union[httpx.Response, JSONResponse, LLMSuccessResponse]:
     """
-    Request LLM.
+    Request LLM, at `vllm_url` or else at a replica picked from the pool for `role`.
     - Returns httpx.Response if stream=True and status=200 (for caller to handle streaming).
     - Returns parsed JSON (dict or list) if stream=False and status=200 and response is valid JSON.
     - Returns JSONResponse if status != 200 or if stream=False and response is not valid JSON, or on request errors.
@@ -38,10 +41,28 @@ async def arequest_llm(
     if use_vector_db:
         request_body = await _apply_vector_db(request_body, user_id)
 
+    body = json.loads(request_body)
+    log_prompt_hashes(body.get("messages", []), user_id)
+
+    pool = endpoint = None
+    strip_usage = False
+    if vllm_url is None:
+        pool = get_upstream_pool(role)
+        if stream and get_settings().UPSTREAM_REPORT_USAGE and "stream_options" not in body:
+            # vLLM then ends the stream with the usage, which is logged and not passed on
+            body["stream_options"] = {"include_usage": True}
+            request_body = json.dumps(body)
+            strip_usage = True
+        endpoint = pool.pick(_affinity_key(body, user_id))
+        vllm_url = endpoint.url
+    # Whether the replica answered properly; None if we never found out
+    upstream_ok: Optional[bool] = None
+
     try:
         headers = { "Content-Type": "application/json" }
         req = client.build_request("POST", vllm_url, content=request_body, headers=headers)
         response = await client.send(req, stream=stream)
+        upstream_ok = response.status_code < 500
 
         # Handle non-200 status codes
         if response.status_code != 200:
@@ -65,6 +86,8 @@ async def arequest_llm(
             content_bytes = await response.aread()
             try:
                 parsed_data: LLMSuccessResponse = json.loads(content_bytes.decode('utf-8'))
+                if endpoint is not None and isinstance(parsed_data, dict):
+                    pool.record_usage(endpoint, parsed_data.get("usage"))
                 return parsed_data
             except json.JSONDecodeError:
                 return JSONResponse(
@@ -76,6 +99,7 @@ async def arequest_llm(
                     await response.aclose()
 
     except httpx.RequestError as e:
+        upstream_ok = False
         return JSONResponse(status_code=503, content={"error": {"message": f"Service Unavailable: Cannot connect to LLM backend. {e}"}})
     except Exception as e:
         if response and hasattr(response, 'aclose') and not response.is_closed:
@@ -84,19 +108,47 @@ async def arequest_llm(
     finally:
         is_streaming_success = stream and response is not None and response.status_code == 200 and not isinstance(response, JSONResponse)
         if client and not client.is_closed and not is_streaming_success:
-            await client.aclose()
+            # Also when the request was cancelled because the client went away
+            with anyio.CancelScope(shield=True):
+                await client.aclose()
+        if endpoint is not None:
+            if is_streaming_success:
+                # The request is outstanding until the caller has read the stream
+                hold_until_closed(response, pool, endpoint, strip_usage=strip_usage)
+            else:
+                pool.release(endpoint, ok=upstream_ok)
+        if is_streaming_success:
+            response.stream = _ClientClosingStream(response.stream, client)
+
+class _ClientClosingStream(httpx.AsyncByteStream):
+    """Response body that closes the client of its request once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, client: httpx.AsyncClient):
+        self._stream = stream
+        self._client = client
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            await self._client.aclose()
 
 
 def request_llm(
     request_body: str,
     stream: bool = True,
-    vllm_url: str = get_settings().VLLM_URL,
+    vllm_url: str | None = None,
     user_id: str | None = None,
     is_api_key: bool = False,
-    use_vector_db: bool = False
+    use_vector_db: bool = False,
+    role: str = ROLE_GENERATION,
 ) -> Union[httpx.Response, JSONResponse, LLMSuccessResponse]:
     """
-    Request LLM (Synchronous version).
+    Request LLM (Synchronous version), at `vllm_url` or else at a replica picked from the pool for `role`.
     - Returns httpx.Response if stream=True and status=200 (for caller to handle streaming).
     - Returns parsed JSON (dict or list) if stream=False and status=200 and response is valid JSON.
     - Returns JSONResponse if status != 200 or if stream=False and response is not valid JSON, or on request errors.
@@ -107,10 +159,18 @@ def request_llm(
     # Add system prompt to the request body
     request_body = asyncio.run(_add_system_prompt(request_body, is_api_key))
 
+    pool = endpoint = None
+    if vllm_url is None:
+        pool = get_upstream_pool(role)
+        endpoint = pool.pick(_affinity_key(json.loads(request_body), user_id))
+        vllm_url = endpoint.url
+    upstream_ok: Optional[bool] = None
+
     try:
         headers = { "Content-Type": "application/json" }
         req = client.build_request("POST", vllm_url, content=request_body, headers=headers)
         response = client.send(req, stream=stream)
+        upstream_ok = response.status_code < 500
 
         # Handle non-200 status codes
         if response.status_code != 200:
@@ -134,6 +194,8 @@ def request_llm(
             try:
                 content_bytes = response.read()
                 parsed_data: LLMSuccessResponse = json.loads(content_bytes.decode('utf-8'))
+                if endpoint is not None and isinstance(parsed_data, dict):
+                    pool.record_usage(endpoint, parsed_data.get("usage"))
                 return parsed_data
             except json.JSONDecodeError:
                 return JSONResponse(
@@ -145,6 +207,7 @@ def request_llm(
                     response.close()
 
     except httpx.RequestError as e:
+        upstream_ok = False
         return JSONResponse(status_code=503, content={"error": {"message": f"Service Unavailable: Cannot connect to LLM backend. {e}"}})
     except Exception as e:
         if response and hasattr(response, 'close') and not response.is_closed:
@@ -154,13 +217,32 @@ def request_llm(
         is_streaming_success = stream and response is not None and response.status_code == 200 and isinstance(response, httpx.Response)
         if client and not client.is_closed and not is_streaming_success:
             client.close()
+        if endpoint is not None:
+            # Sync streams are not tracked to their end, only to the response headers
+            pool.release(endpoint, ok=upstream_ok)
+
+def _affinity_key(request_body: dict, user_id: str | None) -> str | None:
+    """
+    The key that keeps requests on one replica, per UPSTREAM_AFFINITY: the
+    user, or the conversation, known by its first user message since the
+    earlier turns stay the same prefix as it grows.
+    """
+    mode = get_settings().UPSTREAM_AFFINITY
+    if mode == "user":
+        return user_id
+    if mode == "conversation":
+        first_message = next((m for m in request_body.get("messages", []) if m.get("role") == "user"), None)
+        if first_message is None:
+            return user_id
+        return hashlib.sha256(json.dumps([user_id, first_message], sort_keys=True).encode()).hexdigest()
+    return None
 
 async def _add_system_prompt(request_body: str, is_api_key: bool) -> str:
     """Add a system prompt to the messages."""
     request_body = json.loads(request_body)
     default_prompt = await get_system_prompt(request_body["model"], "default", is_api_key)
     if default_prompt:
-        request_body["messages"] = [{"role": "system", "content": default_prompt.format(current_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))}] + request_body["messages"]
+        request_body["messages"] = [{"role": "system", "content": default_prompt.format(current_date=current_date())}] + request_body["messages"]
     return json.dumps(request_body)
 
 def get_user_collection_name(user_id: str) -> str:
@@ -233,5 +315,5 @@ async def _apply_vector_db(request_body: str, user_id: str | None) -> str:
         else:
             augmented_message = None
 
-        request_body["messages"] = request_body["messages"][:-1] + [augmented_message] + request_body["messages"][-1:]
+        request_body["messages"] = add_context(request_body["messages"], [augmented_message])
     return json.dumps(request_body)
@@ -1,25 +1,31 @@
 from fastapi import HTTPException
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import asyncio
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
 
 from ...config import get_settings
 from ...logger import log
 from ...rag.summarizing_llm import SummarizingLLM
+from ...rag.tokenizer import get_token_counter
+from .summarization_scheduler import get_summarization_scheduler, PRIORITY_BULK
+from .summary_cache import get_summary_cache, summary_cache_key, prompt_version, LEVEL_CHUNK, LEVEL_FINAL
 from ...api.helper.get_system_prompt import get_system_prompt
 
 settings = get_settings()
 
 SUMMARIZATION_MODEL = settings.SUMMARIZATION_MODEL or settings.MODEL_NAME
-SUMMARIZATION_VLLM_URL = settings.SUMMARIZATION_VLLM_URL
 
 SUMMARIZATION_LLM_INPUT_CONTEXT_TOKENS = settings.SUMMARIZATION_LLM_INPUT_CONTEXT_TOKENS
 PROMPT_OVERHEAD_TOKENS = 150
-CHARS_PER_TOKEN_HEURISTIC = 3
+CHUNK_OVERLAP_TOKENS = 20
 
 MAX_TEXT_TOKENS_FOR_LLM = SUMMARIZATION_LLM_INPUT_CONTEXT_TOKENS - PROMPT_OVERHEAD_TOKENS
-CHARACTER_CHUNK_SIZE = MAX_TEXT_TOKENS_FOR_LLM * CHARS_PER_TOKEN_HEURISTIC
-
-SUMMARIZATION_CONCURRENCY_LIMIT = settings.SUMMARIZATION_CONCURRENCY_LIMIT
+# Guards against a model that keeps ignoring the requested length
+MAX_REDUCE_LEVELS = 4
 
 async def generate_request_prompt(text_to_summarize: str, target_word_count: int) -> str:
     """Generates the prompt for summarizing a piece of text."""
@@ -28,40 +34,201 @@ async def generate_request_prompt(text_to_summarize: str, target_word_count: int
         return summary_prompt.format(text_to_summarize=text_to_summarize, target_word_count=target_word_count)
     return ""
 
-async def _summarize_single_chunk(chunk_text: str, target_word_count_for_chunk: int) -> str:
-    """Helper function to summarize a single text chunk."""
-    prompt_for_chunk = await generate_request_prompt(chunk_text, target_word_count_for_chunk)
-    
+async def summary_prompt_version() -> str:
+    """Version of the summary prompt the cached summaries were written with."""
+    return prompt_version(await get_system_prompt(SUMMARIZATION_MODEL, "summary"))
+
+@dataclass
+class _SummaryRun:
+    """Who a summarization is for, and what it cost, for scheduling and metrics."""
+    user_id: Optional[str] = None
+    priority: int = PRIORITY_BULK
+    llm_calls: int = 0
+    reduce_levels: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    on_progress: Optional[Callable[[dict], None]] = None
+
+    def progress(self, stage: str, done: int, total: int) -> None:
+        """Tells `on_progress` how many summaries of the map or reduce stage are written."""
+        if self.on_progress is not None:
+            self.on_progress({"stage": stage, "level": self.reduce_levels, "done": done, "total": total})
+
+    def record(self, path: str, input_tokens: int) -> None:
+        log.info(
+            f"Summarization finished",
+            extra={
+                "metric": "summarization_run",
+                "user_id": self.user_id,
+                "path": path,
+                "input_tokens": input_tokens,
+                "llm_calls": self.llm_calls,
+                "reduce_levels": self.reduce_levels,
+                "elapsed_s": round(time.monotonic() - self.started_at, 3),
+            },
+        )
+
+async def _gather_with_progress(stage: str, summaries: List[Awaitable[str]], run: _SummaryRun) -> List[str]:
+    """Runs the summaries of one stage together, reporting each one that finishes."""
+    total = len(summaries)
+    done = 0
+    run.progress(stage, done, total)
+
+    async def tracked(summary: Awaitable[str]) -> str:
+        nonlocal done
+        try:
+            return await summary
+        finally:
+            done += 1
+            run.progress(stage, done, total)
+
+    return await asyncio.gather(*[tracked(summary) for summary in summaries])
+
+def _is_summary(text: str) -> bool:
+    return bool(text) and not text.startswith("[Error")
+
+async def _generate_summary(prompt: str, target_word_count: int, run: _SummaryRun) -> str:
     llm = SummarizingLLM(
         model=SUMMARIZATION_MODEL,
-        vllm_url=SUMMARIZATION_VLLM_URL,
-        max_tokens=target_word_count_for_chunk,
+        max_tokens=target_word_count,
         temperature=0.2
     )
+    async with get_summarization_scheduler().slot(run.user_id, run.priority):
+        run.llm_calls += 1
+        summary_text = await llm.ainvoke(input=prompt)
+    return summary_text.strip() if summary_text else ""
+
+async def _summarize_single_chunk(chunk_text: str, target_word_count_for_chunk: int, run: Optional[_SummaryRun] = None) -> str:
+    """
+    Helper function to summarize a single text chunk, in turn with the other
+    summarization calls. The prompt already contains the text, its target
+    length and the prompt version, so it is the cache key.
+    """
+    run = run or _SummaryRun()
+    prompt_for_chunk = await generate_request_prompt(chunk_text, target_word_count_for_chunk)
+    cache_key = summary_cache_key(LEVEL_CHUNK, SUMMARIZATION_MODEL, "", target_word_count_for_chunk, prompt_for_chunk)
+
     try:
-        summary_text = await llm.ainvoke(input=prompt_for_chunk)
+        summary_text = await get_summary_cache().get_or_compute(
+            cache_key,
+            lambda: _generate_summary(prompt_for_chunk, target_word_count_for_chunk, run),
+            level=LEVEL_CHUNK,
+        )
         if not summary_text:
             log.error(f"LLM call returned empty summary for chunk")
             return ""
-        return summary_text.strip()
+        return summary_text
     except Exception as e:
         log.error(f"Error summarizing chunk, Error: {e}", exc_info=True)
         return f"[Error summarizing chunk: {str(e)}]"
 
-async def call_summarization_llm(text: str, max_tokens_for_final_summary: int) -> str:
+def _split_sentences(text: str) -> List[str]:
+    try:
+        from nltk.tokenize import sent_tokenize
+
+        return [sentence.strip() for sentence in sent_tokenize(text) if sentence.strip()]
+    except Exception:
+        return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", text) if sentence.strip()]
+
+def extractive_summary(text: str, target_word_count: int) -> str:
+    """
+    Keeps the highest ranked sentences, in their original order, until the
+    target word count is reached. Sentences are ranked by the RAKE scores of
+    the key phrases they contain, or by word frequency when the NLTK data is
+    not available.
+    """
+    sentences = _split_sentences(text)
+    if not sentences:
+        return ""
+
+    try:
+        from rake_nltk import Rake
+
+        rake = Rake(max_length=3)
+        rake.extract_keywords_from_sentences(sentences)
+        phrase_scores = rake.get_ranked_phrases_with_scores()
+
+        def score(sentence: str) -> float:
+            lowered = sentence.lower()
+            return sum(phrase_score for phrase_score, phrase in phrase_scores if phrase in lowered)
+    except Exception as e:
+        log.warning(f"Keyword ranking failed, ranking sentences by word frequency: {e}")
+        frequencies = Counter(word for word in re.findall(r"\w+", text.lower()) if len(word) > 3)
+
+        def score(sentence: str) -> float:
+            return sum(frequencies[word] for word in set(re.findall(r"\w+", sentence.lower())))
+
+    # Normalize so long sentences don't win just by containing more phrases
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: score(sentences[i]) / math.sqrt(len(sentences[i].split()) or 1),
+        reverse=True,
+    )
+    kept, words = set(), 0
+    for i in ranked:
+        sentence_words = len(sentences[i].split())
+        if words + sentence_words > target_word_count and kept:
+            continue
+        kept.add(i)
+        words += sentence_words
+        if words >= target_word_count:
+            break
+    return " ".join(sentences[i] for i in sorted(kept))
+
+async def call_summarization_llm(
+    text: str,
+    max_tokens_for_final_summary: int,
+    user_id: Optional[str] = None,
+    priority: int = PRIORITY_BULK,
+    extractive_fast_path: bool = False,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> str:
     """
     Calls the LLM to summarize the provided text.
     If the text is too long, it's split into chunks, each chunk is summarized,
-    and then the summaries are combined.
+    and the summaries are reduced in a tree until they fit.
+    With `extractive_fast_path`, for context like documents and search results,
+    text that already fits is returned as is, and text only slightly over the
+    target is shortened extractively without an LLM call.
     `max_tokens_for_final_summary` refers to the desired word count for the final summary.
+    `user_id` and `priority` decide when the calls get a slot from the summarization scheduler.
+    LLM summaries are cached, and shared with identical calls still running.
+    `on_progress` is called with the stage, reduce level and summaries done
+    so far as the map and reduce stages go.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHARACTER_CHUNK_SIZE,
-        chunk_overlap=50,
-        length_function=len
+    run = _SummaryRun(user_id=user_id, priority=priority, on_progress=on_progress)
+    token_counter = get_token_counter(SUMMARIZATION_MODEL)
+    loop = asyncio.get_running_loop()
+    input_tokens = await loop.run_in_executor(None, token_counter.count, text)
+
+    max_extractive_ratio = get_settings().SUMMARIZATION_EXTRACTIVE_MAX_RATIO
+    if extractive_fast_path and max_extractive_ratio > 0:
+        word_count = len(text.split())
+        if word_count <= max_tokens_for_final_summary:
+            run.record("passthrough", input_tokens)
+            return text.strip()
+        if word_count <= max_tokens_for_final_summary * max_extractive_ratio:
+            summary = await loop.run_in_executor(None, extractive_summary, text, max_tokens_for_final_summary)
+            if summary:
+                run.record("extractive", input_tokens)
+                return summary
+
+    cache_key = summary_cache_key(
+        LEVEL_FINAL, SUMMARIZATION_MODEL, await summary_prompt_version(), max_tokens_for_final_summary, text
+    )
+    return await get_summary_cache().get_or_compute(
+        cache_key,
+        lambda: _summarize_with_llm(text, max_tokens_for_final_summary, run, input_tokens),
+        level=LEVEL_FINAL,
+        cacheable=_is_summary,
     )
-    
-    text_chunks = text_splitter.split_text(text)
+
+async def _summarize_with_llm(text: str, max_tokens_for_final_summary: int, run: _SummaryRun, input_tokens: int) -> str:
+    """Map and reduce stages of `call_summarization_llm`."""
+    loop = asyncio.get_running_loop()
+    token_counter = get_token_counter(SUMMARIZATION_MODEL)
+    # Chunks are measured with the summarization model's own tokenizer
+    text_splitter = token_counter.text_splitter(MAX_TEXT_TOKENS_FOR_LLM, CHUNK_OVERLAP_TOKENS)
+    text_chunks = await loop.run_in_executor(None, text_splitter.split_text, text)
     log.info(f"Original text split into {len(text_chunks)} chunks for summarization.")
 
     if not text_chunks:
@@ -69,51 +236,171 @@ async def call_summarization_llm(text: str, max_tokens_for_final_summary: int) -
         return ""
 
     if len(text_chunks) == 1:
-        return await _summarize_single_chunk(text_chunks[0], max_tokens_for_final_summary)
+        summary, = await _gather_with_progress(
+            "map", [_summarize_single_chunk(text_chunks[0], max_tokens_for_final_summary, run)], run
+        )
     else:
         # Distribute the final desired word count among chunks
         approx_words_per_chunk_summary = max(50, max_tokens_for_final_summary // len(text_chunks))
 
-        # Process all chunks in parallel but cap concurrency with a semaphore
-        log.info(f"Starting summarization of {len(text_chunks)} chunks (max concurrency {SUMMARIZATION_CONCURRENCY_LIMIT}) …")
-
-        semaphore = asyncio.Semaphore(SUMMARIZATION_CONCURRENCY_LIMIT)
-
-        async def summarize_with_limit(idx: int, chunk_text: str):
-            async with semaphore:
-                log.info(f"Summarizing chunk {idx+1}/{len(text_chunks)}")
-                return await _summarize_single_chunk(chunk_text, approx_words_per_chunk_summary)
-
-        tasks = [asyncio.create_task(summarize_with_limit(i, chunk)) for i, chunk in enumerate(text_chunks)]
-        summarization_results = await asyncio.gather(*tasks)
-        
-        # Filter successful summaries and handle exceptions
-        chunk_summaries = []
-        for i, result in enumerate(summarization_results):
-            if isinstance(result, Exception):
-                log.error(f"Chunk {i+1} summarization failed with exception")
-                continue
-            elif result and not result.startswith("[Error"):
-                chunk_summaries.append(result)
-            else:
-                log.warning(f"Chunk {i+1} summarization returned empty or error result")
-        
-        log.info(f"Completed summarization: {len(chunk_summaries)}/{len(text_chunks)} chunks successful")
-        
-        if not chunk_summaries:
-            log.error("All chunk summarizations failed or returned empty.")
-            raise HTTPException(status_code=500, detail="Failed to summarize any part of the text.")
+        # Process all chunks in parallel; the scheduler caps how many run at once
+        log.info(f"Starting summarization of {len(text_chunks)} chunks …")
+
+        summarization_results = await _gather_with_progress("map", [
+            _summarize_single_chunk(chunk, approx_words_per_chunk_summary, run)
+            for chunk in text_chunks
+        ], run)
+        summary = await _reduce_chunk_summaries(summarization_results, max_tokens_for_final_summary, run)
+    run.record("llm", input_tokens)
+    return summary
+
+def _group_summaries(summaries: List[str], fan_in: int) -> List[List[str]]:
+    """Groups of at most `fan_in` summaries that fit in one summarization call together."""
+    token_counter = get_token_counter(SUMMARIZATION_MODEL)
+    groups: List[List[str]] = []
+    group: List[str] = []
+    group_tokens = 0
+    for summary in summaries:
+        summary_tokens = token_counter.count(summary)
+        if group and (len(group) >= fan_in or group_tokens + summary_tokens > MAX_TEXT_TOKENS_FOR_LLM):
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(summary)
+        group_tokens += summary_tokens
+    if group:
+        groups.append(group)
+    return groups
+
+async def _reduce_chunk_summaries(summarization_results: List, max_tokens_for_final_summary: int, run: Optional[_SummaryRun] = None) -> str:
+    """
+    Combines the per-chunk summaries. While the combination runs long, groups
+    of `SUMMARIZATION_REDUCE_FAN_IN` summaries are summarized together, level
+    by level, until the result fits the target.
+    """
+    run = run or _SummaryRun()
+    # Filter successful summaries and handle exceptions
+    chunk_summaries = []
+    for i, result in enumerate(summarization_results):
+        if isinstance(result, Exception):
+            log.error(f"Chunk {i+1} summarization failed with exception")
+            continue
+        elif result and not result.startswith("[Error"):
+            chunk_summaries.append(result)
+        else:
+            log.warning(f"Chunk {i+1} summarization returned empty or error result")
+
+    log.info(f"Completed summarization: {len(chunk_summaries)}/{len(summarization_results)} chunks successful")
 
+    if not chunk_summaries:
+        log.error("All chunk summarizations failed or returned empty.")
+        raise HTTPException(status_code=500, detail="Failed to summarize any part of the text.")
+
+    fan_in = max(2, get_settings().SUMMARIZATION_REDUCE_FAN_IN)
+    while True:
         combined_summary = "\n\n---\n\n".join(chunk_summaries)
+        if len(combined_summary.split()) <= max_tokens_for_final_summary * 1.2: # Within 20% of target
+            return combined_summary
+        if run.reduce_levels >= MAX_REDUCE_LEVELS:
+            log.warning(f"Summary still over target after {run.reduce_levels} reduce levels, returning it as is.")
+            return combined_summary
+
+        groups = await asyncio.get_running_loop().run_in_executor(None, _group_summaries, chunk_summaries, fan_in)
+        # The last level writes the final summary, earlier ones share its length
+        words_per_group = max_tokens_for_final_summary if len(groups) == 1 else max(50, max_tokens_for_final_summary // len(groups))
+        run.reduce_levels += 1
+        log.info(f"Reducing {len(chunk_summaries)} summaries in {len(groups)} groups (level {run.reduce_levels})")
+        results = await _gather_with_progress("reduce", [
+            _summarize_single_chunk("\n\n---\n\n".join(group), words_per_group, run)
+            for group in groups
+        ], run)
+
+        reduced = [result for result in results if result and not result.startswith("[Error")]
+        if len(reduced) < len(groups):
+            log.warning("A reduce step failed, returning the summaries of the previous level.")
+            return combined_summary
+        chunk_summaries = reduced
+
+class ProgressiveSummarizer:
+    """
+    Map stage of `call_summarization_llm` fed while the input is still being
+    produced: every full chunk is summarized as soon as it is available, and
+    `finish` summarizes the remainder and combines the results. Input that
+    fits in a single chunk is summarized exactly like `call_summarization_llm`.
+    """
+
+    def __init__(
+        self,
+        max_tokens_for_final_summary: int,
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_BULK,
+        extractive_fast_path: bool = False,
+    ):
+        self.max_tokens_for_final_summary = max_tokens_for_final_summary
+        self.extractive_fast_path = extractive_fast_path
+        self._run = _SummaryRun(user_id=user_id, priority=priority)
+        self._pending = ""
+        self._pending_tokens = 0
+        self._tokens_seen = 0
+        self._expected_chunks = 2
+        self._tasks: List[asyncio.Task] = []
+        self._token_counter = get_token_counter(SUMMARIZATION_MODEL)
+        self._text_splitter = self._token_counter.text_splitter(MAX_TEXT_TOKENS_FOR_LLM, CHUNK_OVERLAP_TOKENS)
+
+    async def add_text(self, text: str, progress: Optional[float] = None) -> None:
+        """
+        Add the next part of the input. `progress` is the fraction of the
+        whole input seen so far, used to split the word budget across chunks.
+        Counting and splitting run on the default executor.
+        """
+        if not text:
+            return
+        loop = asyncio.get_running_loop()
+        n_tokens = await loop.run_in_executor(None, self._token_counter.count, text)
+        self._tokens_seen += n_tokens
+        if progress:
+            expected_tokens = self._tokens_seen / progress
+            self._expected_chunks = max(2, math.ceil(expected_tokens / MAX_TEXT_TOKENS_FOR_LLM))
+
+        self._pending = f"{self._pending}\n\n{text}" if self._pending else text
+        self._pending_tokens += n_tokens
+        if self._pending_tokens <= MAX_TEXT_TOKENS_FOR_LLM:
+            return
+
+        # Keep the last, possibly partial, chunk open for the text still to come
+        text_chunks = await loop.run_in_executor(None, self._text_splitter.split_text, self._pending)
+        for chunk_text in text_chunks[:-1]:
+            self._start_chunk(chunk_text)
+        self._pending = text_chunks[-1] if text_chunks else ""
+        self._pending_tokens = await loop.run_in_executor(None, self._token_counter.count, self._pending)
+
+    def _start_chunk(self, chunk_text: str) -> None:
+        words_per_chunk = max(50, self.max_tokens_for_final_summary // self._expected_chunks)
+        log.info(f"Summarizing chunk {len(self._tasks)+1} while the rest of the input is still arriving")
+        self._tasks.append(asyncio.create_task(
+            _summarize_single_chunk(chunk_text, words_per_chunk, self._run)
+        ))
+
+    async def finish(self) -> str:
+        """Summarize what is left and combine it with the chunks started so far."""
+        if not self._tasks:
+            return await call_summarization_llm(
+                self._pending,
+                self.max_tokens_for_final_summary,
+                self._run.user_id,
+                self._run.priority,
+                extractive_fast_path=self.extractive_fast_path,
+            )
+
+        if self._pending.strip():
+            self._start_chunk(self._pending)
+            self._pending = ""
+        log.info(f"Waiting for {len(self._tasks)} chunk summaries started during parsing")
+        summarization_results = await asyncio.gather(*self._tasks, return_exceptions=True)
+        summary = await _reduce_chunk_summaries(summarization_results, self.max_tokens_for_final_summary, self._run)
+        self._run.record("llm", self._tokens_seen)
+        return summary
 
-        # One simple approach if combined_summary is too verbose:
-        if len(combined_summary.split()) > max_tokens_for_final_summary * 1.2: # If 20% over target
-            # The max_tokens for this final pass should be the originally requested one.
-            condensed_summary = await _summarize_single_chunk(combined_summary, max_tokens_for_final_summary)
-            if condensed_summary and not condensed_summary.startswith("[Error"):
-                return condensed_summary
-            else:
-                log.warning("Final condensation pass failed, returning combined summary of chunks.")
-                return combined_summary
-
-        return combined_summary
+    def cancel(self) -> None:
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,464 @@
+import asyncio
+import contextlib
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Protocol, Tuple
+
+import anyio
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from ...config import get_settings
+from ...logger import log
+from .admission import AdmittedStreamingResponse
+from .format_sse import format_sse_message
+from .streaming import DisconnectAwareStreamingResponse
+
+# Events of one stream, each with its sequence number
+Events = List[Tuple[int, str]]
+
+# How often a resumed client looks for new events
+_POLL_SECONDS = 0.05
+# How often a running stream writes its new events to the store, in one batch
+_FLUSH_SECONDS = 0.25
+# How often a running stream without new events tells readers it is alive
+_HEARTBEAT_SECONDS = 2.0
+# A running stream not heard from in this long is gone, e.g. with its worker
+_PRODUCER_LOST_SECONDS = 10 * _HEARTBEAT_SECONDS
+# Events returned by one read
+_READ_LIMIT = 512
+
+@dataclass
+class ReplayPage:
+    """Events after the ones a reader has, and whether the stream has ended."""
+    events: Events
+    finished: bool
+    producer_seen_at: float
+
+class ReplayStore(Protocol):
+    def create(self, stream_id: str, user_id: str, now: float) -> None:
+        ...
+
+    def append(self, stream_id: str, events: Events, now: float) -> float:
+        """
+        Adds events, dropping the oldest ones beyond the buffer size; returns
+        when a reader last read the stream.
+        """
+        ...
+
+    def finish(self, stream_id: str, now: float) -> None:
+        ...
+
+    def heartbeat(self, stream_id: str, now: float) -> float:
+        """Marks the stream as still running; returns when a reader last read it."""
+        ...
+
+    def read(self, stream_id: str, user_id: str, after_seq: int, now: float) -> Optional[ReplayPage]:
+        """
+        The events after `after_seq`. None when the stream is unknown, expired,
+        of another user, or has already dropped events the reader is missing.
+        """
+        ...
+
+@dataclass
+class _BufferedStream:
+    user_id: str
+    updated_at: float
+    reader_seen_at: float = 0.0
+    finished: bool = False
+    first_seq: int = 1
+    chars: int = 0
+    events: Deque[Tuple[int, str]] = field(default_factory=deque)
+
+class MemoryReplayStore:
+    """Replay buffers in this process only; for a single worker and for tests."""
+
+    def __init__(self, max_chars: int, ttl_seconds: float):
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self._streams: Dict[str, _BufferedStream] = {}
+        self._lock = threading.Lock()
+
+    def create(self, stream_id: str, user_id: str, now: float) -> None:
+        with self._lock:
+            for expired in [key for key, stream in self._streams.items() if stream.updated_at < now - self.ttl_seconds]:
+                del self._streams[expired]
+            self._streams[stream_id] = _BufferedStream(user_id=user_id, updated_at=now)
+
+    def append(self, stream_id: str, events: Events, now: float) -> float:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return 0.0
+            stream.events.extend(events)
+            stream.chars += sum(len(data) for _, data in events)
+            while stream.chars > self.max_chars and stream.events:
+                seq, data = stream.events.popleft()
+                stream.chars -= len(data)
+                stream.first_seq = seq + 1
+            stream.updated_at = now
+            return stream.reader_seen_at
+
+    def finish(self, stream_id: str, now: float) -> None:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream.finished = True
+                stream.updated_at = now
+
+    def heartbeat(self, stream_id: str, now: float) -> float:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return 0.0
+            stream.updated_at = now
+            return stream.reader_seen_at
+
+    def read(self, stream_id: str, user_id: str, after_seq: int, now: float) -> Optional[ReplayPage]:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None or stream.user_id != user_id or after_seq + 1 < stream.first_seq:
+                return None
+            stream.reader_seen_at = now
+            events = [(seq, data) for seq, data in stream.events if seq > after_seq][:_READ_LIMIT]
+            return ReplayPage(
+                events=events,
+                finished=stream.finished and len(events) < _READ_LIMIT,
+                producer_seen_at=stream.updated_at,
+            )
+
+class SqliteReplayStore:
+    """
+    Replay buffers in an SQLite file that every gunicorn worker opens, by
+    default on the /dev/shm tmpfs, so a reconnect can resume on any worker.
+    """
+
+    def __init__(self, path: str, max_chars: int, ttl_seconds: float):
+        self.path = path
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS streams ("
+                "stream_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "reader_seen_at REAL NOT NULL DEFAULT 0, finished INTEGER NOT NULL DEFAULT 0, "
+                "first_seq INTEGER NOT NULL DEFAULT 1, chars INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "stream_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (stream_id, seq)) WITHOUT ROWID"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connect())
+
+    def create(self, stream_id: str, user_id: str, now: float) -> None:
+        with self._transaction() as connection:
+            expired = now - self.ttl_seconds
+            connection.execute(
+                "DELETE FROM events WHERE stream_id IN (SELECT stream_id FROM streams WHERE updated_at < ?)", (expired,)
+            )
+            connection.execute("DELETE FROM streams WHERE updated_at < ?", (expired,))
+            connection.execute(
+                "INSERT OR REPLACE INTO streams (stream_id, user_id, updated_at) VALUES (?, ?, ?)", (stream_id, user_id, now)
+            )
+
+    def append(self, stream_id: str, events: Events, now: float) -> float:
+        with self._transaction() as connection:
+            row = connection.execute("SELECT chars, reader_seen_at FROM streams WHERE stream_id = ?", (stream_id,)).fetchone()
+            if row is None:
+                return 0.0
+            connection.executemany(
+                "INSERT OR REPLACE INTO events (stream_id, seq, data) VALUES (?, ?, ?)",
+                [(stream_id, seq, data) for seq, data in events],
+            )
+            chars = row[0] + sum(len(data) for _, data in events)
+            first_seq = None
+            if chars > self.max_chars:
+                for seq, length in connection.execute(
+                    "SELECT seq, length(data) FROM events WHERE stream_id = ? ORDER BY seq", (stream_id,)
+                ).fetchall():
+                    if chars <= self.max_chars:
+                        break
+                    chars -= length
+                    first_seq = seq + 1
+                connection.execute("DELETE FROM events WHERE stream_id = ? AND seq < ?", (stream_id, first_seq))
+            connection.execute(
+                "UPDATE streams SET chars = ?, updated_at = ?, first_seq = COALESCE(?, first_seq) WHERE stream_id = ?",
+                (chars, now, first_seq, stream_id),
+            )
+        return row[1]
+
+    def finish(self, stream_id: str, now: float) -> None:
+        with self._transaction() as connection:
+            connection.execute("UPDATE streams SET finished = 1, updated_at = ? WHERE stream_id = ?", (now, stream_id))
+
+    def heartbeat(self, stream_id: str, now: float) -> float:
+        with self._transaction() as connection:
+            connection.execute("UPDATE streams SET updated_at = ? WHERE stream_id = ?", (now, stream_id))
+            row = connection.execute("SELECT reader_seen_at FROM streams WHERE stream_id = ?", (stream_id,)).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def read(self, stream_id: str, user_id: str, after_seq: int, now: float) -> Optional[ReplayPage]:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT user_id, updated_at, finished, first_seq FROM streams WHERE stream_id = ?", (stream_id,)
+            ).fetchone()
+            if row is None or row[0] != user_id or after_seq + 1 < row[3]:
+                return None
+            events = connection.execute(
+                "SELECT seq, data FROM events WHERE stream_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (stream_id, after_seq, _READ_LIMIT),
+            ).fetchall()
+            connection.execute("UPDATE streams SET reader_seen_at = ? WHERE stream_id = ?", (now, stream_id))
+        return ReplayPage(events=events, finished=bool(row[2]) and len(events) < _READ_LIMIT, producer_seen_at=row[1])
+
+class _Transaction:
+    """One short write transaction, like a take of the rate limit store."""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+
+def default_replay_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "panda-vllm-proxy-streams.sqlite")
+
+def event_id(stream_id: str, seq: int) -> str:
+    return f"{stream_id}:{seq}"
+
+def parse_event_id(value: str) -> Tuple[str, int]:
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return stream_id, int(seq)
+
+class ResumableStream:
+    """
+    Runs a streamed answer in a task of its own, numbering its SSE events.
+    The client that started it gets every event as soon as it arrives; a
+    second task writes the events to the replay store in batches, so a slow
+    or broken store never holds up the answer. When that client goes away
+    the generation goes on for `detached_grace_seconds` more, and as long as
+    a resumed client reads it.
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        source: AsyncIterator,
+        store: ReplayStore,
+        detached_grace_seconds: float,
+        on_done: Optional[Callable[[], None]] = None,
+    ):
+        self.stream_id = stream_id
+        self._source = source
+        self._store = store
+        self._detached_grace_seconds = detached_grace_seconds
+        self._on_done = on_done
+        self._live: Optional[asyncio.Queue] = asyncio.Queue()
+        self._ended = asyncio.Event()
+        self._unsaved: Events = []
+        self._saved_at = time.time()
+        self._store_failed = False
+        self._detached_at = 0.0
+        self._reader_seen_at = 0.0
+        self.task = asyncio.create_task(self._produce())
+        self._persist_task = asyncio.create_task(self._persist())
+
+    async def _produce(self) -> None:
+        seq = 0
+        pending = ""
+        try:
+            async for chunk in self._source:
+                if isinstance(chunk, (bytes, memoryview)):
+                    chunk = bytes(chunk).decode()
+                *complete, pending = (pending + chunk).split("\n\n")
+                for event in complete:
+                    seq += 1
+                    self._publish(seq, event)
+            if pending.strip():
+                self._publish(seq + 1, pending)
+        finally:
+            self._ended.set()
+            if self._live is not None:
+                self._live.put_nowait(None)
+            with anyio.CancelScope(shield=True):
+                aclose = getattr(self._source, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                # The last batch goes in after any write still running, then the stream is marked finished
+                await self._persist_task
+                await self._save(finished=True)
+            if self._on_done is not None:
+                self._on_done()
+
+    def _publish(self, seq: int, event: str) -> None:
+        data = f"id: {event_id(self.stream_id, seq)}\n{event}\n\n"
+        if self._live is not None:
+            self._live.put_nowait(data)
+        self._unsaved.append((seq, data))
+
+    async def _persist(self) -> None:
+        """Writes new events to the store until the stream ends, and abandons it when nobody reads it."""
+        while not self._ended.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._ended.wait(), timeout=_FLUSH_SECONDS)
+            if self._ended.is_set():
+                return
+            if self._unsaved or time.time() - self._saved_at >= _HEARTBEAT_SECONDS:
+                await self._save()
+            if self._live is None and time.time() - max(self._detached_at, self._reader_seen_at) > self._detached_grace_seconds:
+                self._abandon()
+                return
+
+    async def _save(self, finished: bool = False) -> None:
+        if self._store_failed:
+            return
+        events, self._unsaved = self._unsaved, []
+        now = time.time()
+        try:
+            if events:
+                self._reader_seen_at = await asyncio.to_thread(self._store.append, self.stream_id, events, now)
+            elif not finished:
+                self._reader_seen_at = await asyncio.to_thread(self._store.heartbeat, self.stream_id, now)
+            if finished:
+                await asyncio.to_thread(self._store.finish, self.stream_id, now)
+        except sqlite3.Error as e:
+            # The answer goes on for the client that is reading it, it just can't be resumed
+            self._store_failed = True
+            log.error(f"Replay store failed, the stream can no longer be resumed: {e}", extra={"stream_id": self.stream_id})
+            return
+        self._saved_at = now
+
+    def _abandon(self) -> None:
+        if self._ended.is_set():
+            return
+        log.info(f"Stream abandoned", extra={"metric": "stream_resume", "outcome": "abandoned", "stream_id": self.stream_id})
+        self.task.cancel()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """The events as they come, for the client that started the stream."""
+        try:
+            while (data := await self._live.get()) is not None:
+                yield data
+        finally:
+            self._live = None
+            if not self._ended.is_set():
+                self._detached_at = time.time()
+                if self._detached_grace_seconds <= 0:
+                    self._abandon()
+
+async def replay(store: ReplayStore, stream_id: str, user_id: str, after_seq: int, page: ReplayPage) -> AsyncIterator[str]:
+    """The buffered events after `after_seq`, starting with `page`, then the new ones until the stream ends."""
+    while True:
+        for seq, data in page.events:
+            after_seq = seq
+            yield data
+        if page.finished:
+            return
+        if time.time() - page.producer_seen_at > _PRODUCER_LOST_SECONDS:
+            yield format_sse_message(data={"error": {"message": "The stream was lost, please send the request again"}})
+            return
+        await asyncio.sleep(_POLL_SECONDS)
+        try:
+            page = await asyncio.to_thread(store.read, stream_id, user_id, after_seq, time.time())
+        except sqlite3.Error as e:
+            log.error(f"Replay store failed while resuming a stream: {e}", extra={"stream_id": stream_id})
+            page = None
+        if page is None:
+            yield format_sse_message(data={"error": {"message": "The stream can no longer be resumed, please send the request again"}})
+            return
+
+class ResumableStreams:
+    """Makes streamed answers resumable with `Last-Event-ID`."""
+
+    def __init__(self, store: ReplayStore, detached_grace_seconds: float):
+        self.store = store
+        self.detached_grace_seconds = detached_grace_seconds
+        # Streams keep running after their client left, and need a reference meanwhile
+        self._running: Dict[str, ResumableStream] = {}
+
+    async def start(self, response: Response, user_id: str) -> Response:
+        """Runs a streaming `response` as a resumable stream; other responses are returned as they are."""
+        if not isinstance(response, StreamingResponse):
+            return response
+        # The admission slot is held while the generation runs, not while the first client reads it
+        on_done = response.slot.release if isinstance(response, AdmittedStreamingResponse) else None
+        stream_id = secrets.token_urlsafe(16)
+        try:
+            await asyncio.to_thread(self.store.create, stream_id, user_id, time.time())
+        except sqlite3.Error as e:
+            # A broken store must not take the answers down with it
+            log.error(f"Replay store failed, answering without resume: {e}")
+            return response
+
+        def done() -> None:
+            self._running.pop(stream_id, None)
+            if on_done is not None:
+                on_done()
+
+        stream = ResumableStream(stream_id, response.body_iterator, self.store, self.detached_grace_seconds, done)
+        self._running[stream_id] = stream
+        return DisconnectAwareStreamingResponse(
+            stream.follow(),
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            background=response.background,
+        )
+
+    async def resume(self, last_event_id: str, user_id: str) -> StreamingResponse:
+        """Continues a stream after the event a reconnecting client saw last, or 410 when it cannot."""
+        stream_id, after_seq = parse_event_id(last_event_id)
+        try:
+            page = await asyncio.to_thread(self.store.read, stream_id, user_id, after_seq, time.time())
+        except sqlite3.Error as e:
+            log.error(f"Replay store failed, the stream cannot be resumed: {e}", extra={"stream_id": stream_id})
+            page = None
+        outcome = "gone" if page is None else "finished" if page.finished else "running"
+        log.info(
+            f"Stream resume",
+            extra={"metric": "stream_resume", "outcome": outcome, "stream_id": stream_id, "user_id": user_id, "after_seq": after_seq},
+        )
+        if page is None:
+            raise HTTPException(status_code=410, detail="The stream can no longer be resumed")
+        return DisconnectAwareStreamingResponse(replay(self.store, stream_id, user_id, after_seq, page), media_type="text/event-stream")
+
+_resumable_streams_instance: Optional[ResumableStreams] = None
+
+def get_resumable_streams() -> ResumableStreams:
+    global _resumable_streams_instance
+    if _resumable_streams_instance is None:
+        settings = get_settings()
+        max_chars = int(settings.RESUME_BUFFER_MAX_MB * 1024 * 1024)
+        if settings.RESUME_STORE == "memory":
+            store = MemoryReplayStore(max_chars, settings.RESUME_TTL_SECONDS)
+        elif settings.RESUME_STORE == "sqlite":
+            store = SqliteReplayStore(settings.RESUME_DB_PATH or default_replay_path(), max_chars, settings.RESUME_TTL_SECONDS)
+        else:
+            raise ValueError(f"Unknown RESUME_STORE {settings.RESUME_STORE!r}")
+        _resumable_streams_instance = ResumableStreams(store, settings.RESUME_DETACHED_GRACE_SECONDS)
+    return _resumable_streams_instance
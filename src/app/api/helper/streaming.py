@@ -1,9 +1,65 @@
 import json
 from hashlib import sha256
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
+
+import anyio
+import httpx
 from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
 from ...logger import log
 
+async def close_upstream(response: Optional[httpx.Response]) -> None:
+    """
+    Closes a streamed upstream response, which makes vLLM abort the generation.
+    Shielded, since it mostly runs in code that is being cancelled.
+    """
+    if isinstance(response, httpx.Response) and not response.is_closed:
+        with anyio.CancelScope(shield=True):
+            await response.aclose()
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that stops as soon as the client disconnects, whatever
+    ASGI spec version the server speaks, and then always closes its body
+    iterator. The generators behind it close their upstream stream and
+    cancel their work in `finally`, so nothing keeps running for nobody.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        completed = False
+        error: Optional[Exception] = None
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def stream() -> None:
+                    nonlocal completed, error
+                    try:
+                        await self.stream_response(send)
+                        completed = True
+                    except OSError:
+                        # The server could not send anymore, the client is gone
+                        pass
+                    except Exception as e:
+                        error = e
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(stream)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+        finally:
+            with anyio.CancelScope(shield=True):
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        if error is not None:
+            raise error
+        if not completed:
+            log.info(f"Client disconnected from stream", extra={"metric": "client_disconnect", "path": scope.get("path")})
+
+        if self.background is not None:
+            await self.background()
+
 async def generate_stream(response) -> AsyncGenerator[str, None]:
     """
     Generic stream generator for LLM responses.
@@ -27,8 +83,10 @@ async def generate_stream(response) -> AsyncGenerator[str, None]:
     except Exception as e:
         log.error(f"Error during streaming in generate_stream: {str(e)}", exc_info=True)
         yield f"data: {json.dumps({'error': {'message': f'Streaming error: {str(e)}'}})}\n\n"
+    finally:
+        await close_upstream(response)
 
-def create_streaming_response(response, media_type: str = "text/event-stream") -> StreamingResponse:
+def create_streaming_response(response, media_type: str = "text/event-stream") -> DisconnectAwareStreamingResponse:
     """
     Create a StreamingResponse from an LLM response.
     
@@ -37,9 +95,9 @@ def create_streaming_response(response, media_type: str = "text/event-stream") -
         media_type: The media type for the response
         
     Returns:
-        StreamingResponse: A FastAPI StreamingResponse object
+        DisconnectAwareStreamingResponse: A response that closes `response` when the client goes away
     """
-    return StreamingResponse(
+    return DisconnectAwareStreamingResponse(
         generate_stream(response),
         media_type=media_type,
     ) 
\ No newline at end of file
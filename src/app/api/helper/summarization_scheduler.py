@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from ...config import get_settings
+from ...logger import log
+
+# Lower value runs first. Interactive `/v1/summary` calls go ahead of the map
+# chunks of search results and documents.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+ANONYMOUS_USER = "-"
+
+class SummarizationScheduler:
+    """
+    Caps the summarization LLM calls in flight in this worker. Waiting calls
+    are served by priority, and within a priority round-robin across users,
+    so one large document cannot starve everyone else's requests.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self._running = 0
+        self._waiting: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for users in self._waiting.values() for waiters in users.values())
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None, priority: int = PRIORITY_BULK) -> AsyncIterator[None]:
+        """Hold one of the summarization slots for the duration of the block."""
+        user_id = user_id or ANONYMOUS_USER
+        enqueued_at = time.monotonic()
+
+        if self._running < self.max_concurrency and not self.queued:
+            self._running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as the caller went away
+                    self._release()
+                else:
+                    self._forget(priority, user_id, waiter)
+                raise
+
+        wait_s = time.monotonic() - enqueued_at
+        log.info(
+            f"Summarization slot acquired",
+            extra={
+                "metric": "summarization_queue_wait",
+                "user_id": user_id,
+                "priority": priority,
+                "wait_s": round(wait_s, 3),
+                "running": self._running,
+                "queued": self.queued,
+            },
+        )
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._running < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.done():
+                continue
+            self._running += 1
+            waiter.set_result(None)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._waiting):
+            users = self._waiting[priority]
+            if not users:
+                continue
+            user_id, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # The user goes to the back of the line for their next call
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            return waiter
+        return None
+
+    def _forget(self, priority: int, user_id: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiting.get(priority, {}).get(user_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del self._waiting[priority][user_id]
+
+_summarization_scheduler_instance: SummarizationScheduler | None = None
+
+def get_summarization_scheduler() -> SummarizationScheduler:
+    global _summarization_scheduler_instance
+    if _summarization_scheduler_instance is None:
+        settings = get_settings()
+        # The limit is for the whole container, split evenly across the workers
+        _summarization_scheduler_instance = SummarizationScheduler(
+            max_concurrency=settings.SUMMARIZATION_CONCURRENCY_LIMIT // max(1, settings.WORKERS),
+        )
+    return _summarization_scheduler_instance
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+from ...config import get_settings
+from ...logger import log
+
+LEVEL_CHUNK = "chunk"
+LEVEL_FINAL = "final"
+
+def summary_cache_key(level: str, model: str, prompt_version: str, target_word_count: int, text: str) -> str:
+    """SHA-256 of everything that decides what a summarization call returns."""
+    h = hashlib.sha256(f"{level}|{model}|{prompt_version}|{target_word_count}|".encode())
+    h.update(text.encode())
+    return h.hexdigest()
+
+def prompt_version(prompt_template: Optional[str]) -> str:
+    """Short digest of the summary prompt, so editing the prompt invalidates its summaries."""
+    return hashlib.sha256((prompt_template or "").encode()).hexdigest()[:16]
+
+@dataclass
+class _InFlight:
+    task: asyncio.Task
+    cacheable: Callable[[str], bool]
+    waiters: int = 0
+
+class SummaryCache:
+    """
+    Summaries of chunks and of whole texts, bounded by the total length of
+    the cached summaries. Identical jobs that arrive while one is running wait
+    for that one instead of starting their own LLM calls; the job is cancelled
+    only when every caller waiting for it has gone away.
+    """
+
+    def __init__(self, max_chars: int, ttl_seconds: int):
+        self.enabled = max_chars > 0
+        self._entries: TTLCache = TTLCache(maxsize=max(1, max_chars), ttl=ttl_seconds, getsizeof=len)
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    def put(self, key: str, summary: str) -> None:
+        if not self.enabled or not summary or len(summary) > self._entries.maxsize:
+            return
+        self._entries[key] = summary
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        level: str = LEVEL_CHUNK,
+        cacheable: Callable[[str], bool] = bool,
+    ) -> str:
+        """
+        Returns the cached summary for `key`, or the result of `compute`,
+        shared with every concurrent caller of the same key. Results are
+        cached only when `cacheable` accepts them, exceptions never.
+        """
+        if not self.enabled:
+            return await compute()
+
+        started_at = time.monotonic()
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._log(level, "hit", started_at)
+            return cached
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            in_flight = _InFlight(task=asyncio.create_task(compute()), cacheable=cacheable)
+            self._in_flight[key] = in_flight
+            in_flight.task.add_done_callback(lambda task: self._finished(key, task))
+            outcome = "miss"
+        else:
+            outcome = "joined"
+
+        in_flight.waiters += 1
+        try:
+            summary = await asyncio.shield(in_flight.task)
+        except asyncio.CancelledError:
+            if in_flight.waiters == 1 and not in_flight.task.done():
+                in_flight.task.cancel()
+            raise
+        finally:
+            in_flight.waiters -= 1
+        self._log(level, outcome, started_at)
+        return summary
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        in_flight = self._in_flight.get(key)
+        if in_flight is None or in_flight.task is not task:
+            return
+        del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if in_flight.cacheable(task.result()):
+            self.put(key, task.result())
+
+    def _log(self, level: str, outcome: str, started_at: float) -> None:
+        log.info(
+            f"Summary cache {outcome}",
+            extra={
+                "metric": "summary_cache",
+                "level": level,
+                "outcome": outcome,
+                "elapsed_s": round(time.monotonic() - started_at, 3),
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+            },
+        )
+
+_summary_cache_instance: SummaryCache | None = None
+
+def get_summary_cache() -> SummaryCache:
+    global _summary_cache_instance
+    if _summary_cache_instance is None:
+        settings = get_settings()
+        _summary_cache_instance = SummaryCache(
+            max_chars=int(settings.SUMMARY_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=settings.SUMMARY_CACHE_TTL_SECONDS,
+        )
+    return _summary_cache_instance
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+
+from ...config import get_settings
+from ...logger import log
+
+UPLOAD_URL_PREFIX = "upload://"
+PDF_MAGIC = b"%PDF-"
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+# Chunks are hashed and written in batches of this size, off the event loop
+WRITE_BATCH_BYTES = 1024 * 1024
+
+def _write_batch(tmp: IO[bytes], digest, chunks: List[bytes]) -> None:
+    for chunk in chunks:
+        digest.update(chunk)
+        tmp.write(chunk)
+
+def _remove_part(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+
+class UploadStore:
+    """
+    Content-addressed store of uploaded PDFs on local disk, one directory per
+    user. Uploads are streamed straight to a temporary file while being hashed,
+    so the worker never holds a whole document in memory, and parsing later
+    opens them by path. The disk work runs on the default executor.
+    """
+
+    def __init__(self, root: str, ttl_seconds: int, max_bytes: int):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _user_dir(self, user_id: str) -> Path:
+        user_dir = self.root / hashlib.sha256(user_id.encode()).hexdigest()
+        user_dir.mkdir(parents=True, exist_ok=True)
+        return user_dir
+
+    async def save_stream(self, user_id: str, chunks: AsyncIterator[bytes]) -> tuple[str, int]:
+        """
+        Write a PDF from a stream of chunks and return its SHA-256 and size.
+
+        Raises:
+            HTTPException: If the body is empty, too large or not a PDF
+        """
+        loop = asyncio.get_running_loop()
+        tmp = await loop.run_in_executor(None, self._open_part, user_id)
+
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        batch: List[bytes] = []
+        batch_size = 0
+        try:
+            try:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise HTTPException(status_code=413, detail="Uploaded file is too large")
+                    if len(head) < len(PDF_MAGIC):
+                        head += chunk[:len(PDF_MAGIC)]
+                    batch.append(chunk)
+                    batch_size += len(chunk)
+                    if batch_size >= WRITE_BATCH_BYTES:
+                        await loop.run_in_executor(None, _write_batch, tmp, digest, batch)
+                        batch, batch_size = [], 0
+                if batch:
+                    await loop.run_in_executor(None, _write_batch, tmp, digest, batch)
+            finally:
+                await loop.run_in_executor(None, tmp.close)
+
+            if size == 0:
+                raise HTTPException(status_code=400, detail="Empty upload")
+            if not head.startswith(PDF_MAGIC):
+                raise HTTPException(status_code=415, detail="Uploaded file is not a PDF")
+
+            content_hash = digest.hexdigest()
+            target = Path(tmp.name).parent / f"{content_hash}.pdf"
+            await loop.run_in_executor(None, os.replace, tmp.name, target)
+            return content_hash, size
+        finally:
+            await loop.run_in_executor(None, _remove_part, tmp.name)
+
+    def _open_part(self, user_id: str) -> IO[bytes]:
+        """Prune the user's expired uploads and open a temporary file for a new one."""
+        user_dir = self._user_dir(user_id)
+        self._prune(user_dir)
+        return tempfile.NamedTemporaryFile(dir=user_dir, suffix=".part", delete=False)
+
+    def path_for(self, user_id: str, content_hash: str) -> Optional[Path]:
+        """Path of a stored upload, or None if it is unknown or expired."""
+        if not _DIGEST_RE.match(content_hash):
+            return None
+        path = self._user_dir(user_id) / f"{content_hash}.pdf"
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+        except FileNotFoundError:
+            return None
+        # Each use keeps the upload alive for another TTL
+        path.touch()
+        return path
+
+    def _prune(self, user_dir: Path) -> None:
+        now = time.time()
+        for path in user_dir.iterdir():
+            try:
+                if now - path.stat().st_mtime > self.ttl_seconds:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                log.warning(f"Failed to prune upload {path.name}: {e}")
+
+_upload_store_instance: UploadStore | None = None
+
+def get_upload_store() -> UploadStore:
+    global _upload_store_instance
+    if _upload_store_instance is None:
+        settings = get_settings()
+        _upload_store_instance = UploadStore(
+            root=settings.UPLOAD_DIR or os.path.join(tempfile.gettempdir(), "panda-uploads"),
+            ttl_seconds=settings.UPLOAD_TTL_SECONDS,
+            max_bytes=settings.UPLOAD_MAX_MB * 1024 * 1024,
+        )
+    return _upload_store_instance
@@ -0,0 +1,380 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from ...config import get_settings
+from ...logger import log
+
+# Chat generations for users and API keys
+ROLE_GENERATION = "generation"
+# Summaries and request classification
+ROLE_SUMMARIZATION = "summarization"
+
+HEALTH_PATHS = ("/health", "/v1/models")
+# Share of its traffic a replica gets when it has just (re)joined the pool
+SLOW_START_MIN_WEIGHT = 0.1
+# Points per replica on the affinity hash ring, to even out the arcs
+AFFINITY_VIRTUAL_NODES = 64
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha256(value.encode()).digest()[:8], "big")
+
+@dataclass
+class UpstreamEndpoint:
+    """One vLLM replica and what the balancer knows about it."""
+    url: str
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    healthy: bool = True
+    ejected_until: float = 0.0
+    joined_at: float = field(default_factory=time.monotonic)
+    # Prompt tokens reported by the replica, and how many of them hit its prefix cache
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def base_url(self) -> str:
+        parts = urlsplit(self.url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def weight(self, now: float, slow_start_seconds: float) -> float:
+        """Ramps from SLOW_START_MIN_WEIGHT to 1 over the slow start after joining."""
+        if slow_start_seconds <= 0:
+            return 1.0
+        ramp = (now - self.joined_at) / slow_start_seconds
+        return min(1.0, max(SLOW_START_MIN_WEIGHT, ramp))
+
+class UpstreamPool:
+    """
+    vLLM replicas serving one role. Requests go to the available replica
+    with the fewest outstanding requests, relative to its slow-start weight.
+    Replicas are taken out when their health check fails, or for
+    `eject_seconds` after `eject_after_failures` failed requests in a row,
+    and ramp up again over `slow_start_seconds` when they come back.
+    When no replica is available, all of them are tried anyway.
+
+    Requests with an affinity key go to the replica the key hashes to on a
+    consistent-hash ring, so follow-up turns find their prefix in that
+    replica's KV cache. That load is bounded: a replica with more than
+    `affinity_load_factor` times the average outstanding requests passes
+    the request on to the next replica on the ring.
+    """
+
+    def __init__(
+        self,
+        role: str,
+        urls: List[str],
+        health_check_interval: float = 5.0,
+        health_check_timeout: float = 2.0,
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        slow_start_seconds: float = 30.0,
+        affinity_load_factor: float = 1.25,
+    ):
+        if not urls:
+            raise ValueError(f"No upstream endpoints configured for {role}")
+        self.role = role
+        # Endpoints start warmed up; slow start applies when they come back
+        self.endpoints = [UpstreamEndpoint(url=url, joined_at=float("-inf")) for url in urls]
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.slow_start_seconds = slow_start_seconds
+        self.affinity_load_factor = affinity_load_factor
+        self._ring = sorted(
+            (_ring_hash(f"{endpoint.url}#{i}"), index)
+            for index, endpoint in enumerate(self.endpoints)
+            for i in range(AFFINITY_VIRTUAL_NODES)
+        )
+        self._ring_hashes = [point for point, _ in self._ring]
+        # Leases are also taken from the threads of the sync `request_llm`
+        self._lock = threading.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def pick(self, affinity_key: Optional[str] = None) -> UpstreamEndpoint:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)] or self.endpoints
+            endpoint = None
+            if affinity_key is not None and len(candidates) > 1:
+                endpoint = self._pick_by_affinity(affinity_key, candidates, now)
+            if endpoint is None:
+                scores = [
+                    (endpoint.outstanding + 1) / endpoint.weight(now, self.slow_start_seconds)
+                    for endpoint in candidates
+                ]
+                best = min(scores)
+                # Random among equals, so idle replicas share the load
+                endpoint = random.choice([e for e, score in zip(candidates, scores) if score == best])
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _pick_by_affinity(self, affinity_key: str, candidates: List[UpstreamEndpoint], now: float) -> Optional[UpstreamEndpoint]:
+        """The first replica clockwise from the key on the ring that is under its load bound."""
+        average = (sum(endpoint.outstanding for endpoint in candidates) + 1) / len(candidates)
+        allowed = {id(endpoint) for endpoint in candidates}
+        seen = set()
+        start = bisect.bisect(self._ring_hashes, _ring_hash(affinity_key))
+        for offset in range(len(self._ring)):
+            endpoint = self.endpoints[self._ring[(start + offset) % len(self._ring)][1]]
+            if id(endpoint) in seen or id(endpoint) not in allowed:
+                continue
+            seen.add(id(endpoint))
+            bound = math.ceil(self.affinity_load_factor * average * endpoint.weight(now, self.slow_start_seconds))
+            if endpoint.outstanding + 1 <= bound:
+                return endpoint
+            if len(seen) == len(allowed):
+                break
+        return None
+
+    def release(self, endpoint: UpstreamEndpoint, ok: Optional[bool] = True) -> None:
+        """
+        Ends a request to `endpoint`. `ok` of False counts towards ejecting
+        it, None means the outcome says nothing about the replica.
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                endpoint.failures = 0
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after_failures and endpoint.ejected_until <= time.monotonic():
+                self._eject(endpoint, f"{endpoint.failures} failed requests in a row")
+
+    def record_usage(self, endpoint: UpstreamEndpoint, usage: Optional[dict]) -> None:
+        """
+        Logs how much of a prompt `endpoint` found in its prefix cache, from
+        the `usage` of its response. vLLM reports cached tokens only when run
+        with `--enable-prompt-tokens-details`; without them this does nothing.
+        """
+        if not isinstance(usage, dict):
+            return
+        prompt_tokens = usage.get("prompt_tokens")
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if not prompt_tokens or cached_tokens is None:
+            return
+        with self._lock:
+            endpoint.prompt_tokens += prompt_tokens
+            endpoint.cached_tokens += cached_tokens
+            pool_prompt_tokens = sum(e.prompt_tokens for e in self.endpoints)
+            pool_cached_tokens = sum(e.cached_tokens for e in self.endpoints)
+        log.info(
+            f"Upstream prefix cache",
+            extra={
+                "metric": "prefix_cache",
+                "role": self.role,
+                "url": endpoint.url,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "hit_ratio": round(cached_tokens / prompt_tokens, 3),
+                "pool_hit_ratio": round(pool_cached_tokens / pool_prompt_tokens, 3),
+                "pool_prefill_tokens_saved": pool_cached_tokens,
+            },
+        )
+
+    @contextmanager
+    def lease(self, affinity_key: Optional[str] = None) -> Iterator[UpstreamEndpoint]:
+        """Picks an endpoint for one request; failures that reach the caller count against it."""
+        endpoint = self.pick(affinity_key)
+        try:
+            yield endpoint
+        except httpx.RequestError:
+            self.release(endpoint, ok=False)
+            raise
+        except BaseException:
+            self.release(endpoint, ok=None)
+            raise
+        else:
+            self.release(endpoint)
+
+    def _eject(self, endpoint: UpstreamEndpoint, reason: str) -> None:
+        now = time.monotonic()
+        endpoint.ejected_until = now + self.eject_seconds
+        endpoint.joined_at = endpoint.ejected_until
+        log.warning(
+            f"Ejected upstream {endpoint.url}: {reason}",
+            extra={"metric": "upstream_ejected", "role": self.role, "url": endpoint.url, "reason": reason},
+        )
+
+    async def check_health(self, client: httpx.AsyncClient) -> None:
+        """Probes every endpoint once, at `/health` and else `/v1/models`."""
+        results = await asyncio.gather(*[self._probe(client, endpoint) for endpoint in self.endpoints])
+        now = time.monotonic()
+        with self._lock:
+            for endpoint, healthy in zip(self.endpoints, results):
+                if healthy and not endpoint.healthy:
+                    endpoint.joined_at = max(now, endpoint.ejected_until)
+                    log.info(f"Upstream {endpoint.url} is healthy again", extra={"role": self.role, "url": endpoint.url})
+                elif not healthy and endpoint.healthy:
+                    log.warning(
+                        f"Upstream {endpoint.url} failed its health check",
+                        extra={"metric": "upstream_unhealthy", "role": self.role, "url": endpoint.url},
+                    )
+                endpoint.healthy = healthy
+        log.info(
+            f"Upstream pool health",
+            extra={
+                "metric": "upstream_pool",
+                "role": self.role,
+                "available": sum(endpoint.available(now) for endpoint in self.endpoints),
+                "endpoints": len(self.endpoints),
+                "outstanding": [endpoint.outstanding for endpoint in self.endpoints],
+                "prefix_hit_ratio": [
+                    round(endpoint.cached_tokens / endpoint.prompt_tokens, 3) if endpoint.prompt_tokens else None
+                    for endpoint in self.endpoints
+                ],
+            },
+        )
+
+    async def _probe(self, client: httpx.AsyncClient, endpoint: UpstreamEndpoint) -> bool:
+        for path in HEALTH_PATHS:
+            try:
+                response = await client.get(f"{endpoint.base_url}{path}", timeout=self.health_check_timeout)
+            except httpx.HTTPError:
+                return False
+            if response.status_code != 404:
+                return response.status_code == 200
+        return False
+
+    def start_health_checks(self) -> None:
+        """Starts probing in the background; a pool of one replica has nothing to balance."""
+        if len(self.endpoints) < 2 or self.health_check_interval <= 0:
+            return
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    async def _health_loop(self) -> None:
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    await self.check_health(client)
+                except Exception as e:
+                    log.error(f"Health check of the {self.role} pool failed: {e}", exc_info=True)
+                await asyncio.sleep(self.health_check_interval)
+
+class _LeasedStream(httpx.AsyncByteStream):
+    """
+    Response body that returns its endpoint to the pool once it is closed.
+    With `strip_usage`, the usage-only chunk vLLM sends at the end for
+    `stream_options.include_usage` is recorded and left out of the body.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, pool: UpstreamPool, endpoint: UpstreamEndpoint, strip_usage: bool = False):
+        self._stream = stream
+        self._pool = pool
+        self._endpoint = endpoint
+        self._strip_usage = strip_usage
+        self._released = False
+
+    async def __aiter__(self):
+        chunks = self._without_usage(self._stream) if self._strip_usage else self._stream
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except httpx.RequestError:
+            self._release(ok=False)
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release(ok=True)
+
+    def _release(self, ok: bool) -> None:
+        if not self._released:
+            self._released = True
+            self._pool.release(self._endpoint, ok=ok)
+
+    async def _without_usage(self, stream: httpx.AsyncByteStream) -> AsyncIterator[bytes]:
+        """Passes on whole SSE lines only, so the usage event can be seen and dropped."""
+        pending = b""
+        async for chunk in stream:
+            lines, newline, pending = (pending + chunk).rpartition(b"\n")
+            if newline:
+                lines = self._drop_usage_events(lines + newline)
+                if lines:
+                    yield lines
+        if pending:
+            yield self._drop_usage_events(pending)
+
+    def _drop_usage_events(self, lines: bytes) -> bytes:
+        if b'"usage"' not in lines:
+            return lines
+        kept = []
+        drop_blank = False
+        for line in lines.split(b"\n"):
+            if drop_blank and not line.strip():
+                drop_blank = False
+                continue
+            drop_blank = False
+            if line.startswith(b"data:") and b'"usage"' in line:
+                try:
+                    event = json.loads(line[len(b"data:"):])
+                except json.JSONDecodeError:
+                    event = None
+                if isinstance(event, dict) and event.get("usage"):
+                    self._pool.record_usage(self._endpoint, event["usage"])
+                    if not event.get("choices"):
+                        drop_blank = True
+                        continue
+            kept.append(line)
+        return b"\n".join(kept)
+
+def hold_until_closed(response: httpx.Response, pool: UpstreamPool, endpoint: UpstreamEndpoint, strip_usage: bool = False) -> httpx.Response:
+    """
+    Keeps a streamed response counted as outstanding on `endpoint` until it
+    is closed. `strip_usage` is for streams that asked for usage only for
+    `record_usage`, not for the client.
+    """
+    response.stream = _LeasedStream(response.stream, pool, endpoint, strip_usage=strip_usage)
+    return response
+
+def upstream_urls(role: str) -> List[str]:
+    settings = get_settings()
+    if role == ROLE_GENERATION:
+        return settings.VLLM_URLS or [settings.VLLM_URL]
+    if role == ROLE_SUMMARIZATION:
+        return settings.SUMMARIZATION_VLLM_URLS or [settings.SUMMARIZATION_VLLM_URL]
+    raise ValueError(f"Unknown upstream role {role!r}")
+
+_upstream_pool_instances: Dict[str, UpstreamPool] = {}
+
+def get_upstream_pool(role: str) -> UpstreamPool:
+    if role not in _upstream_pool_instances:
+        settings = get_settings()
+        _upstream_pool_instances[role] = UpstreamPool(
+            role,
+            upstream_urls(role),
+            health_check_interval=settings.UPSTREAM_HEALTH_CHECK_INTERVAL_SECONDS,
+            health_check_timeout=settings.UPSTREAM_HEALTH_CHECK_TIMEOUT_SECONDS,
+            eject_after_failures=settings.UPSTREAM_EJECT_AFTER_FAILURES,
+            eject_seconds=settings.UPSTREAM_EJECT_SECONDS,
+            slow_start_seconds=settings.UPSTREAM_SLOW_START_SECONDS,
+            affinity_load_factor=settings.UPSTREAM_AFFINITY_LOAD_FACTOR,
+        )
+    return _upstream_pool_instances[role]
@@ -3,9 +3,13 @@ from .openai import router as openai_router
 from .summary import router as summary_router
 from .info import router as info_router
 from .models import router as models_router
+from .uploads import router as uploads_router
+from .documents import router as documents_router
 
 router = APIRouter(prefix="/v1")
 router.include_router(openai_router)
 router.include_router(summary_router)
 router.include_router(info_router)
-router.include_router(models_router)
\ No newline at end of file
+router.include_router(models_router)
+router.include_router(uploads_router)
+router.include_router(documents_router)
\ No newline at end of file
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from ...api.helper.auth import AuthInfo
+from ...api.helper.rate_limit import rate_limited, RATE_LIMIT_EXPENSIVE
+from ...api.helper.document_jobs import get_document_jobs, DocumentJob
+from ...actions.pdf.utils import resolve_pdf_url
+from ...config import get_settings
+from ...milvus import DOC_TYPE_PDF, DOC_TYPE_TEXT
+from .schemas import DocumentRequest, DocumentJobResponse
+
+router = APIRouter(tags=["documents"])
+
+def _job_response(job: DocumentJob) -> DocumentJobResponse:
+    return DocumentJobResponse(
+        id=job.id,
+        status=job.status,
+        kind=job.kind,
+        done=job.done,
+        total=job.total,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+@router.post("/documents", response_model=DocumentJobResponse, status_code=202)
+async def create_document(request: DocumentRequest, auth_info: AuthInfo = Depends(rate_limited(RATE_LIMIT_EXPENSIVE))):
+    """
+    Queues a PDF or a piece of text for parsing and ingestion into the user's
+    document store, and returns a job to poll. Once the job has succeeded,
+    chat requests retrieve from the document without parsing it again.
+    """
+    if (request.pdf_url is None) == (request.text is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of `pdf_url` or `text`")
+
+    if request.pdf_url is not None:
+        try:
+            pdf = resolve_pdf_url(request.pdf_url, auth_info.user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        job = get_document_jobs().submit(auth_info.user_id, DOC_TYPE_PDF, pdf)
+    else:
+        if not request.text.strip():
+            raise HTTPException(status_code=400, detail="Empty text")
+        if len(request.text) > get_settings().DOCUMENT_TEXT_MAX_CHARS:
+            raise HTTPException(status_code=413, detail="Text is too long")
+        job = get_document_jobs().submit(auth_info.user_id, DOC_TYPE_TEXT, request.text, source=request.source)
+
+    return _job_response(job)
+
+@router.get("/documents/{job_id}", response_model=DocumentJobResponse)
+async def get_document_job(job_id: str, auth_info: AuthInfo = Depends(rate_limited())):
+    """Returns the status and progress of a document ingestion job."""
+    job = get_document_jobs().get(auth_info.user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Document job not found")
+    return _job_response(job)
@@ -1,18 +1,37 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import Response, JSONResponse
 
-from ...api.helper.auth import verify_authorization_header, AuthInfo
+from ...api.helper.auth import AuthInfo
+from ...api.helper.rate_limit import get_rate_limiter, rate_limited, RATE_LIMIT_CHAT, RATE_LIMIT_EXPENSIVE
 from ...api.helper.request_llm import arequest_llm
 from ...api.helper.streaming import create_streaming_response
+from ...api.helper.admission import get_admission_controller, LANE_GENERATION, LANE_API_KEY, LANE_HEAVY
+from ...api.helper.resumable import get_resumable_streams
 from ...api.helper.request_classification import request_classification
 from ...logger import log
 from ...actions.registry import get_action_registry
 from ...actions.tool_calls.get_tools import get_default_tools
-from .schemas import LLMRequest
+from ...rag.latency_budget import LatencyBudget
+from ...actions.search.prefetch import SearchPrefetch
+from ...dependencies import get_milvus_wrapper
+from .schemas import LLMRequest, TextContent
 from ...config import get_settings
 
 router = APIRouter(tags=["openai"])
 
+async def respond_from_llm(request_body: str, should_stream: bool, user_id: str, use_vector_db: bool) -> Response:
+    """Forwards the request to vLLM and turns its answer into a response."""
+    response_from_llm = await arequest_llm(request_body, stream=should_stream, user_id=user_id, use_vector_db=use_vector_db)
+
+    if isinstance(response_from_llm, JSONResponse):
+        return response_from_llm
+
+    if should_stream:
+        return create_streaming_response(response_from_llm)
+    else:
+        return JSONResponse(content=response_from_llm)
+
 async def stream_vllm_response(payload: LLMRequest, auth_info: AuthInfo) -> Response:
     """
     Process the LLMRequest payload and handle custom actions if specified.
@@ -27,42 +46,90 @@ async def stream_vllm_response(payload: LLMRequest, auth_info: AuthInfo) -> Resp
         modified_request_body_str = payload.model_dump_json(exclude_none=True)
         should_stream = payload.stream
 
+        # Upstream generations and heavy actions wait for a slot, or get a 429
+        admission = get_admission_controller()
+
         if auth_info.is_api_key:
-            response_from_llm = await arequest_llm(modified_request_body_str, stream=should_stream, user_id=auth_info.user_id, use_vector_db=False)
-        else:
-            # For PDFs
-            action_registry = get_action_registry()
-            pdf_handler = action_registry.get("use_pdf")
-            if hasattr(payload, "use_pdf") and getattr(payload, "use_pdf") is True:
-                log.info(f"Executing custom action: use_pdf based on LLMRequest field")
-                if not payload.stream:
-                    raise HTTPException(status_code=400, detail="Custom actions are not supported in non-streaming mode")
-                return await pdf_handler(payload, auth_info.user_id)
+            return await admission.admit_response(
+                LANE_API_KEY,
+                lambda: respond_from_llm(modified_request_body_str, should_stream, auth_info.user_id, use_vector_db=False),
+                user_id=auth_info.user_id,
+            )
+
+        # For PDFs
+        action_registry = get_action_registry()
+        pdf_handler = action_registry.get("use_pdf")
+        if hasattr(payload, "use_pdf") and getattr(payload, "use_pdf") is True:
+            log.info(f"Executing custom action: use_pdf based on LLMRequest field")
+            if not payload.stream:
+                raise HTTPException(status_code=400, detail="Custom actions are not supported in non-streaming mode")
+            if get_settings().RATE_LIMIT_ENABLED:
+                await run_in_threadpool(get_rate_limiter().check, auth_info, RATE_LIMIT_EXPENSIVE)
+            return await admission.admit_response(
+                LANE_HEAVY, lambda: pdf_handler(payload, auth_info.user_id), user_id=auth_info.user_id
+            )
 
         # Modify last user message for automatic search
         last_user_message = payload.messages[-1].content
 
+        # The latency budget of a search starts with the classification call
+        latency_budget = LatencyBudget(get_settings().SEARCH_LATENCY_BUDGET_SECONDS, user_id=auth_info.user_id)
+
+        # Optionally start searching on the raw message while the classifier runs
+        prefetch = None
+        if get_settings().SEARCH_PREFETCH_ENABLED:
+            last_user_text = " ".join(part.text for part in last_user_message if isinstance(part, TextContent))
+            if last_user_text.strip():
+                prefetch = SearchPrefetch(last_user_text, auth_info.user_id, get_milvus_wrapper(), latency_budget)
+
         # Send the modified last user message to the classification LLM
-        is_tool_call_request, response = await request_classification(last_user_message, "need_search", get_default_tools())
+        classified = False
+        try:
+            is_tool_call_request, response = await request_classification(
+                last_user_message,
+                "need_search",
+                get_default_tools(),
+                timeout=get_settings().CLASSIFICATION_TIMEOUT_SECONDS,
+            )
+            classified = True
+        finally:
+            # Without a decision nobody takes the prefetch, stop it here
+            if prefetch is not None and not classified:
+                prefetch.discard("classification_failed")
         if is_tool_call_request and len(response) > 0:
             for tool_call in response:
                 if tool_call.function.name == "use_search":
+                    if get_settings().RATE_LIMIT_ENABLED and await run_in_threadpool(
+                        get_rate_limiter().retry_after, auth_info, RATE_LIMIT_EXPENSIVE
+                    ):
+                        # Over the search limit, the question is still answered without it
+                        log.warning(f"Search rate limit exceeded, answering without search", extra={"user_id": auth_info.user_id})
+                        break
                     log.info(f"Executing custom action: use_search")
                     search_handler = action_registry.get("use_search")
-                    return await search_handler(payload, auth_info.user_id, tool_call.function.arguments)
-        
-        response_from_llm = await arequest_llm(modified_request_body_str, stream=should_stream, user_id=auth_info.user_id, use_vector_db=True)
+                    try:
+                        return await admission.admit_response(
+                            LANE_HEAVY,
+                            lambda: search_handler(payload, auth_info.user_id, tool_call.function.arguments, latency_budget, prefetch),
+                            user_id=auth_info.user_id,
+                        )
+                    except HTTPException:
+                        if prefetch is not None:
+                            prefetch.discard("rejected")
+                        raise
+        if prefetch is not None:
+            prefetch.discard("not_needed")
 
         log.info(f"User sent request to LLM", extra={"user_id": auth_info.user_id, "request_type": "text/image", "is_api_key": auth_info.is_api_key})
 
-        if isinstance(response_from_llm, JSONResponse):
-            return response_from_llm
-        
-        if should_stream:
-            return create_streaming_response(response_from_llm)
-        else:
-            return JSONResponse(content=response_from_llm)
+        return await admission.admit_response(
+            LANE_GENERATION,
+            lambda: respond_from_llm(modified_request_body_str, should_stream, auth_info.user_id, use_vector_db=True),
+            user_id=auth_info.user_id,
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         log.error(f"Error processing request in stream_vllm_response: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
@@ -71,7 +138,14 @@ async def stream_vllm_response(payload: LLMRequest, auth_info: AuthInfo) -> Resp
 async def chat_completions(
     payload: LLMRequest, 
     background_tasks: BackgroundTasks,
-    auth_info: AuthInfo = Depends(verify_authorization_header)
+    auth_info: AuthInfo = Depends(rate_limited(RATE_LIMIT_CHAT)),
+    last_event_id: str | None = Header(default=None, description="Resumes the stream after this event instead of generating again."),
 ) -> Response:
     """OpenAI-compatible chat completions endpoint with support for custom actions."""
-    return await stream_vllm_response(payload, auth_info)
+    if not get_settings().RESUMABLE_STREAMS_ENABLED:
+        return await stream_vllm_response(payload, auth_info)
+
+    resumable_streams = get_resumable_streams()
+    if last_event_id:
+        return await resumable_streams.resume(last_event_id, auth_info.user_id)
+    return await resumable_streams.start(await stream_vllm_response(payload, auth_info), auth_info.user_id)
@@ -59,8 +59,33 @@ class ToolCall(BaseModel):
     type: str
     function: ToolFunction
 
+class SummaryRequest(LLMRequest):
+    previous_summary: Optional[str] = Field(default=None, description="Optional. Summary returned earlier for the first `summarized_message_count` messages; only the messages after them are folded in.")
+    summarized_message_count: Optional[int] = Field(default=None, ge=0, description="Optional. Number of leading messages covered by `previous_summary`.")
+
 class SummaryResponse(BaseModel):
     summary: str
+    message_count: Optional[int] = Field(default=None, description="Number of messages the summary covers, to send back as `summarized_message_count`.")
+
+class UploadResponse(BaseModel):
+    hash: str = Field(..., description="SHA-256 of the uploaded file.")
+    size: int = Field(..., description="Size of the uploaded file in bytes.")
+    url: str = Field(..., description="URL to use as `pdf_url` in chat requests.")
+
+class DocumentRequest(BaseModel):
+    pdf_url: Optional[str] = Field(default=None, description="A base64 PDF data URI or an `upload://<hash>` reference.")
+    text: Optional[str] = Field(default=None, description="Plain text to ingest instead of a PDF.")
+    source: Optional[str] = Field(default=None, description="Optional. Name stored with the chunks of a text document.")
+
+class DocumentJobResponse(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    kind: Literal["pdf", "text"]
+    done: int = Field(default=0, description="Pages (PDF) or chunks (text) ingested so far.")
+    total: Optional[int] = Field(default=None, description="Pages (PDF) or chunks (text) to ingest, once known.")
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
 
 class LLMSuccessChoiceMessage(BaseModel):
     role: Optional[str] = None
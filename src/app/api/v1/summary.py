@@ -1,15 +1,29 @@
+import asyncio
+import hashlib
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi.responses import StreamingResponse
+from cachetools import TTLCache
+from typing import AsyncGenerator, Callable, List, Optional
 
-from ...api.helper.auth import verify_authorization_header
+from ...api.helper.auth import AuthInfo
+from ...api.helper.rate_limit import rate_limited, RATE_LIMIT_EXPENSIVE
+from ...api.helper.format_sse import format_sse_message, create_random_event_id
 from ...config import get_settings
 from ...logger import log
-from .schemas import SummaryResponse, LLMRequest, TextContent, ChatMessage
+from .schemas import SummaryResponse, SummaryRequest, TextContent, ChatMessage
 from ...api.helper.request_summary import call_summarization_llm
+from ...api.helper.summarization_scheduler import PRIORITY_INTERACTIVE
 
 settings = get_settings()
 router = APIRouter(tags=["summary"])
 
+# Summaries of conversation prefixes, by hash of the user, the target length
+# and the messages, so a growing conversation only folds in its new messages.
+_conversation_summaries = TTLCache(
+    maxsize=settings.SUMMARY_CONVERSATION_CACHE_SIZE,
+    ttl=settings.SUMMARY_CONVERSATION_CACHE_TTL_SECONDS,
+)
+
 def extract_text_from_chat_messages(chat_messages: List[ChatMessage]) -> str:
     """Extracts and concatenates all text content from a list of ChatMessage objects."""
     all_text_parts = []
@@ -19,28 +33,183 @@ def extract_text_from_chat_messages(chat_messages: List[ChatMessage]) -> str:
                     all_text_parts.append(content_part.text)
     return "\n\n".join(all_text_parts)
 
-@router.post("/summary", response_model=SummaryResponse, dependencies=[Depends(verify_authorization_header)])
-async def summarize_messages(request: LLMRequest):
-    """
-    Summarizes text extracted from the provided list of LLMRequest objects.
-    """
+def conversation_prefix_hashes(user_id: str, target_word_count: int, chat_messages: List[ChatMessage]) -> List[str]:
+    """Hash of every prefix of the conversation; entry `i` covers the first `i + 1` messages."""
+    h = hashlib.sha256(f"{user_id}|{target_word_count}".encode())
+    hashes = []
+    for chat_message in chat_messages:
+        h.update(b"\x00" + chat_message.role.value.encode() + b"\x00")
+        h.update(extract_text_from_chat_messages([chat_message]).encode())
+        hashes.append(h.copy().hexdigest())
+    return hashes
+
+def _validate_summary_request(request: SummaryRequest) -> None:
     if not request.messages:
         raise HTTPException(status_code=400, detail="No LLMRequest messages provided for summarization.")
+    if request.previous_summary is not None:
+        offset = request.summarized_message_count
+        if offset is None or offset > len(request.messages):
+            raise HTTPException(status_code=400, detail="`summarized_message_count` must be given with `previous_summary` and not exceed the number of messages.")
+
+async def summarize_conversation(
+    request: SummaryRequest,
+    user_id: str,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> SummaryResponse:
+    """
+    Summarizes the conversation, starting from the client's previous summary
+    or the longest summarized prefix cached on the server when there is one.
+    `on_progress` gets the map and reduce progress of the summarizer.
+    """
+    target_word_count = request.max_tokens or 1000
+    prefix_hashes = conversation_prefix_hashes(user_id, target_word_count, request.messages)
 
-    full_text = extract_text_from_chat_messages(request.messages)
+    previous_summary: Optional[str] = None
+    start = 0
+    reused = "none"
+    if request.previous_summary is not None:
+        previous_summary, start, reused = request.previous_summary, request.summarized_message_count, "client"
+    else:
+        for n in range(len(prefix_hashes), 0, -1):
+            cached = _conversation_summaries.get(prefix_hashes[n - 1])
+            if cached is not None:
+                previous_summary, start, reused = cached, n, "cache"
+                break
 
-    if not full_text.strip():
+    log.info(
+        f"Summarizing conversation",
+        extra={
+            "metric": "summary_incremental",
+            "user_id": user_id,
+            "reused": reused,
+            "messages_total": len(request.messages),
+            "messages_new": len(request.messages) - start,
+        },
+    )
+
+    new_text = extract_text_from_chat_messages(request.messages[start:])
+    if not new_text.strip():
+        if previous_summary is not None:
+            return SummaryResponse(summary=previous_summary, message_count=len(request.messages))
         raise HTTPException(status_code=400, detail="No text content found in the provided messages for summarization.")
 
-    if len(full_text.split()) < 5: 
+    if len(new_text.split()) < 5:
         log.warning("Attempting to summarize very short text.")
 
+    # The fold always goes through the LLM, which rewrites it as one summary
+    text = new_text
+    if previous_summary:
+        text = f"Summary of the conversation so far:\n{previous_summary}\n\nNew messages:\n{new_text}"
+
+    # Someone is waiting on this one, so it goes ahead of document and search chunks
+    summary = await call_summarization_llm(
+        text, target_word_count, user_id=user_id, priority=PRIORITY_INTERACTIVE, on_progress=on_progress
+    )
+    if prefix_hashes:
+        _conversation_summaries[prefix_hashes[-1]] = summary
+    return SummaryResponse(summary=summary, message_count=len(request.messages))
+
+SSE_KEEPALIVE_SECONDS = 10
+
+def _progress_event(progress: dict) -> str:
+    if progress["stage"] == "map":
+        message = f"Summarizing part {progress['done']} of {progress['total']}"
+    else:
+        message = f"Combining summaries (level {progress['level']}): {progress['done']} of {progress['total']}"
+    return format_sse_message(
+        data={
+            "object": "process.event",
+            "id": create_random_event_id(),
+            "type": "summary",
+            "message": message,
+            "data": progress,
+        },
+    )
+
+async def summary_stream(request: SummaryRequest, user_id: str) -> AsyncGenerator[str, None]:
+    yield format_sse_message(
+        data={
+            "object": "process.event",
+            "id": create_random_event_id(),
+            "type": "summary",
+            "message": "Summarizing conversation",
+            "data": {"messages": len(request.messages)},
+        },
+    )
+
+    progress_events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(summarize_conversation(request, user_id, on_progress=progress_events.put_nowait))
+    next_progress = None
     try:
-        summary = await call_summarization_llm(full_text, request.max_tokens or 1000)
+        while not task.done():
+            # Wake up for the next progress event, and keep proxies from
+            # timing out the connection while a long summary is written
+            next_progress = asyncio.create_task(progress_events.get())
+            done, _ = await asyncio.wait(
+                {task, next_progress}, timeout=SSE_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if next_progress in done:
+                yield _progress_event(next_progress.result())
+            else:
+                next_progress.cancel()
+                if not done:
+                    yield ": keep-alive\n\n"
+        while not progress_events.empty():
+            yield _progress_event(progress_events.get_nowait())
+        response = task.result()
+        yield format_sse_message(
+            data={
+                "object": "summary",
+                "id": create_random_event_id(),
+                "summary": response.summary,
+                "message_count": response.message_count,
+            },
+        )
+    except Exception as e:
+        log.error(f"An error occurred during summary stream: {e}", exc_info=True)
+        yield format_sse_message(
+            data={
+                "object": "process.event",
+                "id": create_random_event_id(),
+                "type": "summary",
+                "message": f"An error occurred during summary stream: {getattr(e, 'detail', e)}",
+                "data": {
+                    "status_code": getattr(e, "status_code", 500),
+                },
+            },
+        )
+    finally:
+        for pending in (task, next_progress):
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+    yield format_sse_message(data="[DONE]")
+
+@router.post("/summary", response_model=SummaryResponse)
+async def summarize_messages(request: SummaryRequest, auth_info: AuthInfo = Depends(rate_limited(RATE_LIMIT_EXPENSIVE))):
+    """
+    Summarizes text extracted from the provided list of LLMRequest objects.
+    Pass `previous_summary` and `summarized_message_count` from an earlier
+    response to fold in only the messages added since.
+    """
+    _validate_summary_request(request)
+
+    try:
+        response = await summarize_conversation(request, auth_info.user_id)
         log.info("Successfully generated summary.")
-        return SummaryResponse(summary=summary)
+        return response
     except HTTPException as e:
         raise e
     except Exception as e:
         log.error(f"Internal server error processing summarization request: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error processing summarization request.")
+
+
+@router.post("/summary/stream")
+async def summarize_messages_stream(request: SummaryRequest, auth_info: AuthInfo = Depends(rate_limited(RATE_LIMIT_EXPENSIVE))):
+    """
+    Server-sent events variant of `/summary`: progress of the map and reduce
+    stages as they go, then the summary.
+    """
+    _validate_summary_request(request)
+    return StreamingResponse(summary_stream(request, auth_info.user_id), media_type="text/event-stream")
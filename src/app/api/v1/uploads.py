@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from ...api.helper.auth import AuthInfo
+from ...api.helper.rate_limit import rate_limited, RATE_LIMIT_EXPENSIVE
+from ...api.helper.uploads import get_upload_store, UPLOAD_URL_PREFIX
+from ...logger import log
+from .schemas import UploadResponse
+
+router = APIRouter(tags=["uploads"])
+
+@router.post("/uploads", response_model=UploadResponse)
+async def upload_pdf(request: Request, auth_info: AuthInfo = Depends(rate_limited(RATE_LIMIT_EXPENSIVE))):
+    """
+    Streams a raw PDF request body (`Content-Type: application/pdf`) to disk and
+    returns its content hash. Chat requests can then reference the document with
+    a `pdf_url` of `upload://<hash>` instead of inlining it as base64.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in ("application/pdf", "application/octet-stream"):
+        raise HTTPException(status_code=415, detail="Expected an application/pdf request body")
+
+    content_hash, size = await get_upload_store().save_stream(auth_info.user_id, request.stream())
+    log.info(f"Stored uploaded PDF", extra={"user_id": auth_info.user_id, "upload_size": size})
+    return UploadResponse(hash=content_hash, size=size, url=f"{UPLOAD_URL_PREFIX}{content_hash}")
@@ -7,10 +7,39 @@ class Settings(BaseSettings):
     VLLM_URL: str
     VLLM_MODEL_URL: str
     SUMMARIZATION_VLLM_URL: str
+    # Replicas to balance across, instead of the single URL above
+    VLLM_URLS: list[str] = []
+    SUMMARIZATION_VLLM_URLS: list[str] = []
+    # Replicas are probed at /health (or /v1/models), ejected after failed
+    # requests in a row, and ramp up over the slow start when they return
+    UPSTREAM_HEALTH_CHECK_INTERVAL_SECONDS: float = 5.0
+    UPSTREAM_HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+    UPSTREAM_EJECT_AFTER_FAILURES: int = 3
+    UPSTREAM_EJECT_SECONDS: float = 30.0
+    UPSTREAM_SLOW_START_SECONDS: float = 30.0
+    # Keeps a conversation's turns ("conversation"), or all of a user's
+    # requests ("user"), on one replica for its prefix cache; "none" to disable.
+    # A replica takes at most this factor times the average load that way
+    UPSTREAM_AFFINITY: str = "conversation"
+    UPSTREAM_AFFINITY_LOAD_FACTOR: float = 1.25
+    # Ask vLLM for usage on streams too, to log prefix cache hits per replica
+    UPSTREAM_REPORT_USAGE: bool = True
+    # "interleaved" inserts retrieved context as system messages before the
+    # last user message. "prefix_cache" appends them after it instead, keeping
+    # the start of prompts the same from turn to turn for vLLM's prefix cache,
+    # unless the chat template moves system messages to the front.
+    # The date in the system prompt only changes as often as its format says
+    PROMPT_LAYOUT: str = "interleaved"
+    SYSTEM_PROMPT_DATE_FORMAT: str = "%Y-%m-%d"
+
+    # Number of gunicorn workers in the container (read by the entrypoint too)
+    WORKERS: int = 1
 
     # LLM model names
     MODEL_NAME: str
     SUMMARIZATION_MODEL: str | None = None
+    # Local directory with the main model's tokenizer files, instead of the hub
+    TOKENIZER_PATH: Optional[str] = None
 
     # RAG config
     BRAVE_SEARCH_API_KEY: Optional[str] = None
@@ -20,6 +49,47 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str
     JWT_PUB_KEY: str
     APP_ID: str
+    # Verified JWTs remembered until they expire (0 verifies every request)
+    JWT_VERIFIED_CACHE_SIZE: int = 10_000
+
+    # Token-bucket limits per user or API key, e.g. "10/minute". Expensive
+    # requests are search, PDFs, document ingestion and summaries
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CHAT: str = "60/minute"
+    RATE_LIMIT_EXPENSIVE: str = "10/minute"
+    # Every request per client address, checked before authentication. The
+    # address is taken from this header, set by the nginx in front of the
+    # app, or is the peer address when the header is unset or missing
+    RATE_LIMIT_PER_ADDRESS: str = "300/minute"
+    RATE_LIMIT_ADDRESS_HEADER: Optional[str] = "X-Real-IP"
+    # "sqlite" shares the buckets between workers through RATE_LIMIT_DB_PATH
+    # (default under /dev/shm); "memory" keeps them per worker
+    RATE_LIMIT_STORE: str = "sqlite"
+    RATE_LIMIT_DB_PATH: Optional[str] = None
+
+    # Streamed answers get SSE event ids and stay in a replay buffer, so a
+    # reconnect with Last-Event-ID resumes them instead of generating again.
+    # Off, a disconnect aborts the generation at once. "memory" keeps the
+    # buffers per worker, and a reconnect to another worker gets 410 and
+    # sends the request again; "sqlite" shares them through RESUME_DB_PATH
+    RESUMABLE_STREAMS_ENABLED: bool = False
+    RESUME_STORE: str = "memory"
+    RESUME_DB_PATH: Optional[str] = None
+    RESUME_BUFFER_MAX_MB: float = 1.0
+    # How long a finished stream can still be resumed
+    RESUME_TTL_SECONDS: float = 60.0
+    # How long a generation goes on once no client reads it (0 aborts it
+    # on disconnect, like with resumable streams off)
+    RESUME_DETACHED_GRACE_SECONDS: float = 15.0
+
+    # Admission control, per worker: requests in flight upstream per lane,
+    # then a bounded FIFO queue before answering 429 with Retry-After
+    # (0 in flight admits everything)
+    ADMISSION_MAX_GENERATIONS: int = 64
+    ADMISSION_MAX_API_KEY_GENERATIONS: int = 32
+    ADMISSION_MAX_HEAVY: int = 8
+    ADMISSION_MAX_QUEUE: int = 64
+    ADMISSION_MAX_WAIT_SECONDS: float = 15.0
 
     # CORS config
     CORS_ALLOWED_ORIGINS: list[str] = ["*"]
@@ -37,13 +107,71 @@ class Settings(BaseSettings):
     # PDF Processing Configuration
     PDF_MAX_PAGES: Optional[int] = None
     PDF_CHUNK_SIZE: int = 10
-    PDF_CHUNK_CONCURRENCY_LIMIT: int = 8
-    PDF_CHUNK_MODE_THRESHOLD_MB: float = 5.0
-    PDF_PAGE_OCR_THRESHOLD_KB: int = 150
+    # Warmed PDF parsing processes across the whole container, split evenly
+    # across the gunicorn workers. Each holds its own RapidOCR engine and takes
+    # about 0.3 GB resident when idle, up to about 1 GB while it OCRs full-page
+    # scans, so budget memory for all of them.
+    PDF_OCR_ENGINES: int = 8
+    # Per-page OCR routing: a page is OCR'd when it has images covering at least
+    # PDF_OCR_MIN_IMAGE_COVERAGE of it and either almost no text layer, or images
+    # dominating a sparse text layer.
+    PDF_OCR_MAX_TEXT_CHARS: int = 50
+    PDF_OCR_MIN_IMAGE_COVERAGE: float = 0.1
+    PDF_OCR_IMAGE_DOMINANT_COVERAGE: float = 0.6
+    PDF_OCR_MIN_TEXT_COVERAGE: float = 0.15
+
+    # Parsed-PDF and summary cache
+    PDF_CACHE_MAX_MB: float = 256.0
+    PDF_CACHE_TTL_SECONDS: int = 6 * 60 * 60
+    PDF_CACHE_DIR: Optional[str] = None
+    PDF_CACHE_DISK_MAX_FILES: int = 512
+
+    # Search: reuse of previously stored web chunks
+    SEARCH_STORE_MAX_AGE_SECONDS: int = 6 * 60 * 60
+    SEARCH_STORE_MIN_SCORE: float = 0.6
+    SEARCH_STORE_MIN_HITS: int = 3
+    SEARCH_STORE_CANDIDATES: int = 8
+
+    # Search: end-to-end latency budget before the final generation
+    SEARCH_LATENCY_BUDGET_SECONDS: float = 30.0
+    # Every chat waits for the search classifier, and a timed out classifier
+    # answers "no search", so it is bounded on its own rather than by the budget
+    CLASSIFICATION_TIMEOUT_SECONDS: float = 60 * 10
+
+    # Search: speculative prefetch while the classifier runs (opt-in)
+    SEARCH_PREFETCH_ENABLED: bool = False
+    SEARCH_PREFETCH_MIN_SIMILARITY: float = 0.5
+
+    # PDF uploads
+    UPLOAD_DIR: Optional[str] = None
+    UPLOAD_MAX_MB: int = 100
+    UPLOAD_TTL_SECONDS: int = 60 * 60
+
+    # Background document ingestion (/v1/documents)
+    DOCUMENT_JOB_WORKERS: int = 2
+    DOCUMENT_JOB_QUEUE_SIZE: int = 32
+    DOCUMENT_JOB_DIR: Optional[str] = None
+    DOCUMENT_JOB_TTL_SECONDS: int = 24 * 60 * 60
+    DOCUMENT_TEXT_MAX_CHARS: int = 2_000_000
 
     # Summarisation
     SUMMARIZATION_LLM_INPUT_CONTEXT_TOKENS: int = 75000
-    SUMMARIZATION_CONCURRENCY_LIMIT: int = 2
+    # Summarization LLM calls in flight across the whole container, split
+    # evenly across the gunicorn workers
+    SUMMARIZATION_CONCURRENCY_LIMIT: int = 8
+    # Summaries combined per call when reducing chunk summaries
+    SUMMARIZATION_REDUCE_FAN_IN: int = 4
+    # Search results and documents up to this multiple of the target length
+    # are shortened by sentence ranking instead of an LLM call (0 always calls
+    # the LLM). /v1/summary always calls the LLM
+    SUMMARIZATION_EXTRACTIVE_MAX_RATIO: float = 1.5
+    # Summaries of conversation prefixes kept for incremental /v1/summary calls
+    SUMMARY_CONVERSATION_CACHE_SIZE: int = 2048
+    SUMMARY_CONVERSATION_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    # Chunk and final summaries by hash of text, model, prompt and length,
+    # shared by search, PDF and /v1/summary (0 disables)
+    SUMMARY_CACHE_MAX_MB: float = 64.0
+    SUMMARY_CACHE_TTL_SECONDS: int = 24 * 60 * 60
 
     # Model info
     MAX_MODEL_LENGTH: int
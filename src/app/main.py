@@ -7,8 +7,12 @@ from .api import router as api_router
 from .api.response.response import ok, error, unexpect_error
 from .logger import log
 from .dependencies import get_cors_origins, get_milvus_wrapper, get_reranker
-from .middleware import prove_server_identity, PUBLIC_KEY_HEADER, SIGNATURE_HEADER, SERVER_RANDOM_HEADER, TS_HEADER
+from .middleware import ProveServerIdentityMiddleware, PUBLIC_KEY_HEADER, SIGNATURE_HEADER, SERVER_RANDOM_HEADER, TS_HEADER
 from .config import get_settings
+from .actions.pdf.engine import get_pdf_engine
+from .api.helper.document_jobs import get_document_jobs
+from .rag.tokenizer import get_token_counter
+from .api.helper.upstream import get_upstream_pool, ROLE_GENERATION, ROLE_SUMMARIZATION
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -26,8 +30,28 @@ async def lifespan(app: FastAPI):
     get_reranker()
     log.info("Reranker initialized and model should be pre-loaded.")
 
+    # Start the PDF parsing process pool
+    log.info("Warming up the PDF parsing process pool...")
+    await get_pdf_engine().warm()
+    log.info("PDF parsing process pool is ready.")
+
+    # Load the tokenizers used for token budgets
+    settings = get_settings()
+    get_token_counter()
+    get_token_counter(settings.SUMMARIZATION_MODEL or settings.MODEL_NAME)
+    log.info("Tokenizers for token budgeting are loaded.")
+
+    # Probe the vLLM replicas of each role
+    for role in (ROLE_GENERATION, ROLE_SUMMARIZATION):
+        get_upstream_pool(role).start_health_checks()
+
     yield
 
+    for role in (ROLE_GENERATION, ROLE_SUMMARIZATION):
+        get_upstream_pool(role).stop_health_checks()
+    get_document_jobs().shutdown()
+    get_pdf_engine().shutdown()
+
 app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
@@ -40,7 +64,7 @@ app.add_middleware(
     expose_headers=[PUBLIC_KEY_HEADER, SIGNATURE_HEADER, SERVER_RANDOM_HEADER, TS_HEADER],
 )
 
-app.middleware("http")(prove_server_identity)
+app.add_middleware(ProveServerIdentityMiddleware)
 
 app.include_router(api_router)
 
@@ -1,13 +1,15 @@
 import os
 import time
 import secrets
+from typing import List, Optional, Tuple
 
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 
-from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from .config import get_settings
 from .logger import log
@@ -53,26 +55,44 @@ else:
     ).hex()
     log.info(f"Loaded TLS cert. public key: {hex_public_key}")
 
-async def prove_server_identity(request: Request, call_next):
-    resp = await call_next(request)
-    if private_key is None:
-        log.warn("No private key provided. skipping cert signing")
-        return resp
-
-    resp.headers[PUBLIC_KEY_HEADER] = hex_public_key
-
-    challenge = request.headers.get(CHALLENGE_HEADER)
-    if challenge is None or challenge == "":
-        challenge = request.headers.get(AUTH_HEADER)
-        if challenge is None or challenge == "":
-            log.info("No challenge of auth header. skipping cert signing")
-            return resp
+def _challenge(headers: Headers) -> Optional[str]:
+    """The client's challenge, or its Authorization header when it sent none."""
+    return headers.get(CHALLENGE_HEADER) or headers.get(AUTH_HEADER) or None
 
+def sign_challenge(challenge: str) -> List[Tuple[str, str]]:
+    """Proof headers for `challenge`, signed with the TLS certificate key."""
     server_random = secrets.token_hex(32)
     ts = str(int(time.time()))
     proof = f"{PROOF_PREFIX}|{ts}|{server_random}|{challenge}"
+    signature = private_key.sign(proof.encode("utf-8"), ec.ECDSA(hashes.SHA256())).hex()
+    return [(SERVER_RANDOM_HEADER, server_random), (TS_HEADER, ts), (SIGNATURE_HEADER, signature)]
+
+class ProveServerIdentityMiddleware:
+    """
+    Adds the server's public key, and a signature over the client's challenge,
+    to the headers of every response. Only `http.response.start` is touched,
+    so the body of streaming responses passes straight through.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or private_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        challenge = _challenge(Headers(scope=scope))
+
+        async def send_with_proof(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(PUBLIC_KEY_HEADER, hex_public_key)
+                if challenge is not None:
+                    # Signed inline: a P-256 signature takes tens of microseconds, less
+                    # than waiting for the default executor behind embedding work
+                    for name, value in sign_challenge(challenge):
+                        headers.append(name, value)
+            await send(message)
 
-    resp.headers[SERVER_RANDOM_HEADER] = server_random
-    resp.headers[TS_HEADER] = ts
-    resp.headers[SIGNATURE_HEADER] = private_key.sign(proof.encode("utf-8"), ec.ECDSA(hashes.SHA256())).hex()
-    return resp
\ No newline at end of file
+        await self.app(scope, receive, send_with_proof)
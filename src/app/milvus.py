@@ -1,14 +1,24 @@
 import os
+import time
 from pathlib import Path
 
+import numpy as np
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_milvus import Milvus
 from langchain.docstore.document import Document
 
 from .config import get_settings
 
+# Metadata key under which a chunk's embedding travels with the Document, so
+# in-request ranking and the background Milvus insert share a single forward pass.
+EMBEDDING_METADATA_KEY = "embedding"
+
+DOC_TYPE_WEB = "web"
+DOC_TYPE_PDF = "pdf"
+DOC_TYPE_TEXT = "text"
+
 class MilvusWrapper:
-    collection_name : str = "panda_collection_v1"
+    collection_name : str = "panda_collection_v2"
     embeddings : HuggingFaceEmbeddings = None
     milvus_collection : Milvus = None
 
@@ -30,12 +40,97 @@ class MilvusWrapper:
             collection_properties={"collection.ttl.seconds": 86400},
             auto_id=True,
             drop_old=False,
+            enable_dynamic_field=True,
         )
 
-    def from_documents_for_user(self, user_id: str, documents: list[Document]) -> None:
-        docs = [Document(page_content=t.page_content, metadata={"user_id": user_id}) for t in documents]
-        self.milvus_collection.add_documents(docs)
+    def embed_documents(self, documents: list[Document]) -> list[Document]:
+        """
+        Attach an embedding to every document that does not carry one yet.
+        All missing vectors are computed in a single batch.
+        """
+        missing = [doc for doc in documents if doc.metadata.get(EMBEDDING_METADATA_KEY) is None]
+        if missing:
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in missing])
+            for doc, vector in zip(missing, vectors):
+                doc.metadata[EMBEDDING_METADATA_KEY] = vector
+        return documents
+
+    def rank_documents(self, query: str, documents: list[Document], k: int | None = None) -> list[Document]:
+        """
+        Order documents by cosine similarity to the query, reusing the vectors
+        attached by `embed_documents`. Only the query is embedded here.
+        """
+        if not documents:
+            return documents
+        self.embed_documents(documents)
+
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        doc_vectors = np.asarray([doc.metadata[EMBEDDING_METADATA_KEY] for doc in documents], dtype=np.float32)
+
+        norms = np.linalg.norm(doc_vectors, axis=1) * np.linalg.norm(query_vector)
+        scores = (doc_vectors @ query_vector) / np.where(norms == 0, 1.0, norms)
 
-    def similarity_search_for_user(self, user_id: str, query: str, k: int = 4):
+        order = np.argsort(-scores)
+        if k is not None:
+            order = order[:k]
+        return [documents[i] for i in order]
+
+    def from_documents_for_user(self, user_id: str, documents: list[Document], doc_type: str = DOC_TYPE_WEB) -> None:
+        if not documents:
+            return
+        self.embed_documents(documents)
+        ingested_at = int(time.time())
+        texts = [doc.page_content for doc in documents]
+        vectors = [doc.metadata[EMBEDDING_METADATA_KEY] for doc in documents]
+        metadatas = [
+            {
+                "user_id": user_id,
+                "doc_type": doc_type,
+                "source": str(doc.metadata.get("source") or ""),
+                "ingested_at": ingested_at,
+            }
+            for doc in documents
+        ]
+        self.milvus_collection.add_embeddings(texts=texts, embeddings=vectors, metadatas=metadatas)
+
+    def similarity_search_for_user(
+        self,
+        user_id: str,
+        query: str,
+        k: int = 4,
+        doc_type: str | None = None,
+        max_age_seconds: int | None = None,
+        with_vectors: bool = False,
+    ):
+        """
+        The user's chunks most similar to the query. With `with_vectors`, each
+        hit carries its stored vector like `embed_documents` attaches them, so
+        ranking the hits does not embed them again.
+        """
         expr = f'user_id == "{user_id}"'
-        return self.milvus_collection.similarity_search(query, k=k, expr=expr)
\ No newline at end of file
+        if doc_type is not None:
+            expr += f' and doc_type == "{doc_type}"'
+        if max_age_seconds is not None:
+            expr += f" and ingested_at >= {int(time.time()) - max_age_seconds}"
+        documents = self.milvus_collection.similarity_search(query, k=k, expr=expr)
+        if with_vectors and documents:
+            self._attach_stored_vectors(documents)
+        return documents
+
+    def _attach_stored_vectors(self, documents: list[Document]) -> None:
+        # The search drops the vectors of its hits; fetch them by primary key, like langchain's MMR search
+        store = self.milvus_collection
+        primary_field, vector_field = store._primary_field, store._vector_field
+        ids = [doc.metadata[primary_field] for doc in documents if primary_field in doc.metadata]
+        if not ids:
+            return
+        rows = store.client.query(
+            store.collection_name,
+            filter=f"{primary_field} in {ids}",
+            output_fields=[primary_field, vector_field],
+        )
+        vectors = {row[primary_field]: row[vector_field] for row in rows}
+        for doc in documents:
+            vector = vectors.get(doc.metadata.get(primary_field))
+            if vector is not None:
+                doc.metadata[EMBEDDING_METADATA_KEY] = list(vector)
@@ -1,4 +1,6 @@
 from .summarizing_llm import SummarizingLLM
 from .web_retriever import PandaWebRetriever
+from .latency_budget import LatencyBudget
+from .tokenizer import TokenCounter, get_token_counter
 
-__all__ = ["SummarizingLLM", "PandaWebRetriever"] 
\ No newline at end of file
+__all__ = ["SummarizingLLM", "PandaWebRetriever", "LatencyBudget", "TokenCounter", "get_token_counter"]
\ No newline at end of file
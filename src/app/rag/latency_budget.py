@@ -0,0 +1,87 @@
+import time
+from typing import Dict, List
+
+from ..logger import log
+
+# Share of the total budget each stage may use at most
+STAGE_SHARES: Dict[str, float] = {
+    "stored_chunks": 0.1,
+    "web_search": 0.2,
+    "page_fetch": 0.3,
+    "extraction": 0.1,
+    "summarization": 0.35,
+}
+MIN_STAGE_SECONDS = 1.0
+
+# Fraction of the budget that must still remain to avoid each degradation.
+# The stage a degradation affects checks it when it runs, so stages that run
+# early may go without one that a later stage applies.
+FEWER_URLS = "fewer_urls"
+SKIP_SUMMARIZATION = "skip_summarization"
+SKIP_RERANKING = "skip_reranking"
+DEGRADATION_THRESHOLDS: Dict[str, float] = {
+    FEWER_URLS: 0.75,
+    SKIP_SUMMARIZATION: 0.5,
+    SKIP_RERANKING: 0.3,
+}
+
+class LatencyBudget:
+    """
+    Per-request deadline shared by the stages of the search action.
+    Each stage gets a slice of the remaining time, and once the budget runs
+    short the stages degrade per `DEGRADATION_THRESHOLDS`.
+    """
+
+    def __init__(self, total_seconds: float, user_id: str | None = None):
+        self.total_seconds = total_seconds
+        self.user_id = user_id
+        self.started_at = time.monotonic()
+        self.degradations: List[str] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.total_seconds - self.elapsed())
+
+    def stage_timeout(self, stage: str) -> float:
+        """Seconds the given stage may take, never beyond what is left of the budget."""
+        share = STAGE_SHARES.get(stage, 0.1)
+        return max(MIN_STAGE_SECONDS, min(self.remaining(), self.total_seconds * share))
+
+    def should_degrade(self, degradation: str) -> bool:
+        """
+        Check whether the given degradation applies given the time left, and
+        record it the first time it does. Only the stage that applies a
+        degradation should check it, so `degradations` lists what happened.
+        """
+        if degradation in self.degradations:
+            return True
+
+        threshold = DEGRADATION_THRESHOLDS[degradation]
+        if self.remaining() >= self.total_seconds * threshold:
+            return False
+
+        self.degradations.append(degradation)
+        log.info(
+            f"Latency budget running short, applying degradation {degradation}",
+            extra={
+                "metric": "search_degradation",
+                "degradation": degradation,
+                "user_id": self.user_id,
+                "elapsed_s": round(self.elapsed(), 3),
+                "remaining_s": round(self.remaining(), 3),
+            },
+        )
+        return True
+
+    def record_timeout(self, stage: str) -> None:
+        log.warning(
+            f"Stage {stage} exceeded its latency budget slice",
+            extra={
+                "metric": "search_stage_timeout",
+                "stage": stage,
+                "user_id": self.user_id,
+                "elapsed_s": round(self.elapsed(), 3),
+            },
+        )
@@ -1,27 +1,101 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+
 from langchain_community.document_loaders.parsers import BaseImageBlobParser
 from PIL.Image import Image
 import numpy as np
 
+from ..config import get_settings
 from ..logger import log
 
+# Skip OCR for very small images that are likely not text.
+MIN_IMAGE_HEIGHT = 30
+MIN_IMAGE_WIDTH = 30
+
+def _create_rapidocr(**kwargs) -> Any:
+    try:
+        from rapidocr_onnxruntime import RapidOCR
+
+        return RapidOCR(**kwargs)
+    except ImportError:
+        raise ImportError(
+            "`rapidocr-onnxruntime` package not found, please install it with "
+            "`pip install rapidocr-onnxruntime`"
+        )
+    except Exception as e:
+        log.error(f"An unexpected error occurred during RapidOCR initialization: {e}", exc_info=True)
+        raise
+
+class OcrEnginePool:
+    """
+    Fixed set of pre-initialized RapidOCR engines shared by the threads of a
+    process, so the ONNX sessions are loaded once instead of once per parse.
+
+    Attributes:
+        size:
+          The number of engines in the pool.
+    """
+
+    def __init__(self, size: int, **kwargs) -> None:
+        self.size = max(1, size)
+        self._engines: "queue.Queue[Any]" = queue.Queue()
+        for _ in range(self.size):
+            self._engines.put(_create_rapidocr(**kwargs))
+        log.info(f"Initialized {self.size} RapidOCR engine(s) with {kwargs}")
+
+    @contextmanager
+    def engine(self) -> Iterator[Any]:
+        """Check out an engine, blocking until one is free."""
+        ocr = self._engines.get()
+        try:
+            yield ocr
+        finally:
+            self._engines.put(ocr)
+
+_ocr_engine_pool: OcrEnginePool | None = None
+_ocr_engine_pool_lock = threading.Lock()
+
+def ocr_engines_per_worker() -> int:
+    """This gunicorn worker's share of `PDF_OCR_ENGINES`, which is for the whole container."""
+    settings = get_settings()
+    return max(1, settings.PDF_OCR_ENGINES // max(1, settings.WORKERS))
+
+def get_ocr_engine_pool(size: Optional[int] = None) -> OcrEnginePool:
+    """
+    Per-process OCR engine pool, created on first use. Up to `PDF_OCR_ENGINES`
+    engines run at once in the container, so each gets an equal share of the CPUs.
+    """
+    global _ocr_engine_pool
+    with _ocr_engine_pool_lock:
+        if _ocr_engine_pool is None:
+            engines = max(1, get_settings().PDF_OCR_ENGINES)
+            _ocr_engine_pool = OcrEnginePool(
+                size=size or ocr_engines_per_worker(),
+                intra_op_num_threads=max(1, (os.cpu_count() or 1) // engines),
+                inter_op_num_threads=1,
+            )
+    return _ocr_engine_pool
+
 class RapidOCRBlobParser(BaseImageBlobParser):
     """Parser for extracting text from images using the RapidOCR library.
 
     Attributes:
-        ocr:
-          The RapidOCR instance for performing OCR.
+        engine_pool:
+          The pool of RapidOCR instances used for performing OCR.
     """
 
     def __init__(
         self,
-        **kwargs
+        engine_pool: Optional[OcrEnginePool] = None,
     ) -> None:
         """
         Initializes the RapidOCRBlobParser.
         """
         super().__init__()
-        self.ocr = None
-        self.kwargs = kwargs
+        self.engine_pool = engine_pool or get_ocr_engine_pool()
 
     def _analyze_image(self, img: "Image") -> str:
         """
@@ -35,35 +109,37 @@ class RapidOCRBlobParser(BaseImageBlobParser):
             str:
               The extracted text content.
         """
-        if not self.ocr:
-            try:
-                from rapidocr_onnxruntime import RapidOCR
-
-                self.ocr = RapidOCR(**self.kwargs)
-            except ImportError:
-                raise ImportError(
-                    "`rapidocr-onnxruntime` package not found, please install it with "
-                    "`pip install rapidocr-onnxruntime`"
-                )
-            except Exception as e:
-                log.error(f"An unexpected error occurred during RapidOCR initialization: {e}", exc_info=True)
-                raise
+        return self.analyze_images([img])[0]
 
-        try:
-            img_array = np.array(img)
-            
-            # Skip OCR for very small images that are likely not text.
-            MIN_IMAGE_HEIGHT = 30
-            MIN_IMAGE_WIDTH = 30
-            if img_array.shape[0] < MIN_IMAGE_HEIGHT or img_array.shape[1] < MIN_IMAGE_WIDTH:
-                return ""
-            
-            ocr_result, _ = self.ocr(img_array)
-        except Exception as e:
-            log.error(f"CRITICAL: Error during ocr() call in _analyze_image: {e}", exc_info=True)
-            raise ValueError(f"OCR engine failed internally. Original error: {e}") from e
-
-        content = ""
-        if ocr_result:
-            content = ("\n".join([text[1] for text in ocr_result])).strip()
-        return content
+    def analyze_images(self, imgs: List["Image"]) -> List[str]:
+        """
+        Extracts text from a batch of images with a single engine checkout.
+
+        Args:
+            imgs (List[Image]):
+              The images to be analyzed.
+
+        Returns:
+            List[str]:
+              The extracted text content, one entry per image.
+        """
+        img_arrays = [np.array(img) for img in imgs]
+        contents = [""] * len(img_arrays)
+        pending = [
+            i for i, img_array in enumerate(img_arrays)
+            if img_array.shape[0] >= MIN_IMAGE_HEIGHT and img_array.shape[1] >= MIN_IMAGE_WIDTH
+        ]
+        if not pending:
+            return contents
+
+        with self.engine_pool.engine() as ocr:
+            for i in pending:
+                try:
+                    ocr_result, _ = ocr(img_arrays[i])
+                except Exception as e:
+                    log.error(f"CRITICAL: Error during ocr() call in analyze_images: {e}", exc_info=True)
+                    raise ValueError(f"OCR engine failed internally. Original error: {e}") from e
+
+                if ocr_result:
+                    contents[i] = ("\n".join([text[1] for text in ocr_result])).strip()
+        return contents
@@ -16,7 +16,8 @@ from langchain_core.messages import (
 )
 from langchain_core.outputs import ChatGenerationChunk
 from pydantic import Field
-from ..api.helper.request_llm import request_llm 
+from ..api.helper.request_llm import request_llm
+from ..api.helper.upstream import ROLE_SUMMARIZATION
 from ..api.v1.schemas import LLMSuccessResponse
 from ..logger import log
 from fastapi.responses import JSONResponse
@@ -27,7 +28,9 @@ class SummarizingLLM(LLM):
     model_name: str = Field(..., alias="model")
     temperature: float = 0.2
     max_tokens: int = 2048
+    # A fixed endpoint, instead of a replica from the pool of `upstream_role`
     vllm_url: str | None = None
+    upstream_role: str = ROLE_SUMMARIZATION
 
     @property
     def _llm_type(self) -> str:
@@ -76,7 +79,7 @@ class SummarizingLLM(LLM):
         request_body_dict = {k: v for k, v in request_body_dict.items() if v is not None}
 
         request_body_str = json.dumps(request_body_dict)
-        response_data = request_llm(request_body=request_body_str, stream=False, vllm_url=self.vllm_url)
+        response_data = request_llm(request_body=request_body_str, stream=False, vllm_url=self.vllm_url, role=self.upstream_role)
         if isinstance(response_data, JSONResponse):
             try:
                 error_detail = response_data.body.decode()
@@ -0,0 +1,115 @@
+import threading
+from typing import Dict, List, Optional
+
+from cachetools import LRUCache
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from ..config import get_settings
+from ..logger import log
+
+# Used only when a model's tokenizer files cannot be loaded
+FALLBACK_CHARS_PER_TOKEN = 3
+# Texts shorter than this are cheaper to count again than to hash and cache
+MIN_CACHED_CHARS = 256
+
+def load_tokenizer(tokenizer_name: str):
+    """A fast Hugging Face tokenizer by hub name or local path, or None if it cannot be loaded."""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+        log.info(f"Loaded tokenizer {tokenizer_name} for token budgeting")
+        return tokenizer
+    except Exception as e:
+        log.warning(f"Failed to load tokenizer {tokenizer_name}, estimating {FALLBACK_CHARS_PER_TOKEN} characters per token: {e}")
+        return None
+
+class TokenCounter:
+    """
+    Token counts and token-aware splitting with the tokenizer of a served
+    model. Counts of recently seen texts are cached, which matters for the
+    recursive splitter that measures the same pieces repeatedly. Without a
+    tokenizer the counter falls back to the characters-per-token heuristic.
+    """
+
+    def __init__(self, tokenizer_name: str, tokenizer=None, cache_size: int = 8192):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = tokenizer
+        self._counts: LRUCache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    @property
+    def is_exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def _encode(self, text: str) -> List[int]:
+        return self._tokenizer.encode(text, add_special_tokens=False)
+
+    def count(self, text: str) -> int:
+        """Number of tokens in `text`, without special tokens."""
+        if not text:
+            return 0
+        if self._tokenizer is None:
+            return -(-len(text) // FALLBACK_CHARS_PER_TOKEN)
+        if len(text) < MIN_CACHED_CHARS:
+            return len(self._encode(text))
+
+        key = (len(text), hash(text))
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached is not None:
+            return cached
+        n_tokens = len(self._encode(text))
+        with self._lock:
+            self._counts[key] = n_tokens
+        return n_tokens
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Token counts of many texts, encoded in one batch."""
+        if self._tokenizer is None:
+            return [self.count(text) for text in texts]
+        if not texts:
+            return []
+        encoded = self._tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of `text` that fits in `max_tokens` tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self._tokenizer is None:
+            return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN]
+        encoding = self._tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]]
+
+    def text_splitter(self, chunk_size: int, chunk_overlap: int = 0) -> TextSplitter:
+        """A recursive splitter whose `chunk_size` and `chunk_overlap` are in tokens."""
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=self.count,
+        )
+
+_token_counter_instances: Dict[str, TokenCounter] = {}
+_token_counter_lock = threading.Lock()
+
+def get_token_counter(model_name: Optional[str] = None) -> TokenCounter:
+    """
+    Token counter for the given served model, the main model by default,
+    loaded once per process. `TOKENIZER_PATH` points the main model at local
+    tokenizer files.
+    """
+    settings = get_settings()
+    model_name = model_name or settings.MODEL_NAME
+    with _token_counter_lock:
+        counter = _token_counter_instances.get(model_name)
+        if counter is None:
+            tokenizer_name = model_name
+            if model_name == settings.MODEL_NAME and settings.TOKENIZER_PATH:
+                tokenizer_name = settings.TOKENIZER_PATH
+            counter = TokenCounter(tokenizer_name, load_tokenizer(tokenizer_name))
+            _token_counter_instances[model_name] = counter
+    return counter
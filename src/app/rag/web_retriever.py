@@ -14,6 +14,7 @@ from langchain_community.document_loaders import AsyncHtmlLoader
 
 from ..config import get_settings
 from ..logger import log
+from .latency_budget import FEWER_URLS
 
 class PandaWebRetriever(BaseRetriever):
     vector_store: Optional[Any] = None
@@ -29,6 +30,10 @@ class PandaWebRetriever(BaseRetriever):
         default=5,
         description="Maximum number of URLs to process to control latency",
     )
+    latency_budget: Optional[Any] = Field(
+        default=None,
+        description="Optional LatencyBudget bounding the search, fetch and extraction stages",
+    )
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -69,8 +74,15 @@ class PandaWebRetriever(BaseRetriever):
         ddg_task = loop.run_in_executor(None, self.search_ddg, query)
         brave_task = loop.run_in_executor(None, self.search_brave, query)
         
-        # Wait for both searches to complete
-        ddg_results, brave_results = await asyncio.gather(ddg_task, brave_task)
+        # Wait for both searches to complete, or keep whichever finished within the budget
+        if self.latency_budget is None:
+            ddg_results, brave_results = await asyncio.gather(ddg_task, brave_task)
+        else:
+            await asyncio.wait([ddg_task, brave_task], timeout=self.latency_budget.stage_timeout("web_search"))
+            if not (ddg_task.done() and brave_task.done()):
+                self.latency_budget.record_timeout("web_search")
+            ddg_results = ddg_task.result() if ddg_task.done() else []
+            brave_results = brave_task.result() if brave_task.done() else []
         
         # Combine results
         search_items = []
@@ -102,19 +114,13 @@ class PandaWebRetriever(BaseRetriever):
             log.warning(f"No URLs found to load")
             return []
 
+        if self.latency_budget is not None and self.latency_budget.should_degrade(FEWER_URLS):
+            url_to_look = url_to_look[:max(1, len(url_to_look) // 2)]
+
         log.info(f"Attempting to load {len(url_to_look)} URLs")
         
-        loader = AsyncHtmlLoader(
-            url_to_look, 
-            ignore_load_errors=True,
-            requests_kwargs={
-                "max_line_size": 16384,
-                "max_field_size": 16384,
-            }
-        )
-        
         try:
-            docs_with_html = await loader.aload()
+            docs_with_html = await self._load_pages(url_to_look)
             log.info(f"Loaded {len(docs_with_html)} documents from web pages")
         except Exception as e:
             log.error(f"Error loading documents from web pages: {e}", exc_info=True)
@@ -147,7 +153,13 @@ class PandaWebRetriever(BaseRetriever):
 
         loop = asyncio.get_running_loop()
         tasks = [loop.run_in_executor(None, extract_content, doc) for doc in docs_with_html]
-        processed_docs_results = await asyncio.gather(*tasks)
+        if self.latency_budget is None:
+            processed_docs_results = await asyncio.gather(*tasks)
+        else:
+            _, pending = await asyncio.wait(tasks, timeout=self.latency_budget.stage_timeout("extraction"))
+            if pending:
+                self.latency_budget.record_timeout("extraction")
+            processed_docs_results = [task.result() for task in tasks if task.done() and not task.exception()]
 
         docs = [doc for doc in processed_docs_results if doc is not None]
         log.info(f"Successfully extracted content from {len(docs)} documents using trafilatura")
@@ -155,9 +167,44 @@ class PandaWebRetriever(BaseRetriever):
         # Transform documents in parallel using asyncio
         docs = self.text_splitter.split_documents(docs)
 
+        # Embed the chunks once so ranking and storage can share the vectors
+        if self.vector_store is not None and docs:
+            docs = await loop.run_in_executor(None, self.vector_store.embed_documents, docs)
+
         log.info(f"Processed documents: {len(docs)} documents")
         return docs
     
+    async def _load_pages(self, urls: List[str]) -> List[Document]:
+        """
+        Load the HTML of the given URLs. With a latency budget, pages still
+        loading when the fetch slice runs out are dropped.
+        """
+        def make_loader(urls_to_load: List[str]) -> AsyncHtmlLoader:
+            return AsyncHtmlLoader(
+                urls_to_load,
+                ignore_load_errors=True,
+                requests_kwargs={
+                    "max_line_size": 16384,
+                    "max_field_size": 16384,
+                }
+            )
+
+        if self.latency_budget is None:
+            return await make_loader(urls).aload()
+
+        tasks = [asyncio.create_task(make_loader([url]).aload()) for url in urls]
+        _, pending = await asyncio.wait(tasks, timeout=self.latency_budget.stage_timeout("page_fetch"))
+        if pending:
+            self.latency_budget.record_timeout("page_fetch")
+            for task in pending:
+                task.cancel()
+
+        docs: List[Document] = []
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                docs.extend(task.result())
+        return docs
+
     def search_ddg(self, query: str) -> List[Dict[str, str]]:
         try:
             with DDGS() as ddgs:
@@ -0,0 +1,86 @@
+import json
+from langchain_core.documents import Document
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.actions.pdf.cache import PdfCache, summary_cache_key
+from app.milvus import EMBEDDING_METADATA_KEY
+
+def _docs():
+    return [
+        Document(page_content="page one", metadata={"page": 0, EMBEDDING_METADATA_KEY: [0.1, 0.2]}),
+        Document(page_content="page two", metadata={"page": 1}),
+    ]
+
+def test_put_and_get_strips_embeddings():
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60)
+    cache.put("key", _docs())
+
+    entry = cache.get("key")
+    assert [doc.page_content for doc in entry.docs] == ["page one", "page two"]
+    assert all(EMBEDDING_METADATA_KEY not in doc.metadata for doc in entry.docs)
+
+def test_copy_docs_does_not_mutate_cache():
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60)
+    cache.put("key", _docs())
+
+    copies = cache.get("key").copy_docs()
+    copies[0].metadata[EMBEDDING_METADATA_KEY] = [1.0]
+    assert EMBEDDING_METADATA_KEY not in cache.get("key").docs[0].metadata
+
+def test_ingested_flag_is_per_collection():
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60)
+    cache.put("key", _docs())
+    cache.mark_ingested("key", "user_a")
+
+    assert cache.is_ingested("key", "user_a")
+    assert not cache.is_ingested("key", "user_b")
+    assert not cache.is_ingested("missing", "user_a")
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path))
+    cache.put("key", _docs())
+    cache.put_summary(summary_cache_key(["key"], 500), "summary")
+
+    other = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert other.get("key") is not None
+    assert other.get_summary(summary_cache_key(["key"], 500)) == "summary"
+
+def test_memory_tier_is_bounded():
+    cache = PdfCache(max_bytes=2048, ttl_seconds=60)
+    cache.put("a", _docs())
+    cache.put("b", _docs())
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+def test_disk_tier_stores_json(tmp_path):
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path))
+    cache.put("key", _docs())
+    cache.mark_ingested("key", "user_a")
+
+    data = json.loads((tmp_path / "key.pdf.json").read_text())
+    assert data["docs"][1] == {"page_content": "page two", "metadata": {"page": 1}}
+
+    other = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert other.get("key").docs[0].metadata == {"page": 0}
+    assert other.is_ingested("key", "user_a")
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    (tmp_path / "key.pdf.json").write_text('{"docs": "not a list of pages"}')
+    (tmp_path / "other.summary.json").write_bytes(b"\x80\x04not json")
+
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert cache.get("key") is None
+    assert cache.get_summary("other") is None
+
+def test_disk_tier_is_pruned_every_few_writes(tmp_path):
+    cache = PdfCache(max_bytes=1024 * 1024, ttl_seconds=60, disk_dir=str(tmp_path), disk_max_files=2, disk_prune_every=4)
+
+    for n in range(3):
+        cache.put_summary(f"summary-{n}", "summary")
+    assert len(list(tmp_path.glob("*.json"))) == 3
+
+    cache.put_summary("summary-3", "summary")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["summary-2.summary.json", "summary-3.summary.json"]
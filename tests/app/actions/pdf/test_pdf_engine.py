@@ -0,0 +1,39 @@
+import fitz
+import pytest
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.actions.pdf import engine as engine_module
+from app.actions.pdf.engine import PdfParsingEngine
+from app.config import get_settings
+
+def _pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for n in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {n} of the quarterly report.")
+    return doc.tobytes()
+
+@pytest.mark.asyncio
+async def test_pages_are_counted_on_the_pool_and_come_with_every_range():
+    engine = PdfParsingEngine(workers=2, chunk_size=3)
+    try:
+        # Opening the PDF in this process would block the event loop
+        with patch.object(engine_module, "open_pdf", side_effect=AssertionError("PDF opened on the event loop")):
+            ranges = [parsed async for parsed in engine.parse_ranges(_pdf(7), enable_ocr=False, max_pages=5)]
+    finally:
+        engine.shutdown()
+
+    assert [len(parsed.docs) for parsed in ranges] == [3, 2]
+    assert [parsed.page_count for parsed in ranges] == [5, 5]
+    assert "Page 4 of" in ranges[-1].docs[-1].page_content
+
+@pytest.mark.parametrize("engines, workers, per_worker", [(8, 4, 2), (2, 4, 1), (8, 1, 8)])
+def test_ocr_engines_are_split_across_the_workers(engines, workers, per_worker):
+    settings = get_settings()
+    with patch.object(settings, "PDF_OCR_ENGINES", engines), \
+         patch.object(settings, "WORKERS", workers), \
+         patch.object(engine_module, "_pdf_engine_instance", None):
+        assert engine_module.get_pdf_engine().workers == per_worker
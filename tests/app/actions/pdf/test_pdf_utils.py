@@ -0,0 +1,33 @@
+import fitz
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.actions.pdf.utils import classify_page_needs_ocr
+
+TEXT = "The quarterly report shows steady growth in every region. " * 20
+
+def _gray_pixmap() -> fitz.Pixmap:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+    pix.clear_with(128)
+    return pix
+
+def test_text_page_with_photo_skips_ocr():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 400), TEXT, fontsize=10)
+    page.insert_image(fitz.Rect(50, 420, 550, 780), pixmap=_gray_pixmap())
+    assert not classify_page_needs_ocr(page)
+
+def test_scanned_page_needs_ocr():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=_gray_pixmap())
+    assert classify_page_needs_ocr(page)
+
+def test_text_only_page_skips_ocr():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 400), TEXT, fontsize=10)
+    assert not classify_page_needs_ocr(page)
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from langchain_core.documents import Document
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.actions.search import prefetch as prefetch_module
+from app.actions.search.prefetch import SearchPrefetch, query_similarity, extract_search_keywords
+from app.api.helper.auth import AuthInfo
+from app.api.v1 import openai as openai_module
+from app.api.v1.schemas import LLMRequest
+from app.config import get_settings
+
+def test_query_similarity_identical_queries():
+    assert query_similarity("bitcoin price 2021", "Bitcoin price 2021") == 1.0
+
+def test_query_similarity_partial_overlap():
+    assert query_similarity("bitcoin price 2021", "average bitcoin price") == 2 / 4
+
+def test_query_similarity_empty_query():
+    assert query_similarity("", "bitcoin price") == 0.0
+
+def test_extract_search_keywords_falls_back_to_raw_text():
+    with patch("rake_nltk.Rake", side_effect=LookupError("stopwords not found")):
+        assert extract_search_keywords("  What is the bitcoin price?  ") == "What is the bitcoin price?"
+
+DOCS = [Document(page_content="Bitcoin traded at 29,000 USD.", metadata={"source": "https://example.com"})]
+
+async def _slow_search(query):
+    await asyncio.sleep(10)
+
+def _prefetch(search) -> SearchPrefetch:
+    retriever = MagicMock(ainvoke=search)
+    with patch.object(prefetch_module, "PandaWebRetriever", return_value=retriever), \
+         patch.object(prefetch_module, "extract_search_keywords", return_value="bitcoin price"):
+        return SearchPrefetch("What is the bitcoin price?", "user-1")
+
+@pytest.mark.asyncio
+async def test_prefetched_documents_are_taken_for_a_matching_query():
+    prefetch = _prefetch(AsyncMock(return_value=DOCS))
+
+    assert await prefetch.take("Bitcoin price") == DOCS
+
+@pytest.mark.asyncio
+async def test_prefetch_for_another_query_is_cancelled():
+    prefetch = _prefetch(_slow_search)
+    await asyncio.sleep(0)
+
+    assert await prefetch.take("weather in berlin") is None
+    await asyncio.sleep(0)
+    assert prefetch.task.cancelled()
+
+@pytest.mark.asyncio
+async def test_failed_prefetch_is_not_taken():
+    prefetch = _prefetch(AsyncMock(side_effect=RuntimeError("search engine down")))
+
+    assert await prefetch.take("bitcoin price") is None
+
+@pytest.mark.asyncio
+async def test_discard_cancels_a_running_prefetch():
+    prefetch = _prefetch(_slow_search)
+    await asyncio.sleep(0)
+
+    prefetch.discard("not_needed")
+    await asyncio.sleep(0)
+    assert prefetch.task.cancelled()
+
+@pytest.mark.asyncio
+async def test_prefetch_is_discarded_when_classification_fails():
+    prefetch = MagicMock()
+    payload = LLMRequest(model="test-model", messages=[{"role": "user", "content": "What is the bitcoin price?"}], stream=True)
+
+    with patch.object(get_settings(), "SEARCH_PREFETCH_ENABLED", True), \
+         patch.object(openai_module, "SearchPrefetch", return_value=prefetch), \
+         patch.object(openai_module, "get_milvus_wrapper"), \
+         patch.object(openai_module, "request_classification", side_effect=RuntimeError("classifier down")):
+        with pytest.raises(Exception):
+            await openai_module.stream_vllm_response(payload, AuthInfo(user_id="user-1"))
+
+    prefetch.discard.assert_called_once_with("classification_failed")
@@ -0,0 +1,87 @@
+import json
+import time
+import pytest
+from types import SimpleNamespace
+from langchain_core.documents import Document
+from unittest.mock import MagicMock, patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.actions.search import search as search_module
+from app.actions.search import utils as utils_module
+from app.actions.search.utils import retrieve_stored_web_chunks
+from app.api.v1.schemas import LLMRequest
+from app.rag import LatencyBudget
+
+def _stored(*texts: str) -> list[Document]:
+    return [Document(page_content=text, metadata={"source": f"https://{text}.example"}) for text in texts]
+
+def _retrieve(candidates: list[Document], scores: list[float]) -> list[Document]:
+    milvus = MagicMock()
+    milvus.similarity_search_for_user.return_value = candidates
+    reranker = MagicMock(return_value=[
+        SimpleNamespace(index=index, text=doc.page_content, score=score)
+        for index, (doc, score) in enumerate(zip(candidates, scores))
+    ])
+    with patch.object(utils_module, "get_milvus_wrapper", return_value=milvus), \
+         patch.object(utils_module, "get_reranker", return_value=reranker):
+        return retrieve_stored_web_chunks("user-collection", "bitcoin price")
+
+def test_stored_chunks_above_the_threshold_are_returned_best_first():
+    picked = _retrieve(_stored("a", "b", "c", "a"), [0.7, 0.9, 0.2, 0.8])
+
+    # The duplicate of "a" and the irrelevant "c" are left out
+    assert [doc.page_content for doc in picked] == ["b", "a"]
+
+def test_no_stored_chunks_skips_the_reranker():
+    milvus = MagicMock()
+    milvus.similarity_search_for_user.return_value = []
+    with patch.object(utils_module, "get_milvus_wrapper", return_value=milvus), \
+         patch.object(utils_module, "get_reranker") as get_reranker:
+        assert retrieve_stored_web_chunks("user-collection", "bitcoin price") == []
+    get_reranker.assert_not_called()
+
+async def _stored_results_event(budget: LatencyBudget, retrieve) -> dict:
+    payload = LLMRequest(model="test-model", messages=[{"role": "user", "content": "bitcoin price"}])
+    with patch.object(search_module, "retrieve_stored_web_chunks", side_effect=retrieve), \
+         patch.object(search_module, "get_milvus_wrapper"):
+        stream = search_module.search_stream(payload, "user-1", '{"query": "bitcoin price", "requirements": "quick"}', budget)
+        try:
+            async for message in stream:
+                data = json.loads(message.removeprefix("data: "))
+                if "stored_results" in data["data"]:
+                    return data["data"]["stored_results"]
+        finally:
+            await stream.aclose()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stored, status", [
+    (_stored("a", "b", "c"), "hit"),
+    (_stored("a"), "partial"),
+    ([], "miss"),
+])
+async def test_search_reports_how_much_the_store_answered(stored, status):
+    event = await _stored_results_event(LatencyBudget(30), lambda *args: stored)
+
+    assert event["status"] == status
+    assert event["count"] == len(stored)
+    assert sorted(event["urls"]) == sorted(doc.metadata["source"] for doc in stored)
+
+@pytest.mark.asyncio
+async def test_slow_store_lookup_is_cut_off_by_the_budget():
+    budget = LatencyBudget(30)
+
+    def slow_lookup(*args):
+        time.sleep(0.5)
+        return _stored("a", "b", "c")
+
+    with patch.object(budget, "stage_timeout", return_value=0.05), \
+         patch.object(budget, "record_timeout") as record_timeout:
+        started = time.monotonic()
+        event = await _stored_results_event(budget, slow_lookup)
+
+    assert time.monotonic() - started < 0.4
+    assert event["status"] == "miss"
+    record_timeout.assert_called_once_with("stored_chunks")
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper.auth import AuthInfo
+from app.api.v1 import openai as openai_module
+from app.api.v1.schemas import LLMRequest
+from app.config import get_settings
+from app.rag.latency_budget import (
+    LatencyBudget,
+    FEWER_URLS,
+    SKIP_SUMMARIZATION,
+    SKIP_RERANKING,
+    MIN_STAGE_SECONDS,
+)
+
+def _budget_at(total: float, elapsed: float) -> LatencyBudget:
+    budget = LatencyBudget(total)
+    budget.started_at -= elapsed
+    return budget
+
+def test_no_degradation_with_full_budget():
+    budget = _budget_at(30, 0)
+    assert not budget.should_degrade(FEWER_URLS)
+    assert not budget.should_degrade(SKIP_SUMMARIZATION)
+    assert not budget.should_degrade(SKIP_RERANKING)
+    assert budget.degradations == []
+
+def test_degradations_apply_as_the_budget_runs_short():
+    budget = _budget_at(30, 12)  # 60% left
+    assert budget.should_degrade(FEWER_URLS)
+    assert not budget.should_degrade(SKIP_SUMMARIZATION)
+
+    budget.started_at -= 10  # ~27% left
+    assert budget.should_degrade(SKIP_SUMMARIZATION)
+    assert budget.should_degrade(SKIP_RERANKING)
+    assert budget.degradations == [FEWER_URLS, SKIP_SUMMARIZATION, SKIP_RERANKING]
+
+def test_degradation_is_recorded_once():
+    budget = _budget_at(30, 29)
+    assert budget.should_degrade(FEWER_URLS)
+    assert budget.should_degrade(FEWER_URLS)
+    assert budget.degradations == [FEWER_URLS]
+
+def test_stage_timeout_is_bounded_by_share_and_remaining():
+    assert _budget_at(30, 0).stage_timeout("page_fetch") == 30 * 0.3
+    assert abs(_budget_at(30, 27).stage_timeout("summarization") - 3) < 0.1
+    assert _budget_at(30, 40).stage_timeout("page_fetch") == MIN_STAGE_SECONDS
+
+def test_only_the_degradations_checked_are_recorded():
+    budget = _budget_at(30, 5)  # the fetch stage ran at full size
+    assert not budget.should_degrade(FEWER_URLS)
+
+    budget.started_at -= 20  # ~17% left, checked as search.py does: reranking first
+    assert budget.should_degrade(SKIP_RERANKING)
+    assert budget.should_degrade(SKIP_SUMMARIZATION)
+    assert budget.degradations == [SKIP_RERANKING, SKIP_SUMMARIZATION]
+
+def test_stored_chunks_stage_has_its_own_share():
+    assert _budget_at(30, 0).stage_timeout("stored_chunks") == 30 * 0.1
+
+@pytest.mark.asyncio
+async def test_classification_is_not_cut_short_by_the_search_budget():
+    payload = LLMRequest(model="test-model", messages=[{"role": "user", "content": "What is the bitcoin price?"}], stream=True)
+    classification = AsyncMock(return_value=[False, []])
+
+    with patch.object(get_settings(), "CLASSIFICATION_TIMEOUT_SECONDS", 120.0), \
+         patch.object(openai_module, "request_classification", classification), \
+         patch.object(openai_module, "get_admission_controller", return_value=MagicMock(admit_response=AsyncMock())):
+        await openai_module.stream_vllm_response(payload, AuthInfo(user_id="user-1"))
+
+    # A timed out classifier answers "no search", so it must not time out early
+    assert classification.call_args.kwargs["timeout"] == 120.0
@@ -0,0 +1,57 @@
+import re
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.rag.tokenizer import TokenCounter
+
+class WhitespaceTokenizer:
+    """Stands in for a Hugging Face tokenizer: one token per word."""
+
+    def __init__(self):
+        self.encode_calls = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.encode_calls += 1
+        return [0 for _ in re.finditer(r"\S+", text)]
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(texts, str):
+            encoding = {"input_ids": self.encode(texts)}
+            if return_offsets_mapping:
+                encoding["offset_mapping"] = [m.span() for m in re.finditer(r"\S+", texts)]
+            return encoding
+        return {"input_ids": [self.encode(text) for text in texts]}
+
+def test_counts_with_the_tokenizer_and_caches_long_texts():
+    tokenizer = WhitespaceTokenizer()
+    counter = TokenCounter("test-model", tokenizer)
+    text = "word " * 300
+
+    assert counter.count(text) == 300
+    assert counter.count(text) == 300
+    assert tokenizer.encode_calls == 1
+    assert counter.count_batch(["a b", "c d e"]) == [2, 3]
+
+def test_truncate_cuts_at_a_token_boundary():
+    counter = TokenCounter("test-model", WhitespaceTokenizer())
+
+    assert counter.truncate("one two three four", 2) == "one two"
+    assert counter.truncate("one two", 5) == "one two"
+
+def test_splitter_measures_chunks_in_tokens():
+    counter = TokenCounter("test-model", WhitespaceTokenizer())
+    splitter = counter.text_splitter(chunk_size=50)
+
+    chunks = splitter.split_text(" ".join(f"w{n}" for n in range(500)))
+
+    assert len(chunks) == 10
+    assert all(counter.count(chunk) <= 50 for chunk in chunks)
+
+def test_falls_back_to_characters_without_a_tokenizer():
+    counter = TokenCounter("test-model")
+
+    assert not counter.is_exact
+    assert counter.count("x" * 30) == 10
+    assert counter.truncate("x" * 30, 5) == "x" * 15
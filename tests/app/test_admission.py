@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper.admission import AdmissionController, AdmissionLane, LANE_API_KEY, LANE_GENERATION
+
+def _lane(max_in_flight=1, max_queue=1, max_wait_seconds=1.0) -> AdmissionLane:
+    return AdmissionLane("test", max_in_flight=max_in_flight, max_queue=max_queue, max_wait_seconds=max_wait_seconds)
+
+@pytest.mark.asyncio
+async def test_queued_request_gets_the_released_slot():
+    lane = _lane()
+    first = await lane.admit()
+    waiting = asyncio.create_task(lane.admit())
+    await asyncio.sleep(0)
+    assert lane.queued == 1
+
+    first.release()
+    first.release()
+    second = await waiting
+
+    assert lane.in_flight == 1
+    second.release()
+    assert lane.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_after():
+    lane = _lane(max_queue=1)
+    await lane.admit()
+    waiting = asyncio.create_task(lane.admit())
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await lane.admit()
+
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+    waiting.cancel()
+
+@pytest.mark.asyncio
+async def test_wait_is_bounded():
+    lane = _lane(max_wait_seconds=0.01)
+    await lane.admit()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await lane.admit()
+
+    assert exc_info.value.status_code == 429
+    assert lane.queued == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    lane = _lane()
+    first = await lane.admit()
+    waiting = asyncio.create_task(lane.admit())
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    first.release()
+
+    assert lane.in_flight == 0
+    assert lane.queued == 0
+
+@pytest.mark.asyncio
+async def test_api_keys_have_their_own_lane():
+    controller = AdmissionController({LANE_GENERATION: _lane(max_queue=0), LANE_API_KEY: _lane(max_queue=0)})
+    await controller.admit(LANE_GENERATION)
+
+    slot = await controller.admit(LANE_API_KEY)
+
+    with pytest.raises(HTTPException):
+        await controller.admit(LANE_GENERATION)
+    slot.release()
+
+def test_slot_is_held_until_the_stream_is_sent():
+    lane = _lane(max_queue=0)
+    controller = AdmissionController({LANE_GENERATION: lane})
+    in_flight_while_streaming = []
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                in_flight_while_streaming.append(lane.in_flight)
+                yield f"data: {i}\n\n"
+        return await controller.admit_response(
+            LANE_GENERATION, lambda: asyncio.sleep(0, StreamingResponse(chunks(), media_type="text/event-stream"))
+        )
+
+    @app.get("/json")
+    async def json():
+        return await controller.admit_response(LANE_GENERATION, lambda: asyncio.sleep(0, JSONResponse({"ok": True})))
+
+    client = TestClient(app)
+    response = client.get("/stream")
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert in_flight_while_streaming == [1, 1, 1]
+    assert lane.in_flight == 0
+    assert client.get("/json").json() == {"ok": True}
+    assert lane.in_flight == 0
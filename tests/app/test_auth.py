@@ -1,11 +1,15 @@
+import hmac
 import pytest
+import time
 from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
 from fastapi import HTTPException
 from tests.app.test_helpers import create_test_token, create_test_request, setup_test_environment
 
 setup_test_environment()
 
-from app.api.helper.auth import verify_authorization_header
+from app.api.helper.auth import verify_authorization_header, VerifiedTokenCache, AuthInfo
+from app.config import get_settings
 
 def test_valid_token():
     """Test verification of a valid JWT token"""
@@ -47,4 +51,38 @@ def test_custom_payload():
     request = create_test_request()
     payload = verify_authorization_header(request, auth_header)
     assert payload["sub"] == "test_user"
-    assert payload["role"] == "admin" 
\ No newline at end of file
+    assert payload["role"] == "admin" 
+
+def test_verified_token_is_not_verified_again():
+    """A token already verified is served from the cache until it expires"""
+    token = create_test_token(payload={"sub": "cached_user", "exp": int(time.time()) + 3600})
+    auth_header = f"Bearer {token}"
+    first = verify_authorization_header(create_test_request(), auth_header)
+    with patch("app.api.helper.auth.jwt.decode", side_effect=AssertionError("verified again")):
+        second = verify_authorization_header(create_test_request(), auth_header)
+    assert first.user_id == second.user_id == "cached_user"
+
+def test_verified_token_cache_drops_expired_tokens():
+    """Cached claims are never returned after the token's exp"""
+    cache = VerifiedTokenCache(maxsize=10)
+    cache.put(b"live", AuthInfo(user_id="live"), time.time() + 60)
+    cache.put(b"expired", AuthInfo(user_id="expired"), time.time() - 1)
+    assert cache.get(b"live").user_id == "live"
+    assert cache.get(b"expired") is None
+    assert VerifiedTokenCache(maxsize=0).get(b"live") is None
+
+def test_api_key():
+    """API keys are matched by digest"""
+    with patch.object(get_settings(), "API_KEYS", ["test-api-key-123"]):
+        auth_info = verify_authorization_header(create_test_request(), "Bearer test-api-key-123")
+    assert auth_info.is_api_key
+    assert auth_info.user_id == "api_key_test-api"
+
+def test_api_keys_are_all_compared_in_constant_time():
+    """Every key is compared with hmac.compare_digest, even after a match"""
+    keys = ["test-api-key-123", "other-api-key-456", "third-api-key-789"]
+    with patch.object(get_settings(), "API_KEYS", keys), \
+         patch("app.api.helper.auth.hmac.compare_digest", wraps=hmac.compare_digest) as compare_digest:
+        auth_info = verify_authorization_header(create_test_request(), "Bearer test-api-key-123")
+    assert auth_info.is_api_key
+    assert compare_digest.call_count == len(keys)
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from langchain_core.documents import Document
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper import request_llm as request_llm_module
+from app.api.helper.upstream import UpstreamPool
+from app.api.v1.openai import respond_from_llm
+from app.api.v1.schemas import LLMRequest
+from app.actions.search import search as search_module
+from app.actions.search import utils as search_utils
+from tests.mock.mock_vllm_server import MockVllmServer, orphaned_generations, stream_until
+
+REQUEST_BODY = '{"model": "mock-model", "messages": [{"role": "user", "content": "Hi"}], "stream": true}'
+
+@pytest.fixture
+def replica():
+    # About six seconds of tokens, far longer than any test waits
+    server = MockVllmServer(stream_repeat=200, chunk_delay=0.01).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def pool(replica):
+    pool = UpstreamPool("test", [replica.chat_url])
+
+    async def passthrough(request_body, *args):
+        return request_body
+
+    with patch.object(request_llm_module, "get_upstream_pool", return_value=pool), \
+         patch.object(request_llm_module, "_add_system_prompt", side_effect=passthrough), \
+         patch.object(request_llm_module, "_apply_vector_db", side_effect=passthrough):
+        yield pool
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+async def test_disconnect_aborts_the_generation(replica, pool, spec_version):
+    response = await respond_from_llm(REQUEST_BODY, should_stream=True, user_id="user-1", use_vector_db=False)
+
+    body = await stream_until(response, lambda body: b"Hello" in body, spec_version)
+
+    assert b"Hello" in body
+    assert await orphaned_generations(replica) == 0
+    assert replica.app.state.generations == {"started": 1, "completed": 0, "aborted": 1}
+    assert pool.endpoints[0].outstanding == 0
+
+def _search_payload() -> LLMRequest:
+    return LLMRequest(model="mock-model", messages=[{"role": "user", "content": "What happened today?"}])
+
+@pytest.mark.asyncio
+async def test_disconnect_during_search_answer_aborts_the_generation(replica, pool):
+    stored = [Document(page_content=f"Stored result {i}", metadata={"source": f"https://example.com/{i}"}) for i in range(3)]
+    milvus = MagicMock()
+    milvus.rank_documents.side_effect = lambda query, docs: docs
+    token_counter = MagicMock()
+    token_counter.count.return_value = 10
+
+    with patch.object(search_module, "retrieve_stored_web_chunks", return_value=stored), \
+         patch.object(search_module, "get_milvus_wrapper", return_value=milvus), \
+         patch.object(search_module, "get_token_counter", return_value=token_counter), \
+         patch.object(search_utils, "get_system_prompt", new_callable=AsyncMock, return_value="Results: {search_results_str}"):
+        response = await search_module.search_handler(_search_payload(), "user-1", '{"query": "today", "requirements": "quick"}')
+        body = await stream_until(response, lambda body: b"Hello" in body)
+
+    assert b"[RAG_DONE]" in body
+    assert await orphaned_generations(replica) == 0
+    assert replica.app.state.generations["aborted"] == 1
+    assert pool.endpoints[0].outstanding == 0
+
+@pytest.mark.asyncio
+async def test_disconnect_during_web_search_cancels_it(replica, pool):
+    search_started = asyncio.Event()
+    search_cancelled = asyncio.Event()
+
+    async def slow_search(query):
+        search_started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            search_cancelled.set()
+            raise
+
+    retriever = MagicMock()
+    retriever.return_value.ainvoke.side_effect = slow_search
+
+    with patch.object(search_module, "retrieve_stored_web_chunks", return_value=[]), \
+         patch.object(search_module, "get_milvus_wrapper", return_value=MagicMock()), \
+         patch.object(search_module, "PandaWebRetriever", retriever):
+        response = await search_module.search_handler(_search_payload(), "user-1", '{"query": "today", "requirements": "quick"}')
+        body = await stream_until(response, lambda body: b"Searching through URLs" in body and search_started.is_set())
+
+    assert b"[RAG_DONE]" not in body
+    assert search_cancelled.is_set()
+    assert replica.app.state.generations["started"] == 0
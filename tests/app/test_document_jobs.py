@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper.document_jobs import DocumentJobQueue, JOB_SUCCEEDED, JOB_FAILED
+
+def _queue(tmp_path, **kwargs) -> DocumentJobQueue:
+    options = {"workers": 1, "max_queued": 4, "jobs_dir": str(tmp_path), "ttl_seconds": 60}
+    options.update(kwargs)
+    return DocumentJobQueue(**options)
+
+async def _wait_for(queue: DocumentJobQueue, user_id: str, job_id: str):
+    for _ in range(100):
+        job = queue.get(user_id, job_id)
+        if job.status in (JOB_SUCCEEDED, JOB_FAILED):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("document job did not finish")
+
+@pytest.mark.asyncio
+@patch('app.api.helper.document_jobs.get_milvus_wrapper')
+async def test_text_job_is_chunked_and_ingested(mock_get_milvus, tmp_path):
+    milvus = MagicMock()
+    mock_get_milvus.return_value = milvus
+    queue = _queue(tmp_path)
+
+    job = queue.submit("user", "text", "A sentence about the quarterly report. " * 200, source="notes.txt")
+    finished = await _wait_for(queue, "user", job.id)
+    queue.shutdown()
+
+    assert finished.status == JOB_SUCCEEDED
+    assert finished.total > 1
+    assert finished.done == finished.total
+    ingested = [doc for call in milvus.from_documents_for_user.call_args_list for doc in call.args[1]]
+    assert len(ingested) == finished.total
+    assert all(call.args[2] == "text" for call in milvus.from_documents_for_user.call_args_list)
+    assert ingested[0].metadata["source"] == "notes.txt"
+
+@pytest.mark.asyncio
+@patch('app.api.helper.document_jobs.get_milvus_wrapper')
+async def test_failed_job_reports_error(mock_get_milvus, tmp_path):
+    mock_get_milvus.return_value.from_documents_for_user.side_effect = RuntimeError("milvus unavailable")
+    queue = _queue(tmp_path)
+
+    job = queue.submit("user", "text", "Some text to store.")
+    finished = await _wait_for(queue, "user", job.id)
+    queue.shutdown()
+
+    assert finished.status == JOB_FAILED
+    assert "milvus unavailable" in finished.error
+
+@pytest.mark.asyncio
+async def test_jobs_are_scoped_per_user(tmp_path):
+    queue = _queue(tmp_path)
+    with patch('app.api.helper.document_jobs.get_milvus_wrapper'):
+        job = queue.submit("user", "text", "Some text to store.")
+        assert queue.get("other_user", job.id) is None
+        assert queue.get("user", "../secret") is None
+        await _wait_for(queue, "user", job.id)
+    queue.shutdown()
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected(tmp_path):
+    queue = _queue(tmp_path, max_queued=1)
+    # Workers only start running once the test yields to the event loop
+    queue.submit("user", "text", "first")
+    with pytest.raises(HTTPException) as exc_info:
+        queue.submit("user", "text", "second")
+    assert exc_info.value.status_code == 429
+    queue.shutdown()
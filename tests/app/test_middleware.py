@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app import middleware
+from app.middleware import (
+    ProveServerIdentityMiddleware,
+    CHALLENGE_HEADER,
+    PROOF_PREFIX,
+    PUBLIC_KEY_HEADER,
+    SERVER_RANDOM_HEADER,
+    SIGNATURE_HEADER,
+    TS_HEADER,
+)
+
+PRIVATE_KEY = ec.generate_private_key(ec.SECP256R1())
+HEX_PUBLIC_KEY = PRIVATE_KEY.public_key().public_bytes(
+    encoding=serialization.Encoding.X962,
+    format=serialization.PublicFormat.UncompressedPoint,
+).hex()
+
+def _client() -> TestClient:
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"data: {i}\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    app.add_middleware(ProveServerIdentityMiddleware)
+    return TestClient(app)
+
+@patch.object(middleware, "hex_public_key", HEX_PUBLIC_KEY)
+@patch.object(middleware, "private_key", PRIVATE_KEY)
+def test_streaming_response_carries_a_valid_proof():
+    response = _client().get("/stream", headers={CHALLENGE_HEADER: "client-challenge"})
+
+    assert response.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+    assert response.headers[PUBLIC_KEY_HEADER] == HEX_PUBLIC_KEY
+    proof = f"{PROOF_PREFIX}|{response.headers[TS_HEADER]}|{response.headers[SERVER_RANDOM_HEADER]}|client-challenge"
+    # Raises if the signature does not match
+    PRIVATE_KEY.public_key().verify(
+        bytes.fromhex(response.headers[SIGNATURE_HEADER]), proof.encode("utf-8"), ec.ECDSA(hashes.SHA256())
+    )
+
+@patch.object(middleware, "hex_public_key", HEX_PUBLIC_KEY)
+@patch.object(middleware, "private_key", PRIVATE_KEY)
+def test_no_signature_without_a_challenge():
+    with patch.object(middleware, "sign_challenge") as mock_sign:
+        response = _client().get("/stream")
+
+    mock_sign.assert_not_called()
+    assert response.headers[PUBLIC_KEY_HEADER] == HEX_PUBLIC_KEY
+    assert SIGNATURE_HEADER not in response.headers
+
+@patch.object(middleware, "private_key", None)
+def test_passes_through_without_a_key():
+    response = _client().get("/stream", headers={CHALLENGE_HEADER: "client-challenge"})
+
+    assert response.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+    assert PUBLIC_KEY_HEADER not in response.headers
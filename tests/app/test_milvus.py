@@ -0,0 +1,87 @@
+from langchain_core.documents import Document
+from unittest.mock import MagicMock
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.milvus import MilvusWrapper, EMBEDDING_METADATA_KEY, DOC_TYPE_PDF
+
+class FakeEmbeddings:
+    """Two-dimensional vectors, counting the texts it embeds."""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+def _wrapper(vectors: dict) -> MilvusWrapper:
+    # Without __init__, which loads the model and connects to Milvus
+    wrapper = MilvusWrapper.__new__(MilvusWrapper)
+    wrapper.embeddings = FakeEmbeddings(vectors)
+    wrapper.milvus_collection = MagicMock(_primary_field="pk", _vector_field="vector", collection_name="chunks")
+    return wrapper
+
+def test_ranking_orders_by_similarity_and_only_embeds_missing_vectors():
+    wrapper = _wrapper({"query": [1.0, 0.0], "close": [0.9, 0.1]})
+    documents = [
+        Document(page_content="far", metadata={EMBEDDING_METADATA_KEY: [0.0, 1.0]}),
+        Document(page_content="close"),
+        Document(page_content="closest", metadata={EMBEDDING_METADATA_KEY: [2.0, 0.0]}),
+    ]
+
+    ranked = wrapper.rank_documents("query", documents, k=2)
+
+    assert [doc.page_content for doc in ranked] == ["closest", "close"]
+    assert wrapper.embeddings.embedded == ["close"]
+
+def test_ingestion_reuses_vectors_and_stores_the_metadata():
+    wrapper = _wrapper({"new page": [0.5, 0.5]})
+    documents = [
+        Document(page_content="old page", metadata={"source": "report.pdf", EMBEDDING_METADATA_KEY: [1.0, 0.0]}),
+        Document(page_content="new page", metadata={"source": None}),
+    ]
+
+    wrapper.from_documents_for_user("user-collection", documents, DOC_TYPE_PDF)
+
+    kwargs = wrapper.milvus_collection.add_embeddings.call_args.kwargs
+    assert wrapper.embeddings.embedded == ["new page"]
+    assert kwargs["texts"] == ["old page", "new page"]
+    assert kwargs["embeddings"] == [[1.0, 0.0], [0.5, 0.5]]
+    assert [{key: value for key, value in metadata.items() if key != "ingested_at"} for metadata in kwargs["metadatas"]] == [
+        {"user_id": "user-collection", "doc_type": DOC_TYPE_PDF, "source": "report.pdf"},
+        {"user_id": "user-collection", "doc_type": DOC_TYPE_PDF, "source": ""},
+    ]
+    assert all(isinstance(metadata["ingested_at"], int) for metadata in kwargs["metadatas"])
+
+def test_stored_hits_are_ranked_with_their_stored_vectors():
+    wrapper = _wrapper({"query": [1.0, 0.0]})
+    wrapper.milvus_collection.similarity_search.return_value = [
+        Document(page_content="stored a", metadata={"pk": 1, "source": "https://a.example"}),
+        Document(page_content="stored b", metadata={"pk": 2, "source": "https://b.example"}),
+    ]
+    wrapper.milvus_collection.client.query.return_value = [{"pk": 2, "vector": [1.0, 0.0]}, {"pk": 1, "vector": [0.0, 1.0]}]
+
+    hits = wrapper.similarity_search_for_user("user-collection", "query", k=2, with_vectors=True)
+    ranked = wrapper.rank_documents("query", hits)
+
+    assert [doc.metadata[EMBEDDING_METADATA_KEY] for doc in hits] == [[0.0, 1.0], [1.0, 0.0]]
+    assert [doc.page_content for doc in ranked] == ["stored b", "stored a"]
+    assert wrapper.embeddings.embedded == []
+    assert wrapper.milvus_collection.client.query.call_args.kwargs["filter"] == "pk in [1, 2]"
+
+def test_search_without_vectors_makes_one_call():
+    wrapper = _wrapper({})
+    wrapper.milvus_collection.similarity_search.return_value = [Document(page_content="stored", metadata={"pk": 1})]
+
+    hits = wrapper.similarity_search_for_user("user-collection", "query", doc_type="web", max_age_seconds=60)
+
+    assert EMBEDDING_METADATA_KEY not in hits[0].metadata
+    wrapper.milvus_collection.client.query.assert_not_called()
+    assert 'user_id == "user-collection" and doc_type == "web" and ingested_at >= ' in wrapper.milvus_collection.similarity_search.call_args.kwargs["expr"]
@@ -0,0 +1,76 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.config import get_settings
+from app.api.helper import request_llm as request_llm_module
+from app.api.helper.prompt_layout import add_context, current_date, PROMPT_LAYOUT_INTERLEAVED, PROMPT_LAYOUT_PREFIX_CACHE
+
+CONTEXT = {"role": "system", "content": "Search results: ..."}
+
+def _turn(n: int) -> list:
+    messages = [{"role": "user", "content": [{"type": "text", "text": "First question"}]}]
+    for i in range(1, n):
+        messages += [
+            {"role": "assistant", "content": [{"type": "text", "text": f"Answer {i}"}]},
+            {"role": "user", "content": [{"type": "text", "text": f"Question {i + 1}"}]},
+        ]
+    return messages
+
+def _prefix_shared(previous: list, current: list) -> bool:
+    """Whether the serialized `previous` prompt, up to its last user text, starts `current`."""
+    last_question = next(message for message in reversed(previous) if message["role"] == "user")
+    cut = json.dumps(previous).index(json.dumps(last_question["content"][0]["text"]))
+    return json.dumps(current)[:cut] == json.dumps(previous)[:cut]
+
+def test_interleaved_layout_is_the_default():
+    assert get_settings().PROMPT_LAYOUT == PROMPT_LAYOUT_INTERLEAVED
+
+@pytest.mark.parametrize("layout, roles", [
+    (PROMPT_LAYOUT_INTERLEAVED, ["user", "assistant", "system", "system", "user"]),
+    (PROMPT_LAYOUT_PREFIX_CACHE, ["user", "assistant", "user", "system", "system"]),
+])
+def test_context_keeps_the_system_role(layout, roles):
+    messages = _turn(2)
+    other = {"role": "system", "content": [{"type": "text", "text": "Documents: ..."}]}
+
+    with patch.object(get_settings(), "PROMPT_LAYOUT", layout):
+        augmented = add_context(messages, [CONTEXT, None, other])
+
+    assert [message["role"] for message in augmented] == roles
+    assert [message for message in augmented if message["role"] == "system"] == [CONTEXT, other]
+    assert [message for message in augmented if message["role"] != "system"] == messages
+
+def test_prefix_cache_layout_shares_the_prompt_up_to_the_last_question():
+    with patch.object(get_settings(), "PROMPT_LAYOUT", PROMPT_LAYOUT_PREFIX_CACHE):
+        turn_2 = add_context(_turn(2), [CONTEXT])
+        turn_3 = add_context(_turn(3), [{"role": "system", "content": "Other results"}])
+
+    assert turn_2 == _turn(2) + [CONTEXT]
+    assert _prefix_shared(turn_2, turn_3)
+
+def test_interleaved_layout_inserts_context_before_the_last_message():
+    turn_2 = add_context(_turn(2), [CONTEXT])
+    turn_3 = add_context(_turn(3), [CONTEXT])
+
+    assert turn_2 == _turn(2)[:-1] + [CONTEXT] + _turn(2)[-1:]
+    assert not _prefix_shared(turn_2, turn_3)
+
+def test_date_precision_follows_the_setting():
+    with patch.object(get_settings(), "SYSTEM_PROMPT_DATE_FORMAT", "%Y-%m"):
+        assert len(current_date()) == len("2025-01")
+
+@pytest.mark.asyncio
+async def test_system_prompt_is_byte_stable_between_requests():
+    body = json.dumps({"model": "test-model", "messages": _turn(1)})
+
+    with patch.object(request_llm_module, "get_system_prompt", return_value="Today is {current_date}."):
+        first = await request_llm_module._add_system_prompt(body, is_api_key=False)
+        second = await request_llm_module._add_system_prompt(body, is_api_key=False)
+
+    assert first == second
+    assert json.loads(first)["messages"][0] == {"role": "system", "content": f"Today is {current_date()}."}
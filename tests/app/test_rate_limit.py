@@ -0,0 +1,93 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.main import app
+from app.api.helper import rate_limit as rate_limit_module
+from app.api.helper.auth import AuthInfo
+from app.api.helper.rate_limit import (
+    MemoryRateLimitStore,
+    RateLimit,
+    RateLimiter,
+    SqliteRateLimitStore,
+    RATE_LIMIT_ADDRESS,
+    RATE_LIMIT_CHAT,
+    RATE_LIMIT_EXPENSIVE,
+)
+
+def test_parse_limits():
+    assert RateLimit.parse("10/minute") == RateLimit(capacity=10, refill_per_second=10 / 60)
+    assert RateLimit.parse("100 per hour") == RateLimit(capacity=100, refill_per_second=100 / 3600)
+    with pytest.raises(ValueError):
+        RateLimit.parse("10 a minute")
+
+def test_bucket_allows_a_burst_then_refills():
+    store = MemoryRateLimitStore()
+    limit = RateLimit.parse("3/minute")
+
+    assert [store.take("user", limit, now=0) for _ in range(3)] == [0, 0, 0]
+    assert store.take("user", limit, now=0) == pytest.approx(20)
+    # One token is back after 20 seconds
+    assert store.take("user", limit, now=20) == 0
+    assert store.take("other-user", limit, now=20) == 0
+
+def test_workers_share_sqlite_buckets(tmp_path):
+    path = str(tmp_path / "rate-limits.sqlite")
+    worker_a, worker_b = SqliteRateLimitStore(path), SqliteRateLimitStore(path)
+    limit = RateLimit.parse("2/minute")
+
+    assert worker_a.take("user", limit, now=0) == 0
+    assert worker_b.take("user", limit, now=0) == 0
+    assert worker_a.take("user", limit, now=0) > 0
+    assert worker_b.take("user", limit, now=30) == 0
+
+def test_expensive_and_chat_limits_are_separate():
+    limiter = RateLimiter(
+        MemoryRateLimitStore(),
+        {RATE_LIMIT_CHAT: RateLimit.parse("5/minute"), RATE_LIMIT_EXPENSIVE: RateLimit.parse("1/minute")},
+    )
+    auth_info = AuthInfo(user_id="user")
+
+    limiter.check(auth_info, RATE_LIMIT_EXPENSIVE)
+    with pytest.raises(HTTPException) as exc_info:
+        limiter.check(auth_info, RATE_LIMIT_EXPENSIVE)
+    limiter.check(auth_info, RATE_LIMIT_CHAT)
+    limiter.check(AuthInfo(user_id="api_key_abcdefgh", is_api_key=True), RATE_LIMIT_EXPENSIVE)
+
+    assert exc_info.value.status_code == 429
+    assert 1 <= int(exc_info.value.headers["Retry-After"]) <= 60
+
+def test_api_keys_sharing_a_prefix_have_their_own_buckets():
+    limiter = RateLimiter(MemoryRateLimitStore(), {RATE_LIMIT_EXPENSIVE: RateLimit.parse("1/minute")})
+
+    limiter.check(AuthInfo(user_id="api_key_abcdefgh", is_api_key=True, api_key_hash="1" * 64), RATE_LIMIT_EXPENSIVE)
+    limiter.check(AuthInfo(user_id="api_key_abcdefgh", is_api_key=True, api_key_hash="2" * 64), RATE_LIMIT_EXPENSIVE)
+    with pytest.raises(HTTPException):
+        limiter.check(AuthInfo(user_id="api_key_abcdefgh", is_api_key=True, api_key_hash="1" * 64), RATE_LIMIT_EXPENSIVE)
+
+def test_requests_with_invalid_tokens_are_limited_per_address():
+    limiter = RateLimiter(
+        MemoryRateLimitStore(),
+        {
+            RATE_LIMIT_CHAT: RateLimit.parse("60/minute"),
+            RATE_LIMIT_EXPENSIVE: RateLimit.parse("10/minute"),
+            RATE_LIMIT_ADDRESS: RateLimit.parse("2/minute"),
+        },
+    )
+    client = TestClient(app)
+
+    def post(address: str) -> int:
+        headers = {"Authorization": "Bearer not-a-token", "X-Real-IP": address}
+        return client.post("/v1/summary", json={"messages": []}, headers=headers).status_code
+
+    with patch.object(rate_limit_module, "get_rate_limiter", return_value=limiter):
+        statuses = [post("203.0.113.7") for _ in range(3)]
+        other_address = post("203.0.113.8")
+
+    assert statuses == [401, 401, 429]
+    assert other_address == 401
@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper import request_summary
+from app.api.helper.request_summary import ProgressiveSummarizer
+from app.api.helper.summary_cache import SummaryCache
+from app.rag.tokenizer import TokenCounter
+
+# Heuristic counter, so the tests don't depend on downloading tokenizer files
+HEURISTIC_COUNTER = TokenCounter("test-model")
+
+@pytest.fixture(autouse=True)
+def summary_cache():
+    """A fresh summary cache per test, without fetching the summary prompt."""
+    cache = SummaryCache(max_chars=1_000_000, ttl_seconds=60)
+    with patch.object(request_summary, "get_summary_cache", return_value=cache), \
+         patch.object(request_summary, "summary_prompt_version", new_callable=AsyncMock, return_value="test"):
+        yield cache
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary._summarize_single_chunk', new_callable=AsyncMock)
+async def test_progressive_summarizer_starts_chunks_before_finish(mock_summarize: AsyncMock, _):
+    mock_summarize.side_effect = lambda text, words, run=None: f"summary of {len(text)} chars"
+
+    with patch.object(request_summary, "MAX_TEXT_TOKENS_FOR_LLM", 300):
+        summarizer = ProgressiveSummarizer(100)
+        for n in range(5):
+            await summarizer.add_text(f"page {n} " + "word " * 100, progress=(n + 1) / 10)
+
+        # Full chunks are summarized while more text is still expected
+        await asyncio.sleep(0)
+        assert mock_summarize.await_count >= 1
+        started = mock_summarize.await_count
+
+        summary = await summarizer.finish()
+
+    assert mock_summarize.await_count > started
+    assert summary.startswith("summary of")
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary._summarize_single_chunk', new_callable=AsyncMock)
+async def test_progressive_summarizer_small_input_uses_single_call(mock_summarize: AsyncMock, _):
+    mock_summarize.return_value = "short summary"
+
+    summarizer = ProgressiveSummarizer(50)
+    await summarizer.add_text("a short page " * 40, progress=0.5)
+    await summarizer.add_text("another short page " * 40, progress=1.0)
+    summary = await summarizer.finish()
+
+    mock_summarize.assert_awaited_once()
+    assert mock_summarize.await_args.args[1] == 50
+    assert summary == "short summary"
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary._summarize_single_chunk', new_callable=AsyncMock)
+async def test_text_within_target_skips_the_llm(mock_summarize: AsyncMock, _):
+    summary = await request_summary.call_summarization_llm("  A short note about the meeting.  ", 500, extractive_fast_path=True)
+
+    mock_summarize.assert_not_awaited()
+    assert summary == "A short note about the meeting."
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary._summarize_single_chunk', new_callable=AsyncMock)
+async def test_short_text_is_summarized_by_the_llm_by_default(mock_summarize: AsyncMock, _):
+    mock_summarize.return_value = "The meeting is on Monday."
+
+    summary = await request_summary.call_summarization_llm("A short note about the meeting on Monday.", 500)
+
+    mock_summarize.assert_awaited_once()
+    assert summary == "The meeting is on Monday."
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary._summarize_single_chunk', new_callable=AsyncMock)
+async def test_text_slightly_over_target_is_shortened_extractively(mock_summarize: AsyncMock, _):
+    sentences = [f"Sentence number {n} talks about revenue growth and hiring plans." for n in range(12)]
+    text = " ".join(sentences)
+
+    summary = await request_summary.call_summarization_llm(text, 90, extractive_fast_path=True)
+
+    mock_summarize.assert_not_awaited()
+    assert 0 < len(summary.split()) <= 90
+    kept = [s for s in sentences if s in summary]
+    assert kept == sorted(kept, key=sentences.index)
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+async def test_reduce_summarizes_in_levels_until_it_fits(_):
+    calls = []
+
+    async def fake_summarize(text, words, run=None):
+        calls.append(words)
+        run.llm_calls += 1
+        return "word " * words
+
+    run = request_summary._SummaryRun()
+    with patch.object(request_summary, "_summarize_single_chunk", side_effect=fake_summarize):
+        summary = await request_summary._reduce_chunk_summaries(["word " * 100] * 10, 100, run)
+
+    # 10 summaries -> 3 groups of at most 4 -> 1 final group
+    assert calls == [50, 50, 50, 100]
+    assert run.reduce_levels == 2
+    assert len(summary.split()) == 100
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary.generate_request_prompt', new_callable=AsyncMock)
+async def test_identical_summaries_share_one_llm_call(mock_prompt: AsyncMock, _):
+    mock_prompt.side_effect = lambda text, words: f"summarize in {words} words: {text}"
+    calls = []
+
+    async def fake_generate(prompt, words, run):
+        calls.append(prompt)
+        run.llm_calls += 1
+        await asyncio.sleep(0.01)
+        return "the summary"
+
+    text = ("a long report about the meeting " * 100).strip()
+    with patch.object(request_summary, "_generate_summary", side_effect=fake_generate):
+        # Concurrent identical calls wait for the one in flight
+        first, second = await asyncio.gather(
+            request_summary.call_summarization_llm(text, 50),
+            request_summary.call_summarization_llm(text, 50, user_id="other"),
+        )
+        # Later ones are served from the cache, at both levels
+        third = await request_summary.call_summarization_llm(text, 50)
+        chunk = await request_summary._summarize_single_chunk(text, 50)
+        # A different target length is a different summary
+        await request_summary.call_summarization_llm(text, 60)
+
+    assert first == second == third == chunk == "the summary"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+@patch('app.api.helper.request_summary.get_token_counter', return_value=HEURISTIC_COUNTER)
+@patch('app.api.helper.request_summary.generate_request_prompt', new_callable=AsyncMock, return_value="prompt")
+async def test_failed_summaries_are_not_cached(_, __):
+    with patch.object(request_summary, "_generate_summary", side_effect=RuntimeError("backend down")):
+        failed = await request_summary.call_summarization_llm("a long report " * 200, 50)
+    with patch.object(request_summary, "_generate_summary", new_callable=AsyncMock, return_value="the summary"):
+        summary = await request_summary.call_summarization_llm("a long report " * 200, 50)
+
+    assert failed.startswith("[Error")
+    assert summary == "the summary"
@@ -0,0 +1,222 @@
+import re
+import sqlite3
+import threading
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment, create_test_token
+
+setup_test_environment()
+
+from app.main import app
+from app.config import get_settings
+from app.api.helper import request_llm as request_llm_module
+from app.api.helper.auth import AuthInfo
+from app.api.helper.resumable import MemoryReplayStore, ResumableStreams, SqliteReplayStore
+from app.api.helper.upstream import UpstreamPool
+from app.api.v1 import openai as openai_module
+from app.api.v1.openai import chat_completions, respond_from_llm
+from app.api.v1.schemas import LLMRequest
+from tests.mock.mock_vllm_server import MockVllmServer, orphaned_generations, stream_until
+
+REQUEST_BODY = '{"model": "mock-model", "messages": [{"role": "user", "content": "Hi"}], "stream": true}'
+# The mock streams its answer 30 times over, in 90 events
+REPEAT = 30
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryReplayStore(max_chars=100, ttl_seconds=60)
+    return SqliteReplayStore(str(tmp_path / "streams.sqlite"), max_chars=100, ttl_seconds=60)
+
+def test_store_replays_events_after_the_last_one_seen(store):
+    store.create("stream", "user", now=0)
+    store.append("stream", [(1, "a" * 10), (2, "b" * 10)], now=1)
+    store.append("stream", [(3, "c" * 10)], now=2)
+
+    page = store.read("stream", "user", after_seq=1, now=3)
+    assert page.events == [(2, "b" * 10), (3, "c" * 10)]
+    assert not page.finished
+
+    store.finish("stream", now=4)
+    assert store.read("stream", "user", after_seq=3, now=5).finished
+    assert store.read("stream", "other-user", after_seq=0, now=5) is None
+    assert store.read("unknown", "user", after_seq=0, now=5) is None
+
+def test_store_is_bounded_and_cannot_resume_past_dropped_events(store):
+    store.create("stream", "user", now=0)
+    store.append("stream", [(seq, "x" * 30) for seq in range(1, 6)], now=1)
+
+    # 150 characters of events in a buffer of 100: the first two are gone
+    assert store.read("stream", "user", after_seq=0, now=2) is None
+    assert [seq for seq, _ in store.read("stream", "user", after_seq=2, now=2).events] == [3, 4, 5]
+
+def test_store_forgets_expired_streams(store):
+    store.create("old", "user", now=0)
+    store.finish("old", now=1)
+    store.create("new", "user", now=100)
+
+    assert store.read("old", "user", after_seq=0, now=100) is None
+    assert store.read("new", "user", after_seq=0, now=100) is not None
+
+def test_workers_share_sqlite_replay_buffers(tmp_path):
+    path = str(tmp_path / "streams.sqlite")
+    worker_a = SqliteReplayStore(path, max_chars=1000, ttl_seconds=60)
+    worker_b = SqliteReplayStore(path, max_chars=1000, ttl_seconds=60)
+
+    worker_a.create("stream", "user", now=0)
+    worker_a.append("stream", [(1, "data: a\n\n")], now=1)
+
+    assert worker_b.read("stream", "user", after_seq=0, now=2).events == [(1, "data: a\n\n")]
+    assert worker_a.heartbeat("stream", now=3) == 2
+
+@pytest.fixture
+def replica():
+    server = MockVllmServer(stream_repeat=REPEAT, chunk_delay=0.01).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def pool(replica):
+    pool = UpstreamPool("test", [replica.chat_url])
+
+    async def passthrough(request_body, *args):
+        return request_body
+
+    with patch.object(request_llm_module, "get_upstream_pool", return_value=pool), \
+         patch.object(request_llm_module, "_add_system_prompt", side_effect=passthrough):
+        yield pool
+
+def _last_event_id(body: bytes) -> str:
+    return re.findall(rb"^id: (\S+)$", body, re.MULTILINE)[-1].decode()
+
+def _answers(body: bytes) -> int:
+    return body.count(b'"content": "Hello"')
+
+async def _start(streams: ResumableStreams):
+    response = await respond_from_llm(REQUEST_BODY, should_stream=True, user_id="user-1", use_vector_db=False)
+    return await streams.start(response, "user-1")
+
+@pytest.mark.asyncio
+async def test_reconnect_reattaches_to_the_running_generation(replica, pool):
+    streams = ResumableStreams(MemoryReplayStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=5)
+
+    first = await stream_until(await _start(streams), lambda body: _answers(body) >= 3)
+    resumed = await stream_until(await streams.resume(_last_event_id(first), "user-1"), lambda body: False)
+
+    # Every event arrives once, over the two connections, from one generation
+    assert _answers(first) + _answers(resumed) == REPEAT
+    assert resumed.endswith(b"data: [DONE]\n\n")
+    assert replica.app.state.generations == {"started": 1, "completed": 1, "aborted": 0}
+    assert pool.endpoints[0].outstanding == 0
+
+@pytest.mark.asyncio
+async def test_reconnect_after_the_end_replays_from_the_buffer(replica, pool):
+    streams = ResumableStreams(MemoryReplayStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=5)
+
+    first = await stream_until(await _start(streams), lambda body: False)
+    stream_id = _last_event_id(first).rsplit(":", 1)[0]
+    resumed = await stream_until(await streams.resume(f"{stream_id}:10", "user-1"), lambda body: False)
+
+    assert _answers(first) == REPEAT
+    assert resumed == first[first.index(f"id: {stream_id}:11\n".encode()):]
+    assert replica.app.state.generations["started"] == 1
+
+@pytest.mark.asyncio
+async def test_generation_without_a_reader_is_aborted_after_the_grace_period(replica, pool):
+    streams = ResumableStreams(MemoryReplayStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=0)
+
+    await stream_until(await _start(streams), lambda body: _answers(body) >= 1)
+
+    assert await orphaned_generations(replica) == 0
+    assert replica.app.state.generations["aborted"] == 1
+
+@pytest.mark.asyncio
+async def test_streams_of_other_users_cannot_be_resumed(replica, pool):
+    streams = ResumableStreams(MemoryReplayStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=5)
+    first = await stream_until(await _start(streams), lambda body: False)
+
+    with pytest.raises(HTTPException) as gone:
+        await streams.resume(_last_event_id(first), "user-2")
+    with pytest.raises(HTTPException) as invalid:
+        await streams.resume("not-an-event-id", "user-1")
+
+    assert gone.value.status_code == 410
+    assert invalid.value.status_code == 400
+
+class _BlockingStore(MemoryReplayStore):
+    """Holds every write until released, like a store locked by another worker."""
+
+    def __init__(self):
+        super().__init__(max_chars=1_000_000, ttl_seconds=60)
+        self.released = threading.Event()
+
+    def append(self, stream_id, events, now):
+        self.released.wait(timeout=5)
+        return super().append(stream_id, events, now)
+
+class _BrokenStore(MemoryReplayStore):
+    def append(self, stream_id, events, now):
+        raise sqlite3.OperationalError("database is locked")
+
+@pytest.mark.asyncio
+async def test_live_client_does_not_wait_for_the_store(replica, pool):
+    store = _BlockingStore()
+    streams = ResumableStreams(store, detached_grace_seconds=5)
+
+    body = await stream_until(await _start(streams), lambda body: False)
+    stream_id = _last_event_id(body).rsplit(":", 1)[0]
+
+    assert _answers(body) == REPEAT
+    assert body.endswith(b"data: [DONE]\n\n")
+    assert store.read(stream_id, "user-1", after_seq=0, now=0).events == []
+
+    store.released.set()
+    await streams._running[stream_id].task
+    assert b"".join(data.encode() for _, data in store.read(stream_id, "user-1", after_seq=0, now=0).events) == body
+
+@pytest.mark.asyncio
+async def test_broken_store_does_not_cut_the_answer_off(replica, pool):
+    streams = ResumableStreams(_BrokenStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=5)
+
+    body = await stream_until(await _start(streams), lambda body: False)
+
+    assert _answers(body) == REPEAT
+    assert body.endswith(b"data: [DONE]\n\n")
+    assert pool.endpoints[0].outstanding == 0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("enabled, generations", [
+    (False, {"started": 1, "completed": 0, "aborted": 1}),
+    (True, {"started": 1, "completed": 1, "aborted": 0}),
+])
+async def test_disconnect_aborts_the_generation_unless_it_can_be_resumed(replica, pool, enabled, generations):
+    payload = LLMRequest(model="mock-model", messages=[{"role": "user", "content": "Hi"}], stream=True)
+
+    async def stream_vllm_response(payload, auth_info):
+        return await respond_from_llm(REQUEST_BODY, should_stream=True, user_id=auth_info.user_id, use_vector_db=False)
+
+    streams = ResumableStreams(MemoryReplayStore(max_chars=1_000_000, ttl_seconds=60), detached_grace_seconds=5)
+    with patch.object(get_settings(), "RESUMABLE_STREAMS_ENABLED", enabled), \
+         patch.object(openai_module, "get_resumable_streams", return_value=streams), \
+         patch.object(openai_module, "stream_vllm_response", side_effect=stream_vllm_response):
+        response = await chat_completions(payload, BackgroundTasks(), auth_info=AuthInfo(user_id="user-1"), last_event_id=None)
+        await stream_until(response, lambda body: _answers(body) >= 1)
+
+    # Resumable, the generation runs on for a reconnect within the grace period
+    assert await orphaned_generations(replica) == 0
+    assert replica.app.state.generations == generations
+
+def test_unknown_stream_is_gone():
+    client = TestClient(app)
+
+    with patch.object(get_settings(), "RESUMABLE_STREAMS_ENABLED", True):
+        response = client.post(
+            "/v1/chat/completions",
+            content=REQUEST_BODY,
+            headers={"Authorization": f"Bearer {create_test_token()}", "Last-Event-ID": "unknown-stream:3"},
+        )
+
+    assert response.status_code == 410
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper.summarization_scheduler import (
+    SummarizationScheduler,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BULK,
+)
+
+async def _hold(scheduler: SummarizationScheduler, user_id: str, priority: int, order: list, release: asyncio.Event):
+    async with scheduler.slot(user_id, priority):
+        order.append(user_id)
+        await release.wait()
+
+async def _run_queued(scheduler: SummarizationScheduler, requests: list) -> list:
+    """Fill the only slot, queue `requests`, then let them run one at a time."""
+    order = []
+    blocker_release = asyncio.Event()
+    blocker = asyncio.create_task(_hold(scheduler, "blocker", PRIORITY_BULK, [], blocker_release))
+    await asyncio.sleep(0)
+
+    release = asyncio.Event()
+    release.set()
+    tasks = []
+    for user_id, priority in requests:
+        tasks.append(asyncio.create_task(_hold(scheduler, user_id, priority, order, release)))
+        await asyncio.sleep(0)
+
+    blocker_release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+@pytest.mark.asyncio
+async def test_caps_concurrent_calls():
+    scheduler = SummarizationScheduler(max_concurrency=2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with scheduler.slot("user"):
+            peak = max(peak, scheduler.running)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[call() for _ in range(10)])
+
+    assert peak == 2
+    assert scheduler.running == 0
+    assert scheduler.queued == 0
+
+@pytest.mark.asyncio
+async def test_interactive_calls_go_first():
+    scheduler = SummarizationScheduler(max_concurrency=1)
+
+    order = await _run_queued(scheduler, [("a", PRIORITY_BULK), ("b", PRIORITY_BULK), ("c", PRIORITY_INTERACTIVE)])
+
+    assert order == ["c", "a", "b"]
+
+@pytest.mark.asyncio
+async def test_users_take_turns():
+    scheduler = SummarizationScheduler(max_concurrency=1)
+
+    order = await _run_queued(scheduler, [("big", PRIORITY_BULK)] * 3 + [("small", PRIORITY_BULK)])
+
+    assert order == ["big", "small", "big", "big"]
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = SummarizationScheduler(max_concurrency=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, "a", PRIORITY_BULK, [], release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(scheduler, "b", PRIORITY_BULK, [], release))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    release.set()
+    await holder
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert scheduler.running == 0
+    assert scheduler.queued == 0
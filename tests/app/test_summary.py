@@ -1,5 +1,6 @@
 import pytest
 import json
+from contextlib import contextmanager
 from unittest.mock import AsyncMock, patch
 from fastapi.testclient import TestClient
 
@@ -9,6 +10,9 @@ from app.api.v1.schemas import LLMRequest, ChatMessage, TextContent
 setup_test_environment()
 
 from app.main import app
+from app.api.helper import request_summary
+from app.api.helper.summary_cache import SummaryCache
+from app.rag.tokenizer import TokenCounter
 
 client = TestClient(app)
 
@@ -71,3 +75,146 @@ async def test_summarize_messages_success(mock_request_llm_for_summary: AsyncMoc
     assert "This is the first long message to summarize." in llm_call_body_json["messages"][1]["content"]
     assert "Another long message from the user" in llm_call_body_json["messages"][1]["content"]
     assert response_data["summary"] == mocked_summary_text
+
+def _conversation(n: int) -> list:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message number {i} about the project timeline."}
+        for i in range(n)
+    ]
+
+@pytest.mark.asyncio
+@patch('app.api.v1.summary.call_summarization_llm', new_callable=AsyncMock)
+async def test_summary_folds_in_only_new_messages(mock_summarize: AsyncMock):
+    mock_summarize.return_value = "Updated summary."
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+
+    response = client.post(
+        "/v1/summary",
+        json={
+            "messages": _conversation(6),
+            "previous_summary": "Earlier summary.",
+            "summarized_message_count": 4,
+        },
+        headers=auth_header,
+    )
+
+    assert response.status_code == 200, response.content.decode()
+    assert response.json() == {"summary": "Updated summary.", "message_count": 6}
+    summarized_text = mock_summarize.await_args.args[0]
+    assert "Earlier summary." in summarized_text
+    assert "Message number 3" not in summarized_text
+    assert "Message number 4" in summarized_text and "Message number 5" in summarized_text
+
+@pytest.mark.asyncio
+@patch('app.api.v1.summary.call_summarization_llm', new_callable=AsyncMock)
+async def test_summary_reuses_cached_prefix(mock_summarize: AsyncMock):
+    mock_summarize.side_effect = ["First summary.", "Second summary."]
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+    conversation = _conversation(9)
+
+    first = client.post("/v1/summary", json={"messages": conversation[:7], "max_tokens": 321}, headers=auth_header)
+    second = client.post("/v1/summary", json={"messages": conversation, "max_tokens": 321}, headers=auth_header)
+
+    assert first.json()["summary"] == "First summary."
+    assert second.json() == {"summary": "Second summary.", "message_count": 9}
+    summarized_text = mock_summarize.await_args.args[0]
+    assert "First summary." in summarized_text
+    assert "Message number 6" not in summarized_text
+    assert "Message number 8" in summarized_text
+
+@contextmanager
+def _summarizing_llm(summary: str):
+    """Stands in for the summarization LLM, with a fresh summary cache, and yields the prompts it gets."""
+    prompts = []
+
+    async def generate(prompt, words, run):
+        prompts.append(prompt)
+        return summary
+
+    with patch.object(request_summary, "get_token_counter", return_value=TokenCounter("test-model")), \
+         patch.object(request_summary, "get_summary_cache", return_value=SummaryCache(max_chars=1_000_000, ttl_seconds=60)), \
+         patch.object(request_summary, "summary_prompt_version", new_callable=AsyncMock, return_value="test"), \
+         patch.object(request_summary, "generate_request_prompt", new_callable=AsyncMock, side_effect=lambda text, words: f"Summarize: {text}"), \
+         patch.object(request_summary, "_generate_summary", side_effect=generate):
+        yield prompts
+
+def test_short_conversation_is_summarized_by_the_llm():
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+
+    with _summarizing_llm("They are planning the timeline.") as prompts:
+        response = client.post("/v1/summary", json={"messages": _conversation(2), "max_tokens": 997}, headers=auth_header)
+
+    assert response.status_code == 200, response.content.decode()
+    assert response.json()["summary"] == "They are planning the timeline."
+    assert len(prompts) == 1 and "Message number 1" in prompts[0]
+
+def test_incremental_summary_is_written_by_the_llm():
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+
+    with _summarizing_llm("Updated summary of the timeline.") as prompts:
+        response = client.post(
+            "/v1/summary",
+            json={
+                "messages": _conversation(4),
+                "previous_summary": "Earlier summary.",
+                "summarized_message_count": 2,
+                "max_tokens": 998,
+            },
+            headers=auth_header,
+        )
+
+    summary = response.json()["summary"]
+    assert summary == "Updated summary of the timeline."
+    assert "Summary of the conversation so far" not in summary and "New messages" not in summary
+    assert "Earlier summary." in prompts[0] and "Message number 3" in prompts[0]
+
+def test_summary_rejects_offset_past_the_conversation():
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+
+    response = client.post(
+        "/v1/summary",
+        json={"messages": _conversation(2), "previous_summary": "Earlier summary.", "summarized_message_count": 5},
+        headers=auth_header,
+    )
+
+    assert response.status_code == 400
+
+def _sse_events(body: str) -> list:
+    return [
+        line[len("data: "):]
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+
+def test_summary_stream_reports_map_and_reduce_progress():
+    auth_header = {"Authorization": f"Bearer {create_test_token()}"}
+    messages = [
+        {"role": "user", "content": f"Part {i} of the design review. " + "detail " * 100}
+        for i in range(6)
+    ]
+
+    # Every call answers with 50 words: six chunk summaries run over the
+    # target and are combined in two groups, which then fit
+    with _summarizing_llm("word " * 50) as prompts, \
+         patch.object(request_summary, "MAX_TEXT_TOKENS_FOR_LLM", 300):
+        response = client.post("/v1/summary/stream", json={"messages": messages, "max_tokens": 100}, headers=auth_header)
+
+    assert response.status_code == 200, response.content.decode()
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+    assert events[-1] == "[DONE]"
+    events = [json.loads(event) for event in events[:-1]]
+
+    progress = [event["data"] for event in events[1:-1]]
+    map_progress = [(p["done"], p["total"]) for p in progress if p["stage"] == "map"]
+    reduce_progress = [(p["level"], p["done"], p["total"]) for p in progress if p["stage"] == "reduce"]
+    chunks = map_progress[0][1]
+    assert chunks > 2 and len(prompts) > chunks
+    assert map_progress == [(done, chunks) for done in range(chunks + 1)]
+    assert reduce_progress == [(1, 0, 2), (1, 1, 2), (1, 2, 2)]
+    assert [p["stage"] for p in progress] == ["map"] * (chunks + 1) + ["reduce"] * 3
+
+    assert events[0]["type"] == "summary" and events[0]["data"] == {"messages": 6}
+    assert events[-1]["object"] == "summary"
+    assert events[-1]["summary"].split().count("word") == 100
+    assert events[-1]["message_count"] == 6
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper.summary_cache import SummaryCache, summary_cache_key
+
+def test_key_depends_on_everything_that_changes_the_summary():
+    base = summary_cache_key("final", "model", "v1", 500, "text")
+
+    assert base == summary_cache_key("final", "model", "v1", 500, "text")
+    assert base != summary_cache_key("chunk", "model", "v1", 500, "text")
+    assert base != summary_cache_key("final", "other-model", "v1", 500, "text")
+    assert base != summary_cache_key("final", "model", "v2", 500, "text")
+    assert base != summary_cache_key("final", "model", "v1", 400, "text")
+    assert base != summary_cache_key("final", "model", "v1", 500, "other text")
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_jobs_run_once():
+    cache = SummaryCache(max_chars=10_000, ttl_seconds=60)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "summary"
+
+    results = await asyncio.gather(*[cache.get_or_compute("key", compute) for _ in range(5)])
+    again = await cache.get_or_compute("key", compute)
+
+    assert results == ["summary"] * 5
+    assert again == "summary"
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_job_keeps_running_while_someone_waits_for_it():
+    cache = SummaryCache(max_chars=10_000, ttl_seconds=60)
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return "summary"
+
+    first = asyncio.create_task(cache.get_or_compute("key", compute))
+    second = asyncio.create_task(cache.get_or_compute("key", compute))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "summary"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+@pytest.mark.asyncio
+async def test_job_is_cancelled_when_nobody_waits_for_it():
+    cache = SummaryCache(max_chars=10_000, ttl_seconds=60)
+    cancelled = asyncio.Event()
+
+    async def compute():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(cache.get_or_compute("key", compute))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert cache.get("key") is None
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached():
+    cache = SummaryCache(max_chars=10_000, ttl_seconds=60)
+
+    async def fail():
+        raise RuntimeError("backend down")
+
+    async def succeed():
+        return "summary"
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute("key", fail)
+    assert await cache.get_or_compute("key", succeed) == "summary"
+
+def test_cache_is_bounded_by_summary_length():
+    cache = SummaryCache(max_chars=100, ttl_seconds=60)
+    for i in range(10):
+        cache.put(f"key-{i}", "x" * 30)
+
+    assert sum(cache.get(f"key-{i}") is not None for i in range(10)) == 3
+    cache.put("huge", "x" * 1000)
+    assert cache.get("huge") is None
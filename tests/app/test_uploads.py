@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper import uploads as uploads_module
+from app.api.helper.uploads import UploadStore
+
+PDF_BODY = b"%PDF-1.7\n" + b"x" * 200_000
+
+async def _chunks(data: bytes, size: int = 65536):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def test_save_stream_returns_content_hash(tmp_path):
+    import hashlib
+
+    store = UploadStore(root=str(tmp_path), ttl_seconds=60, max_bytes=1024 * 1024)
+    content_hash, size = asyncio.run(store.save_stream("user", _chunks(PDF_BODY)))
+
+    assert content_hash == hashlib.sha256(PDF_BODY).hexdigest()
+    assert size == len(PDF_BODY)
+    assert store.path_for("user", content_hash).read_bytes() == PDF_BODY
+
+def test_uploads_are_scoped_per_user(tmp_path):
+    store = UploadStore(root=str(tmp_path), ttl_seconds=60, max_bytes=1024 * 1024)
+    content_hash, _ = asyncio.run(store.save_stream("user", _chunks(PDF_BODY)))
+
+    assert store.path_for("other_user", content_hash) is None
+    assert store.path_for("user", "../../etc/passwd") is None
+
+def test_rejects_non_pdf_and_oversized_bodies(tmp_path):
+    store = UploadStore(root=str(tmp_path), ttl_seconds=60, max_bytes=100_000)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(store.save_stream("user", _chunks(b"hello world")))
+    assert exc_info.value.status_code == 415
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(store.save_stream("user", _chunks(PDF_BODY)))
+    assert exc_info.value.status_code == 413
+    assert not any(p.suffix == ".part" for p in tmp_path.rglob("*"))
+
+def test_disk_work_runs_off_the_event_loop(tmp_path):
+    store = UploadStore(root=str(tmp_path), ttl_seconds=60, max_bytes=4 * 1024 * 1024)
+    body = PDF_BODY * 10
+    threads = []
+
+    def record(original):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return original(*args)
+        return wrapper
+
+    with patch.object(uploads_module, "_write_batch", side_effect=record(uploads_module._write_batch)), \
+         patch.object(store, "_prune", side_effect=record(store._prune)):
+        content_hash, _ = asyncio.run(store.save_stream("user", _chunks(body)))
+
+    # Two writes for 2 MB in 1 MB batches, and the pruning before them
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+    assert store.path_for("user", content_hash).read_bytes() == body
@@ -0,0 +1,174 @@
+import json
+import time
+import pytest
+import httpx
+from unittest.mock import patch
+
+from tests.app.test_helpers import setup_test_environment
+
+setup_test_environment()
+
+from app.api.helper import request_llm as request_llm_module
+from app.api.helper.request_llm import arequest_llm
+from app.config import get_settings
+from app.api.helper.upstream import UpstreamPool, UpstreamEndpoint, SLOW_START_MIN_WEIGHT
+from tests.mock.mock_vllm_server import MockVllmServer, free_port
+
+REQUEST_BODY = '{"model": "mock-model", "messages": [{"role": "user", "content": "Hi"}], "stream": false}'
+
+@pytest.fixture(scope="module")
+def replicas():
+    servers = [MockVllmServer().start() for _ in range(3)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+@pytest.fixture(autouse=True)
+def no_system_prompt():
+    async def passthrough(request_body, is_api_key):
+        return request_body
+
+    with patch.object(request_llm_module, "_add_system_prompt", side_effect=passthrough):
+        yield
+
+def _dead_url() -> str:
+    return f"http://127.0.0.1:{free_port()}/v1/chat/completions"
+
+def _requests(pool: UpstreamPool) -> dict:
+    return {endpoint.url: endpoint.requests for endpoint in pool.endpoints}
+
+async def _send(pool: UpstreamPool, n: int, stream: bool = False) -> list:
+    """Sends the same request `n` times, balanced without affinity."""
+    responses = []
+    with patch.object(request_llm_module, "get_upstream_pool", return_value=pool), \
+         patch.object(get_settings(), "UPSTREAM_AFFINITY", "none"):
+        for _ in range(n):
+            body = REQUEST_BODY.replace('"stream": false', f'"stream": {str(stream).lower()}')
+            responses.append(await arequest_llm(body, stream=stream))
+    return responses
+
+@pytest.mark.asyncio
+async def test_requests_spread_over_healthy_replicas(replicas):
+    dead = _dead_url()
+    pool = UpstreamPool("test", [server.chat_url for server in replicas] + [dead])
+
+    async with httpx.AsyncClient() as client:
+        await pool.check_health(client)
+    responses = await _send(pool, 30)
+
+    assert all(response["choices"][0]["message"]["content"] for response in responses)
+    requests = _requests(pool)
+    assert requests[dead] == 0
+    assert all(requests[server.chat_url] > 0 for server in replicas)
+    assert all(endpoint.outstanding == 0 for endpoint in pool.endpoints)
+
+@pytest.mark.asyncio
+async def test_open_streams_count_as_outstanding(replicas):
+    pool = UpstreamPool("test", [server.chat_url for server in replicas[:2]])
+
+    streams = await _send(pool, 2, stream=True)
+
+    # One open stream on each replica, so the next request may go to either
+    assert sorted(endpoint.outstanding for endpoint in pool.endpoints) == [1, 1]
+    for stream in streams:
+        async for _ in stream.aiter_text():
+            pass
+    assert all(endpoint.outstanding == 0 for endpoint in pool.endpoints)
+
+@pytest.mark.asyncio
+async def test_failing_replica_is_ejected(replicas):
+    dead = _dead_url()
+    pool = UpstreamPool("test", [replicas[0].chat_url, dead], eject_after_failures=2, eject_seconds=60)
+
+    responses = await _send(pool, 20)
+
+    # The dead replica is only tried until it has failed twice in a row
+    assert _requests(pool)[dead] == 2
+    assert sum(isinstance(response, dict) for response in responses) == 18
+    assert not pool.endpoints[1].available(time.monotonic())
+
+def test_returning_replica_ramps_up():
+    now = time.monotonic()
+    endpoint = UpstreamEndpoint(url="http://replica/v1/chat/completions", joined_at=now)
+
+    assert endpoint.weight(now, slow_start_seconds=30) == SLOW_START_MIN_WEIGHT
+    assert endpoint.weight(now + 15, slow_start_seconds=30) == pytest.approx(0.5)
+    assert endpoint.weight(now + 60, slow_start_seconds=30) == 1.0
+
+def test_warm_replica_is_preferred_during_slow_start():
+    pool = UpstreamPool("test", ["http://warm/v1/chat/completions", "http://cold/v1/chat/completions"], slow_start_seconds=30)
+    pool.endpoints[1].joined_at = time.monotonic()
+
+    picked = [pool.pick().url for _ in range(5)]
+
+    # The cold replica gets a request only once the warm one has 10x its load
+    assert picked == ["http://warm/v1/chat/completions"] * 5
+
+def _turns(conversation: int, n_turns: int, stream: bool = False) -> list:
+    """The request bodies of a conversation growing turn by turn."""
+    messages = [{"role": "user", "content": f"Question {conversation}: " + "context " * 50}]
+    bodies = []
+    for turn in range(n_turns):
+        bodies.append(json.dumps({"model": "mock-model", "messages": messages, "stream": stream}))
+        messages = messages + [
+            {"role": "assistant", "content": "Hello! How can I help you today?"},
+            {"role": "user", "content": f"Follow-up {turn}"},
+        ]
+    return bodies
+
+@pytest.mark.asyncio
+async def test_conversation_turns_stay_on_one_replica(replicas):
+    pool = UpstreamPool("test", [server.chat_url for server in replicas])
+    usages = []
+    record_usage = pool.record_usage
+
+    def spy(endpoint, usage):
+        usages.append((endpoint.url, usage))
+        record_usage(endpoint, usage)
+
+    with patch.object(pool, "record_usage", side_effect=spy), \
+         patch.object(request_llm_module, "get_upstream_pool", return_value=pool):
+        for conversation in range(6):
+            for body in _turns(conversation, 3):
+                await arequest_llm(body, stream=False, user_id="user-1")
+
+    for conversation in range(6):
+        turns = usages[conversation * 3:(conversation + 1) * 3]
+        assert len({url for url, _ in turns}) == 1
+        # Every follow-up finds the earlier turns in the replica's prefix cache
+        assert all(usage["prompt_tokens_details"]["cached_tokens"] > 0 for _, usage in turns[1:])
+    assert len({url for url, _ in usages}) > 1
+    assert sum(endpoint.cached_tokens for endpoint in pool.endpoints) > 0
+
+@pytest.mark.asyncio
+async def test_stream_usage_is_recorded_and_not_passed_on(replicas):
+    pool = UpstreamPool("test", [replicas[0].chat_url])
+
+    with patch.object(request_llm_module, "get_upstream_pool", return_value=pool):
+        for body in _turns(100, 2, stream=True):
+            response = await arequest_llm(body, stream=True)
+            text = "".join([chunk async for chunk in response.aiter_text()])
+            await response.aclose()
+
+    assert '"usage"' not in text
+    assert "How can I help you today?" in text
+    assert text.endswith("data: [DONE]\n\n")
+    assert pool.endpoints[0].prompt_tokens > 0
+    assert 0 < pool.endpoints[0].cached_tokens < pool.endpoints[0].prompt_tokens
+    assert pool.endpoints[0].outstanding == 0
+
+def test_affinity_load_is_bounded():
+    urls = [f"http://replica-{i}/v1/chat/completions" for i in range(3)]
+    pool = UpstreamPool("test", urls, affinity_load_factor=1.25)
+
+    home = pool.pick("conversation")
+    pool.release(home)
+    assert pool.pick("conversation") is home
+    pool.release(home)
+
+    held = [pool.pick("conversation") for _ in range(6)]
+
+    # The home replica takes requests up to 1.25x the average, then spills over the ring
+    assert held[0] is home
+    assert max(endpoint.outstanding for endpoint in pool.endpoints) <= 3
+    assert len(set(map(id, held))) > 1
@@ -10,138 +10,183 @@ import time
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
-
-@app.get("/v1/models")
-async def models():
-    return JSONResponse(content={"data": [{"id": "mock-model", "created": 1718505600, "owned_by": "deepseek-ai", "object": "model"}]})
-
-@app.post("/v1/chat/completions")
-async def chat_completions(request: Request):
-    logger.info("Received chat completion request")
-    body = await request.json()
-    logger.info(f"Request body: {body}")
-
-    stream = body.get("stream", False)
-
-    mock_id = "chatcmpl-mock-123"
-    mock_model = body.get("model", "mock-model")
-    created_time = int(time.time())
-
-    messages_content_parts = ["Hello", "!", " How can I help you today?"]
+def prompt_usage(messages: list, cached_prefixes: set) -> dict:
+    """Prompt tokens (4 characters each) and those in the longest message prefix seen before."""
+    prompt_tokens = cached_tokens = 0
+    for i, message in enumerate(messages):
+        prompt_tokens += len(json.dumps(message)) // 4
+        prefix = json.dumps(messages[:i + 1], sort_keys=True)
+        if prefix in cached_prefixes:
+            cached_tokens = prompt_tokens
+        cached_prefixes.add(prefix)
+    return {"prompt_tokens": prompt_tokens, "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+def create_app(stream_repeat: int = 1, chunk_delay: float = 0.01) -> FastAPI:
+    """
+    A mock vLLM replica, with a prefix cache of its own. Streamed answers
+    repeat their content `stream_repeat` times, one chunk every `chunk_delay`
+    seconds; `app.state.generations` counts the streams that ran to their end
+    and those aborted because the client disconnected, as vLLM aborts them.
+    """
+    app = FastAPI()
+    # Message prefixes seen before, like vLLM's automatic prefix caching
+    cached_prefixes = set()
+    app.state.generations = {"started": 0, "completed": 0, "aborted": 0}
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy"}
+
+    @app.get("/v1/models")
+    async def models():
+        return JSONResponse(content={"data": [{"id": "mock-model", "created": 1718505600, "owned_by": "deepseek-ai", "object": "model"}]})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        logger.info("Received chat completion request")
+        body = await request.json()
+        logger.info(f"Request body: {body}")
+
+        stream = body.get("stream", False)
+
+        mock_id = "chatcmpl-mock-123"
+        mock_model = body.get("model", "mock-model")
+        created_time = int(time.time())
+        usage = prompt_usage(body.get("messages", []), cached_prefixes)
+
+        messages_content_parts = ["Hello", "!", " How can I help you today?"]
     
-    if stream:
-        async def generate_stream():
-            for i, content_part in enumerate(messages_content_parts):
-                response_chunk = {
-                    "id": mock_id,
-                    "object": "chat.completion.chunk",
-                    "created": created_time,
-                    "model": mock_model,
-                    "choices": [{
-                        "index": 0,
-                        "delta": {"content": content_part},
-                        "finish_reason": None if i < len(messages_content_parts) - 1 else "stop",
-                        "logprobs": None,
-                    }]
-                }
-                logger.info(f"Sending chunk: {response_chunk}")
-                yield f"data: {json.dumps(response_chunk)}\\n\\n"
-                await asyncio.sleep(0.01) # Simulate processing time, reduced for faster non-stream testing
+        if stream:
+            stream_parts = messages_content_parts * stream_repeat
+
+            async def generate_stream():
+                app.state.generations["started"] += 1
+                try:
+                    for i, content_part in enumerate(stream_parts):
+                        response_chunk = {
+                            "id": mock_id,
+                            "object": "chat.completion.chunk",
+                            "created": created_time,
+                            "model": mock_model,
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"content": content_part},
+                                "finish_reason": None if i < len(stream_parts) - 1 else "stop",
+                                "logprobs": None,
+                            }]
+                        }
+                        logger.info(f"Sending chunk: {response_chunk}")
+                        yield f"data: {json.dumps(response_chunk)}\n\n"
+                        await asyncio.sleep(chunk_delay) # Simulate processing time, reduced for faster non-stream testing
+                except (asyncio.CancelledError, GeneratorExit):
+                    # Starlette cancels the stream when the client disconnects
+                    app.state.generations["aborted"] += 1
+                    raise
+                app.state.generations["completed"] += 1
             
-            yield "data: [DONE]\\n\\n"
-
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream"
-        )
-    elif body.get("tool_choice", "auto") == "auto":
-        full_content = "".join(messages_content_parts)
-        response_full = {
-            "id": mock_id,
-            "object": "chat.completion",
-            "created": created_time,
-            "model": mock_model,
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "reasoning_content": None,
-                    "content": full_content,
-                    "tool_calls": [
-                        {
-                            "id": "tool_call_1",
-                            "type": "function",
-                            "function": {
-                                "name": "use_search",
-                                "arguments": "{\"query\": \"average bitcoin price 2021\", \"number\": 1}"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = {
+                        "id": mock_id,
+                        "object": "chat.completion.chunk",
+                        "created": created_time,
+                        "model": mock_model,
+                        "choices": [],
+                        "usage": {**usage, "completion_tokens": len(stream_parts)},
+                    }
+                    yield f"data: {json.dumps(usage_chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(
+                generate_stream(),
+                media_type="text/event-stream"
+            )
+        elif body.get("tool_choice", "auto") == "auto":
+            full_content = "".join(messages_content_parts)
+            response_full = {
+                "id": mock_id,
+                "object": "chat.completion",
+                "created": created_time,
+                "model": mock_model,
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "reasoning_content": None,
+                        "content": full_content,
+                        "tool_calls": [
+                            {
+                                "id": "tool_call_1",
+                                "type": "function",
+                                "function": {
+                                    "name": "use_search",
+                                    "arguments": "{\"query\": \"average bitcoin price 2021\", \"number\": 1}"
+                                }
                             }
-                        }
-                    ]
+                        ]
+                    },
+                    "logprobs": None,
+                    "finish_reason": "stop",
+                    "stop_reason": None
+                }],
+                "usage": { 
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "completion_tokens": len(full_content.split()), 
+                    "total_tokens": usage["prompt_tokens"] + len(full_content.split()),
+                    "prompt_tokens_details": usage["prompt_tokens_details"]
                 },
-                "logprobs": None,
-                "finish_reason": "stop",
-                "stop_reason": None
-            }],
-            "usage": { 
-                "prompt_tokens": body.get("max_tokens", 0) // 2 if body.get("max_tokens") else 10, 
-                "completion_tokens": len(full_content.split()), 
-                "total_tokens": (body.get("max_tokens", 0) // 2 if body.get("max_tokens") else 10) + len(full_content.split()),
-                "prompt_tokens_details": None
-            },
-            "prompt_logprobs": None
-        }
-        logger.info(f"Sending non-streamed response: {response_full}")
-        return JSONResponse(content=response_full)
-    else:
-        # Non-streaming response
-        full_content = "".join(messages_content_parts)
+                "prompt_logprobs": None
+            }
+            logger.info(f"Sending non-streamed response: {response_full}")
+            return JSONResponse(content=response_full)
+        else:
+            # Non-streaming response
+            full_content = "".join(messages_content_parts)
         
-        response_full = {
-            "id": mock_id,
-            "object": "chat.completion",
-            "created": created_time,
-            "model": mock_model,
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "reasoning_content": None,
-                    "content": full_content,
-                    "tool_calls": []
+            response_full = {
+                "id": mock_id,
+                "object": "chat.completion",
+                "created": created_time,
+                "model": mock_model,
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "reasoning_content": None,
+                        "content": full_content,
+                        "tool_calls": []
+                    },
+                    "logprobs": None,
+                    "finish_reason": "stop",
+                    "stop_reason": None
+                }],
+                "usage": { 
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "completion_tokens": len(full_content.split()), 
+                    "total_tokens": usage["prompt_tokens"] + len(full_content.split()),
+                    "prompt_tokens_details": usage["prompt_tokens_details"]
                 },
-                "logprobs": None,
-                "finish_reason": "stop",
-                "stop_reason": None
-            }],
-            "usage": { 
-                "prompt_tokens": body.get("max_tokens", 0) // 2 if body.get("max_tokens") else 10, 
-                "completion_tokens": len(full_content.split()), 
-                "total_tokens": (body.get("max_tokens", 0) // 2 if body.get("max_tokens") else 10) + len(full_content.split()),
-                "prompt_tokens_details": None
-            },
-            "prompt_logprobs": None
-        }
-        logger.info(f"Sending non-streamed response: {response_full}")
-        return JSONResponse(content=response_full)
-
-@app.get("/metrics")
-async def metrics():
-    logger.info("Received metrics request")
-    return "mock_metrics"
+                "prompt_logprobs": None
+            }
+            logger.info(f"Sending non-streamed response: {response_full}")
+            return JSONResponse(content=response_full)
+
+    @app.get("/metrics")
+    async def metrics():
+        logger.info("Received metrics request")
+        return "mock_metrics"
+
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,66 @@
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+
+from tests.mock.mock_vllm import create_app
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class MockVllmServer:
+    """A mock vLLM replica served over HTTP from a background thread, for tests that need real sockets."""
+
+    def __init__(self, port: int | None = None, **app_options):
+        self.port = port or free_port()
+        self.app = create_app(**app_options)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def chat_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1/chat/completions"
+
+    def start(self) -> "MockVllmServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Mock vLLM server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+async def stream_until(response, disconnect_when, spec_version: str = "2.3") -> bytes:
+    """Sends an ASGI `response` to a client that disconnects once the body so far satisfies `disconnect_when`."""
+    body = b""
+
+    async def receive():
+        while not disconnect_when(body):
+            await asyncio.sleep(0.005)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal body
+        if message["type"] == "http.response.body":
+            body += message.get("body", b"")
+
+    scope = {"type": "http", "path": "/v1/chat/completions", "asgi": {"version": "3.0", "spec_version": spec_version}}
+    await asyncio.wait_for(response(scope, receive, send), timeout=5)
+    return body
+
+async def orphaned_generations(server: MockVllmServer) -> int:
+    """Generations the replica started and is still running, after giving aborts time to arrive."""
+    generations = server.app.state.generations
+    for _ in range(100):
+        if generations["started"] == generations["aborted"] + generations["completed"]:
+            break
+        await asyncio.sleep(0.02)
+    return generations["started"] - generations["aborted"] - generations["completed"]